@@ -1,7 +1,12 @@
 from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.storage import db
+from app.storage.sessions import session_store
+from app.storage.user_names import user_names
 from app.utils.responses import success_response, success_payload, raise_http_error
-from app.utils.security import valid_email, valid_password, hash_pw
+from app.utils.security import valid_email, valid_password, needs_rehash
+from app.utils.password_hasher import password_hasher
 
 COOKIE_KW = dict(
     key="sessionId",
@@ -11,7 +16,7 @@ COOKIE_KW = dict(
     path="/",
 )
 
-def signup(payload: dict):
+async def signup(session: AsyncSession, payload: dict):
     email = payload.get("email")
     password = payload.get("password")
     password_confirm = payload.get("passwordConfirm")
@@ -34,21 +39,32 @@ def signup(payload: dict):
     if len(nickname) > 10:
         raise_http_error(400, "INVALID_NICKNAME")
 
-    if db.get_user_by_email(email):
+    # Checked against the database: the Bloom filters behind the availability
+    # endpoints may lag a signup on another pod
+    if await db.get_user_by_email(session, email):
         raise_http_error(409, "EMAIL_ALREADY_EXISTS")
-    if db.get_user_by_nickname(nickname):
+    if await db.get_user_by_nickname(session, nickname):
         raise_http_error(409, "NICKNAME_ALREADY_EXISTS")
 
     if profile_url and profile_url.startswith("data:"):
-        fid = db.save_file(profile_url)
+        fid = await db.save_file(session, profile_url)
         if fid:
             profile_url = f"/public/files/{fid}"
 
-    db.create_user(email, hash_pw(password), nickname, profile_url)
+    pw_hash = await password_hasher.hash(password)
+    try:
+        await db.create_user(session, email, pw_hash, nickname, profile_url)
+        await session.commit()
+    except IntegrityError:
+        # A concurrent signup took the email or nickname after the checks above
+        await session.rollback()
+        if await db.get_user_by_email(session, email):
+            raise_http_error(409, "EMAIL_ALREADY_EXISTS")
+        raise_http_error(409, "NICKNAME_ALREADY_EXISTS")
 
     return success_response("SIGNUP_SUCCESS", None, http_status=201)
 
-def login(payload: dict):
+async def login(session: AsyncSession, payload: dict):
     email = payload.get("email")
     password = payload.get("password")
     if not email:
@@ -56,13 +72,17 @@ def login(payload: dict):
     if not password:
         raise_http_error(400, "PASSWORD_REQUIRED")
 
-    u = db.get_user_by_email(email)
+    u = await db.get_user_by_email(session, email)
     if not u:
         raise_http_error(404, "USER_NOT_FOUND")
-    if u["passwordHash"] != hash_pw(password):
+    if not await password_hasher.verify(password, u["passwordHash"]):
         raise_http_error(401, "PASSWORD_INCORRECT")
+    # Legacy SHA-256 or outdated scrypt parameters: upgrade while we have the password
+    if needs_rehash(u["passwordHash"]):
+        await db.update_user_password(session, u["userId"], await password_hasher.hash(password))
 
-    sid = db.create_session(u["userId"])
+    sid = await session_store.create(session, u["userId"])
+    await session.commit()
 
     res = JSONResponse(content=success_payload("LOGIN_SUCCESS", {
         "user": {
@@ -75,15 +95,25 @@ def login(payload: dict):
     res.set_cookie(value=sid, **COOKIE_KW)
     return res
 
-def logout(u_and_sid):
+async def logout(session: AsyncSession, u_and_sid):
     _, sid = u_and_sid
-    db.delete_session(sid)
+    await session_store.delete(session, sid)
+    await session.commit()
 
     res = JSONResponse(content=success_payload("LOGOUT_SUCCESS", None))
     res.delete_cookie("sessionId", path="/")
     return res
 
-def me(u):
+async def logout_all(session: AsyncSession, u):
+    # Ends every session of the user, on every device
+    await session_store.delete_user(session, u["userId"])
+    await session.commit()
+
+    res = JSONResponse(content=success_payload("LOGOUT_ALL_SUCCESS", None))
+    res.delete_cookie("sessionId", path="/")
+    return res
+
+async def me(u):
     return success_response("USER_RETRIEVED", {
         "userId": u["userId"],
         "email": u["email"],
@@ -91,9 +121,9 @@ def me(u):
         "profileImageUrl": u.get("profileImageUrl"),
     })
 
-def email_availability(email: str):
-    return success_response("EMAIL_AVAILABLE", {"available": db.get_user_by_email(email) is None})
+async def email_availability(session: AsyncSession, email: str):
+    return success_response("EMAIL_AVAILABLE", {"available": await user_names.find_by_email(session, email) is None})
 
-def nickname_availability(nickname: str):
-    return success_response("NICKNAME_AVAILABLE", {"available": db.get_user_by_nickname(nickname) is None})
+async def nickname_availability(session: AsyncSession, nickname: str):
+    return success_response("NICKNAME_AVAILABLE", {"available": await user_names.find_by_nickname(session, nickname) is None})
 
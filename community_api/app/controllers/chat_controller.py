@@ -1,83 +1,545 @@
+import os
 import json
+import time
 import asyncio
+from collections import deque
 from fastapi import WebSocket
-from typing import Dict, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Deque, Dict, Iterable, List, Optional, Set
+from app.schemas.chat import GroupCreateRequest, ParticipantsAddRequest, ParticipationUpdateRequest
 from app.storage import db
+from app.storage.message_writer import message_writer
 from app.utils.responses import success_response, raise_http_error
+from app.utils.cursor import decode_cursor
 from app.utils.redis_client import get_redis
 
-# Redis channel prefix: chat:<conversation_id>
-CHANNEL_PREFIX = "chat:"
+# Redis channel prefixes: chat:user:<user_id> for direct conversations and
+# per-user events, chat:conv:<conversation_id> for group rooms
+CHANNEL_PREFIX = "chat:user:"
+CONVERSATION_CHANNEL_PREFIX = "chat:conv:"
+
+# Subscription changes are flushed to Redis at most this often (seconds),
+# so a burst of connects/disconnects becomes one SUBSCRIBE/UNSUBSCRIBE
+SUBSCRIPTION_BATCH_INTERVAL = 0.05
+# Backoff between attempts to re-subscribe after the Pub/Sub connection drops
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+# Outbound queue per WebSocket and what to do when a slow client fills it:
+#   drop_oldest → discard the oldest queued message
+#   coalesce    → replace the backlog with one "resync" notice (client refetches over REST)
+#   close       → close the socket with WS_SLOW_CONSUMER_CLOSE_CODE
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")
+WS_SLOW_CONSUMER_CLOSE_CODE = int(os.getenv("WS_SLOW_CONSUMER_CLOSE_CODE", "1013"))
+
+# Delivery mode: "pubsub" (fire-and-forget) or "streams", which also appends
+# every event to a bounded per-user Redis Stream so a reconnecting client can
+# replay the gap after its last seen stream id
+CHAT_DELIVERY_MODE = os.getenv("CHAT_DELIVERY_MODE", "pubsub")
+STREAM_PREFIX = "chat:stream:"
+CHAT_STREAM_MAXLEN = int(os.getenv("CHAT_STREAM_MAXLEN", "1000"))
+CHAT_STREAM_MAX_AGE = int(os.getenv("CHAT_STREAM_MAX_AGE", "86400"))  # seconds
+# A replay is queued this many entries at a time, waiting for the socket to
+# drain in between, so a gap longer than WS_SEND_QUEUE_SIZE is never dropped
+# by the overflow policy; a client that does not drain in time gets "resync"
+CHAT_REPLAY_CHUNK_SIZE = int(os.getenv("CHAT_REPLAY_CHUNK_SIZE", "100"))
+CHAT_REPLAY_DRAIN_TIMEOUT = float(os.getenv("CHAT_REPLAY_DRAIN_TIMEOUT", "10"))  # seconds
+
+# Group rooms
+GROUP_MAX_MEMBERS = int(os.getenv("GROUP_MAX_MEMBERS", "500"))
+GROUP_TITLE_MAX_LENGTH = 100
+
+
+def stream_id_key(stream_id: str) -> tuple:
+    """Redis Stream ids ("<ms>-<seq>") compared numerically."""
+    ms, _, seq = stream_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class ClientConnection:
+    """
+    One WebSocket on THIS pod with its own bounded outbound queue.
+    A dedicated writer task drains the queue, so a slow client only
+    ever stalls itself.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.manager = manager
+        self.queue: Deque[dict] = deque()
+        self._ready = asyncio.Event()
+        # Set while the queue is empty and the writer has sent everything
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._writer: Optional[asyncio.Task] = None
+        self.closed = False
+        # Newest stream id already sent (streams mode), to drop replay/live overlap
+        self.last_stream_id: Optional[str] = None
+        # Live stream events parked while a replay is in progress
+        self._held: Optional[List[dict]] = None
+        # Conversations this connection has already been verified for
+        self.allowed: Set[int] = set()
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, message: dict):
+        """Queue a message without waiting on the network."""
+        if self.closed:
+            return
+        if message.get("stream_id") and self._held is not None:
+            self._held.append(message)
+            return
+        self.deliver(message)
+
+    def deliver(self, message: dict):
+        """Queue past any hold (replay uses this); stream ids already sent are dropped."""
+        if self.closed:
+            return
+        stream_id = message.get("stream_id")
+        if stream_id:
+            if self.last_stream_id and stream_id_key(stream_id) <= stream_id_key(self.last_stream_id):
+                return
+            self.last_stream_id = stream_id
+        if len(self.queue) >= WS_SEND_QUEUE_SIZE:
+            if WS_OVERFLOW_POLICY == "close":
+                self.manager.stats["evicted"] += 1
+                self.stop()
+                asyncio.create_task(self.close(WS_SLOW_CONSUMER_CLOSE_CODE))
+                return
+            if WS_OVERFLOW_POLICY == "coalesce":
+                self.manager.stats["coalesced"] += len(self.queue)
+                self.queue.clear()
+                self.queue.append({"type": "resync"})
+            else:
+                self.manager.stats["dropped"] += 1
+                self.queue.popleft()
+        self.queue.append(message)
+        self._drained.clear()
+        self._ready.set()
+
+    def hold(self):
+        """Park live stream events until release(), so a replay is sent first."""
+        self._held = []
+
+    def release(self):
+        held, self._held = self._held or [], None
+        for message in held:
+            self.send(message)
+
+    async def wait_drained(self, timeout: float) -> bool:
+        """Wait until everything queued has been written; False on timeout or close."""
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return not self.closed
+
+    async def _write_loop(self):
+        try:
+            while True:
+                if not self.queue:
+                    self._ready.clear()
+                    self._drained.set()
+                    await self._ready.wait()
+                    continue
+                await self.websocket.send_json(self.queue.popleft())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket is gone; the receive side will notice as well
+            self.closed = True
+            self.manager.disconnect(self.websocket, self.user_id)
+
+    async def close(self, code: int):
+        self.stop()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+        self.manager.disconnect(self.websocket, self.user_id)
+
+    def stop(self):
+        self.closed = True
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
 
 
 class ConnectionManager:
     """
     Manages in-process WebSocket connections on THIS pod.
     Pub/Sub via Redis ensures messages are delivered even when
-    sender and receiver are on different pods.
+    sender and receiver are on different pods. Each pod only subscribes
+    to the per-user channels of users connected to it, plus the channels
+    of group rooms that have a member connected to it.
     """
 
     def __init__(self):
         # Maps user_id → list of WebSocket connections on THIS pod
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        if user_id not in self.active_connections:
+        self.active_connections: Dict[int, List[ClientConnection]] = {}
+        # Routing index: conversation_id → participant user_ids, kept only for
+        # direct conversations that have at least one participant connected on THIS pod
+        self.conversation_members: Dict[int, Set[int]] = {}
+        # Reverse index: local user_id → conversation_ids they take part in
+        self.user_conversations: Dict[int, Set[int]] = {}
+        # Group rooms: conversation_id → members connected on THIS pod, and back
+        self.group_members: Dict[int, Set[int]] = {}
+        self.user_groups: Dict[int, Set[int]] = {}
+        # Reference counts of Redis channels wanted by local sockets
+        self._channel_refs: Dict[str, int] = {}
+        # Channels currently subscribed on Redis / awaiting the next batch
+        self._subscribed: Set[str] = set()
+        self._dirty_channels: Set[str] = set()
+        self._subscriptions_changed = asyncio.Event()
+        # Futures resolved once a channel's SUBSCRIBE has been sent
+        self._subscribe_waiters: Dict[str, List[asyncio.Future]] = {}
+        # Pub/Sub messages received by THIS pod (compare across pod counts)
+        self.messages_received = 0
+        self.reconnects = 0
+        self._reconnect_delay = RECONNECT_MIN_DELAY
+        # Slow-consumer counters (see WS_OVERFLOW_POLICY)
+        self.stats = {"dropped": 0, "coalesced": 0, "evicted": 0}
+
+    async def connect(self, websocket: WebSocket, user_id: int) -> ClientConnection:
+        conn = ClientConnection(websocket, user_id, self)
+        conn.start()
+        first = user_id not in self.active_connections
+        if first:
             self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+        self.active_connections[user_id].append(conn)
+        self._retain(f"{CHANNEL_PREFIX}{user_id}")
+        async with db.get_db_session() as session:
+            # Refresh this user's routes from the Conversation.user1_id/user2_id pairs
+            for conversation_id, members in (await db.get_user_conversation_members(session, user_id)).items():
+                self.register_conversation(conversation_id, members)
+            if first:
+                for conversation_id in await db.get_user_group_ids(session, user_id):
+                    self.join_group(conversation_id, user_id)
+        return conn
 
     def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            try:
-                self.active_connections[user_id].remove(websocket)
-            except ValueError:
-                pass
+        conns = self.active_connections.get(user_id)
+        conn = next((c for c in conns or () if c.websocket is websocket), None)
+        if conn is not None:
+            conns.remove(conn)
+            conn.stop()
+            self._release(f"{CHANNEL_PREFIX}{user_id}")
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
+                self._forget_user(user_id)
+
+    def register_conversation(self, conversation_id: int, members: Iterable[int]):
+        """Add a conversation to the routing index if any participant is local."""
+        members = set(members)
+        local = [m for m in members if m in self.active_connections]
+        if not local:
+            return
+        self.conversation_members[conversation_id] = members
+        for user_id in local:
+            self.user_conversations.setdefault(user_id, set()).add(conversation_id)
+
+    def join_group(self, conversation_id: int, user_id: int):
+        """Route a group room to a local member; the pod subscribes while any member is here."""
+        members = self.group_members.setdefault(conversation_id, set())
+        if user_id in members:
+            return
+        members.add(user_id)
+        self.user_groups.setdefault(user_id, set()).add(conversation_id)
+        self._retain(f"{CONVERSATION_CHANNEL_PREFIX}{conversation_id}")
+
+    def leave_group(self, conversation_id: int, user_id: int):
+        members = self.group_members.get(conversation_id)
+        if not members or user_id not in members:
+            return
+        members.discard(user_id)
+        if not members:
+            del self.group_members[conversation_id]
+        self.user_groups.get(user_id, set()).discard(conversation_id)
+        for conn in self.active_connections.get(user_id, ()):
+            conn.allowed.discard(conversation_id)
+        self._release(f"{CONVERSATION_CHANNEL_PREFIX}{conversation_id}")
+
+    async def is_member(self, session: AsyncSession, conversation_id: int, user_id: int) -> bool:
+        """Membership check: routing index first, then one indexed point query."""
+        members = self.conversation_members.get(conversation_id)
+        if members is not None:
+            return user_id in members
+        if user_id in self.group_members.get(conversation_id, ()):
+            return True
+        return await db.is_conversation_member(session, conversation_id, user_id)
+
+    async def _route(self, conversation_id: int):
+        """(is_group, direct members) from the routing index, else from the database."""
+        if conversation_id in self.group_members:
+            return True, None
+        members = self.conversation_members.get(conversation_id)
+        if members is not None:
+            return False, members
+        async with db.get_db_session() as session:
+            if await db.is_group_conversation(session, conversation_id):
+                return True, None
+            return False, await db.get_conversation_members(session, conversation_id)
+
+    def _forget_user(self, user_id: int):
+        """Drop routes that no longer have a local participant."""
+        for conversation_id in self.user_conversations.pop(user_id, set()):
+            members = self.conversation_members.get(conversation_id, set())
+            if not any(m in self.active_connections for m in members):
+                self.conversation_members.pop(conversation_id, None)
+        for conversation_id in list(self.user_groups.pop(user_id, set())):
+            self.leave_group(conversation_id, user_id)
+
+    # ── Redis subscriptions (reference-counted, batched) ──
+
+    def _retain(self, channel: str):
+        count = self._channel_refs.get(channel, 0)
+        self._channel_refs[channel] = count + 1
+        if count == 0:
+            self._mark_dirty(channel)
+
+    def _release(self, channel: str):
+        count = self._channel_refs.get(channel, 0) - 1
+        if count > 0:
+            self._channel_refs[channel] = count
+            return
+        self._channel_refs.pop(channel, None)
+        self._mark_dirty(channel)
+
+    async def wait_subscribed(self, channel: str):
+        if channel in self._subscribed:
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._subscribe_waiters.setdefault(channel, []).append(fut)
+        await fut
+
+    def _mark_dirty(self, channel: str):
+        self._dirty_channels.add(channel)
+        self._subscriptions_changed.set()
+
+    async def _apply_subscription_changes(self, pubsub):
+        """Send every pending change as one SUBSCRIBE and one UNSUBSCRIBE."""
+        dirty, self._dirty_channels = self._dirty_channels, set()
+        self._subscriptions_changed.clear()
+
+        # A channel retained and released within one batch cancels out
+        wanted = [c for c in dirty if c in self._channel_refs and c not in self._subscribed]
+        unwanted = [c for c in dirty if c not in self._channel_refs and c in self._subscribed]
+        if wanted:
+            await pubsub.subscribe(*wanted)
+            self._subscribed.update(wanted)
+            for channel in wanted:
+                for fut in self._subscribe_waiters.pop(channel, []):
+                    if not fut.done():
+                        fut.set_result(None)
+        if unwanted:
+            await pubsub.unsubscribe(*unwanted)
+            self._subscribed.difference_update(unwanted)
+
+    # ── Publishing / delivery ──
+
+    async def publish_to_users(self, user_ids: Iterable[int], message: dict, durable: bool = True):
+        """Publish message to the per-user channels so only pods holding them receive it."""
+        redis = get_redis()
+        user_ids = list(set(user_ids))
+        if durable and CHAT_DELIVERY_MODE == "streams":
+            await self._publish_durable(redis, user_ids, message)
+            return
+        data = json.dumps(message)
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.publish(f"{CHANNEL_PREFIX}{user_id}", data)
+            await pipe.execute()
+
+    async def _publish_durable(self, redis, user_ids: List[int], message: dict):
+        """XADD to each user's stream (trimmed by length and age), then PUBLISH with the stream id."""
+        data = json.dumps(message)
+        min_id = f"{int((time.time() - CHAT_STREAM_MAX_AGE) * 1000)}-0"
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                stream = f"{STREAM_PREFIX}{user_id}"
+                pipe.xadd(stream, {"data": data}, maxlen=CHAT_STREAM_MAXLEN, approximate=True)
+                pipe.xtrim(stream, minid=min_id, approximate=True)
+            results = await pipe.execute()
+
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id, stream_id in zip(user_ids, results[::2]):
+                pipe.publish(f"{CHANNEL_PREFIX}{user_id}", json.dumps({**message, "stream_id": stream_id}))
+            await pipe.execute()
+
+    async def replay(self, conn: ClientConnection, last_stream_id: str):
+        """
+        Send everything in the user's stream after last_stream_id (streams mode),
+        CHAT_REPLAY_CHUNK_SIZE entries at a time, letting the socket drain
+        between chunks so the bounded queue never overflows mid-gap.
+        """
+        redis = get_redis()
+        stream = f"{STREAM_PREFIX}{conn.user_id}"
+        # Make sure live delivery is on before reading the gap; overlap is dropped by stream id
+        try:
+            await asyncio.wait_for(self.wait_subscribed(f"{CHANNEL_PREFIX}{conn.user_id}"), timeout=5)
+        except asyncio.TimeoutError:
+            pass
+
+        oldest = await redis.xrange(stream, "-", "+", count=1)
+        if oldest and stream_id_key(oldest[0][0]) > stream_id_key(last_stream_id):
+            # Part of the gap may already be trimmed: ask the client to refetch over REST
+            conn.deliver({"type": "resync"})
+
+        chunk_size = max(1, min(CHAT_REPLAY_CHUNK_SIZE, WS_SEND_QUEUE_SIZE))
+        after = last_stream_id
+        while True:
+            entries = await redis.xrange(stream, f"({after}", "+", count=chunk_size)
+            for stream_id, fields in entries:
+                conn.deliver({**json.loads(fields["data"]), "stream_id": stream_id})
+            if len(entries) < chunk_size:
+                return
+            after = entries[-1][0]
+            if not await conn.wait_drained(CHAT_REPLAY_DRAIN_TIMEOUT):
+                # Too slow to take the rest of the gap: refetch over REST instead
+                conn.deliver({"type": "resync"})
+                return
+
+    async def publish_to_conversation(self, conversation_id: int, message: dict):
+        """Group rooms: one PUBLISH; each pod fans out to its own connected members."""
+        redis = get_redis()
+        await redis.publish(f"{CONVERSATION_CHANNEL_PREFIX}{conversation_id}", json.dumps(message))
 
     async def publish_message(self, conversation_id: int, message: dict):
-        """Publish message to Redis so ALL pods receive it."""
-        redis = get_redis()
-        channel = f"{CHANNEL_PREFIX}{conversation_id}"
-        await redis.publish(channel, json.dumps(message))
-
-    async def deliver_to_local(self, user_id: int, message: dict):
-        """Send to WebSocket connections on THIS pod only."""
-        if user_id in self.active_connections:
-            dead = []
-            for ws in self.active_connections[user_id]:
-                try:
-                    await ws.send_json(message)
-                except Exception:
-                    dead.append(ws)
-            for ws in dead:
-                self.disconnect(ws, user_id)
+        """Publish message to every participant of the conversation."""
+        is_group, members = await self._route(conversation_id)
+        if is_group:
+            await self.publish_to_conversation(conversation_id, message)
+            return
+        await self.publish_to_users(members, message)
+
+    async def announce_conversation(self, conversation_id: int, members: List[int]):
+        """Tell the participants' pods about a new conversation so they refresh their routes."""
+        self.register_conversation(conversation_id, members)
+        await self.publish_to_users(members, {
+            "type": "conversation",
+            "conversation_id": conversation_id,
+            "members": members,
+        }, durable=False)
+
+    async def publish_read_receipt(self, conversation_id: int, user_id: int, last_read_id: int):
+        """Push the new read watermark to both participants' clients."""
+        receipt = {
+            "type": "read",
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "last_read_id": last_read_id,
+        }
+        is_group, members = await self._route(conversation_id)
+        # Group rooms only sync the reader's own devices
+        await self.publish_to_users([user_id] if is_group else members, receipt)
+
+    async def announce_membership(self, conversation_id: int, user_ids: List[int], joined: bool):
+        """Tell the affected users' pods (and clients) that they joined or left a group room."""
+        if joined:
+            for user_id in user_ids:
+                if user_id in self.active_connections:
+                    self.join_group(conversation_id, user_id)
+        await self.publish_to_users(user_ids, {
+            "type": "membership",
+            "conversation_id": conversation_id,
+            "joined": joined,
+        }, durable=False)
+
+    def deliver_to_local(self, user_id: int, message: dict):
+        """Queue for WebSocket connections on THIS pod only."""
+        for conn in self.active_connections.get(user_id, ()):
+            conn.send(message)
+
+    def metrics(self) -> dict:
+        depths = [len(c.queue) for conns in self.active_connections.values() for c in conns]
+        return {
+            "connections": len(depths),
+            "queuedMessages": sum(depths),
+            "maxQueueDepth": max(depths, default=0),
+            "messagesReceived": self.messages_received,
+            "reconnects": self.reconnects,
+            **self.stats,
+        }
+
+    async def _handle_pubsub_message(self, raw: dict):
+        self.messages_received += 1
+        channel = raw["channel"]
+        msg = json.loads(raw["data"])
+
+        if channel.startswith(CONVERSATION_CHANNEL_PREFIX):
+            conversation_id = int(channel[len(CONVERSATION_CHANNEL_PREFIX):])
+            for user_id in list(self.group_members.get(conversation_id, ())):
+                self.deliver_to_local(user_id, msg)
+            return
+
+        user_id = int(channel[len(CHANNEL_PREFIX):])
+        if msg.get("type") == "conversation":
+            self.register_conversation(msg["conversation_id"], msg.get("members", []))
+            return
+        if msg.get("type") == "membership" and user_id in self.active_connections:
+            if msg.get("joined"):
+                self.join_group(msg["conversation_id"], user_id)
+            else:
+                self.leave_group(msg["conversation_id"], user_id)
+
+        self.deliver_to_local(user_id, msg)
 
     async def subscribe_loop(self):
         """
-        Background task: subscribe to all chat channels on Redis.
-        When a message arrives, deliver it to local WebSocket connections.
-        This runs once per pod on startup.
+        Background task: keep this pod subscribed to the channels of its
+        connected users and deliver what arrives to their local sockets.
+        This runs once per pod on startup. If Redis drops the connection,
+        every channel still wanted is re-subscribed with exponential backoff;
+        what was published meanwhile is lost here (in streams mode clients
+        replay it on reconnect).
         """
-        redis = get_redis()
-        pubsub = redis.pubsub()
-        # Subscribe to pattern chat:* to capture all conversation channels
-        await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
-
-        async for raw in pubsub.listen():
-            if raw["type"] != "pmessage":
-                continue
+        self._subscriptions_changed = asyncio.Event()
+        while True:
             try:
-                msg = json.loads(raw["data"])
-                conversation_id = msg.get("conversation_id")
-                if conversation_id is None:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.reconnects += 1
+                await asyncio.sleep(self._reconnect_delay)
+                self._reconnect_delay = min(self._reconnect_delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _listen(self):
+        pubsub = get_redis().pubsub()
+        loop = asyncio.get_running_loop()
+        next_flush = 0.0
+        # A new connection has no subscriptions: start over from what local sockets want
+        self._subscribed = set()
+        self._dirty_channels = set(self._channel_refs)
+        if self._dirty_channels:
+            self._subscriptions_changed.set()
+
+        try:
+            while True:
+                if self._dirty_channels and loop.time() >= next_flush:
+                    await self._apply_subscription_changes(pubsub)
+                    next_flush = loop.time() + SUBSCRIPTION_BATCH_INTERVAL
+                    self._reconnect_delay = RECONNECT_MIN_DELAY
+
+                if not self._subscribed:
+                    # Idle pod: wait for a socket, then let a burst of connects pile up
+                    await self._subscriptions_changed.wait()
+                    await asyncio.sleep(SUBSCRIPTION_BATCH_INTERVAL)
                     continue
 
-                # Deliver to every user_id connected on THIS pod
-                for user_id in list(self.active_connections.keys()):
-                    await self.deliver_to_local(user_id, msg)
-            except Exception:
-                pass
+                raw = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=SUBSCRIPTION_BATCH_INTERVAL
+                )
+                if raw is None or raw["type"] != "message":
+                    continue
+                try:
+                    await self._handle_pubsub_message(raw)
+                except Exception:
+                    pass
+        finally:
+            await pubsub.aclose()
 
 
 manager = ConnectionManager()
@@ -87,23 +549,49 @@ manager = ConnectionManager()
 # REST handlers
 # ──────────────────────────────────────────
 
-def get_my_conversations(u: dict):
+async def get_my_conversations(session: AsyncSession, u: dict, limit: Optional[int] = None, cursor: Optional[str] = None):
     user_id = u["userId"]
-    conversations = db.get_conversations(user_id)
+    before = None
+    if cursor:
+        before = decode_cursor(cursor)
+        if not before:
+            raise_http_error(400, "INVALID_CURSOR")
+    conversations = await db.get_conversations(session, user_id, limit=limit, before=before)
     return success_response("CONVERSATIONS_RETRIEVED", conversations)
 
 
-def get_conversation_messages(u: dict, conversation_id: int):
-    convs = db.get_conversations(u["userId"])
-    if not any(c["id"] == conversation_id for c in convs):
+async def _mark_read(session: AsyncSession, conversation_id: int, user_id: int, up_to_id: Optional[int] = None):
+    last_read_id = await db.mark_messages_read(session, conversation_id, user_id, up_to_id)
+    await session.commit()
+    if last_read_id:
+        await manager.publish_read_receipt(conversation_id, user_id, last_read_id)
+
+
+async def get_conversation_messages(session: AsyncSession, u: dict, conversation_id: int, limit: int = 50,
+                                    before_id: Optional[int] = None, after_id: Optional[int] = None):
+    if before_id is not None and after_id is not None:
+        raise_http_error(400, "BAD_REQUEST")
+    if not await manager.is_member(session, conversation_id, u["userId"]):
         raise_http_error(403, "FORBIDDEN")
 
-    db.mark_messages_read(conversation_id, u["userId"])
-    messages = db.get_messages(conversation_id)
+    if after_id is not None:
+        # Catching up returns the oldest page past the cursor: only what this
+        # page delivers is read, not everything up to the newest message
+        messages = await db.get_messages(session, conversation_id, limit, after_id=after_id)
+        if messages:
+            await _mark_read(session, conversation_id, u["userId"], messages[-1]["id"])
+            # is_read was computed before the watermark moved: re-read the page
+            messages = await db.get_messages(session, conversation_id, limit, after_id=after_id)
+        return success_response("MESSAGES_RETRIEVED", messages)
+
+    # Scrolling back through history does not move the read watermark
+    if before_id is None:
+        await _mark_read(session, conversation_id, u["userId"])
+    messages = await db.get_messages(session, conversation_id, limit, before_id=before_id)
     return success_response("MESSAGES_RETRIEVED", messages)
 
 
-def create_or_get_conversation(u: dict, payload: dict):
+async def create_or_get_conversation(session: AsyncSession, u: dict, payload: dict):
     target_user_id = payload.get("other_user_id")
     if not target_user_id:
         raise_http_error(400, "OTHER_USER_ID_REQUIRED")
@@ -111,39 +599,151 @@ def create_or_get_conversation(u: dict, payload: dict):
     if target_user_id == u["userId"]:
         raise_http_error(400, "CANNOT_CHAT_WITH_SELF")
 
-    target_user = db.get_user(target_user_id)
+    target_user = await db.get_user(session, target_user_id)
     if not target_user:
         raise_http_error(404, "USER_NOT_FOUND")
 
-    conv_id = db.get_or_create_conversation(u["userId"], target_user_id)
+    conv_id = await db.get_or_create_conversation(session, u["userId"], target_user_id)
+    await session.commit()
+    await manager.announce_conversation(conv_id, [u["userId"], target_user_id])
     return success_response("CONVERSATION_CREATED", {"conversation_id": conv_id})
 
 
+async def _require_group(session: AsyncSession, conversation_id: int):
+    if not await db.is_group_conversation(session, conversation_id):
+        raise_http_error(400, "NOT_A_GROUP")
+
+
+async def create_group(session: AsyncSession, u: dict, payload: GroupCreateRequest):
+    title = payload.title.strip()
+    if not title:
+        raise_http_error(400, "TITLE_REQUIRED")
+    if len(title) > GROUP_TITLE_MAX_LENGTH:
+        raise_http_error(400, "GROUP_TITLE_TOO_LONG")
+
+    member_ids = [i for i in dict.fromkeys(payload.member_ids) if i != u["userId"]]
+    if len(member_ids) + 1 > GROUP_MAX_MEMBERS:
+        raise_http_error(400, "GROUP_TOO_LARGE")
+    if len(await db.get_active_user_ids(session, member_ids)) != len(member_ids):
+        raise_http_error(404, "USER_NOT_FOUND")
+
+    conv_id = await db.create_group_conversation(session, u["userId"], title, member_ids)
+    await session.commit()
+    await manager.announce_membership(conv_id, [u["userId"], *member_ids], True)
+    return success_response("CONVERSATION_CREATED", {"conversation_id": conv_id}, 201)
+
+
+async def add_group_participants(session: AsyncSession, u: dict, conversation_id: int, payload: ParticipantsAddRequest):
+    await _require_group(session, conversation_id)
+    me = await db.get_participant(session, conversation_id, u["userId"])
+    if not me or me["role"] != "owner":
+        raise_http_error(403, "FORBIDDEN")
+
+    member_ids = list(dict.fromkeys(payload.member_ids))
+    if not member_ids:
+        raise_http_error(400, "MEMBER_IDS_REQUIRED")
+    if len(await db.get_active_user_ids(session, member_ids)) != len(member_ids):
+        raise_http_error(404, "USER_NOT_FOUND")
+    if await db.count_participants(session, conversation_id) + len(member_ids) > GROUP_MAX_MEMBERS:
+        raise_http_error(400, "GROUP_TOO_LARGE")
+
+    added = await db.add_participants(session, conversation_id, member_ids)
+    await session.commit()
+    if added:
+        await manager.announce_membership(conversation_id, added, True)
+    return success_response("PARTICIPANTS_ADDED", {"added": added})
+
+
+async def remove_group_participant(session: AsyncSession, u: dict, conversation_id: int, user_id: int):
+    await _require_group(session, conversation_id)
+    if user_id != u["userId"]:
+        me = await db.get_participant(session, conversation_id, u["userId"])
+        if not me or me["role"] != "owner":
+            raise_http_error(403, "FORBIDDEN")
+
+    if not await db.remove_participant(session, conversation_id, user_id):
+        raise_http_error(404, "NOT_FOUND")
+    await session.commit()
+    await manager.announce_membership(conversation_id, [user_id], False)
+    return success_response("PARTICIPANT_REMOVED", None)
+
+
+async def update_my_participation(session: AsyncSession, u: dict, conversation_id: int, payload: ParticipationUpdateRequest):
+    await _require_group(session, conversation_id)
+    if not await db.get_participant(session, conversation_id, u["userId"]):
+        raise_http_error(403, "FORBIDDEN")
+
+    await db.set_participant_muted(session, conversation_id, u["userId"], payload.muted)
+    await session.commit()
+    return success_response("PARTICIPATION_UPDATED", {"muted": payload.muted})
+
+
 # ──────────────────────────────────────────
 # WebSocket handler
 # ──────────────────────────────────────────
 
-async def handle_chat_websocket(websocket: WebSocket, user_id: int):
-    await manager.connect(websocket, user_id)
+async def handle_chat_websocket(websocket: WebSocket, user_id: int, last_stream_id: Optional[str] = None):
+    conn = await manager.connect(websocket, user_id)
     try:
+        if last_stream_id and CHAT_DELIVERY_MODE == "streams":
+            conn.hold()
+            try:
+                stream_id_key(last_stream_id)
+            except ValueError:
+                conn.send({"type": "resync"})
+            else:
+                await manager.replay(conn, last_stream_id)
+            finally:
+                conn.release()
+
         while True:
             data = await websocket.receive_json()
             conversation_id = data.get("conversation_id")
             content = data.get("content")
+            is_read_frame = data.get("type") == "read"
 
-            if not conversation_id or not content:
+            if not conversation_id or not (content or is_read_frame):
+                continue
+            # Bad types would otherwise fail inside a shared group-commit batch
+            if type(conversation_id) is not int or conversation_id <= 0:
+                conn.send({"error": "Invalid conversation_id"})
+                continue
+            if not is_read_frame and not isinstance(content, str):
+                conn.send({"error": "Invalid content"})
                 continue
 
             # Verify user is part of this conversation
-            convs = db.get_conversations(user_id)
-            conv = next((c for c in convs if c["id"] == conversation_id), None)
-
-            if not conv:
-                await websocket.send_json({"error": "Forbidden"})
+            if conversation_id not in conn.allowed:
+                async with db.get_db_session() as session:
+                    if not await manager.is_member(session, conversation_id, user_id):
+                        conn.send({"error": "Forbidden"})
+                        continue
+                conn.allowed.add(conversation_id)
+
+            if is_read_frame:
+                # {"type": "read", "conversation_id": .., "last_read_id": ..}
+                up_to_id = data.get("last_read_id")
+                if up_to_id is not None and (type(up_to_id) is not int or up_to_id <= 0):
+                    conn.send({"error": "Invalid last_read_id"})
+                    continue
+                async with db.get_db_session() as session:
+                    last_read_id = await db.mark_messages_read(session, conversation_id, user_id, up_to_id)
+                    await session.commit()
+                if last_read_id:
+                    await manager.publish_read_receipt(conversation_id, user_id, last_read_id)
                 continue
 
-            # Save message to DB
-            msg = db.create_message(conversation_id, user_id, content)
+            # Save message to DB (group commit; returns once the batch is durable)
+            try:
+                msg = await message_writer.submit(conversation_id, user_id, content)
+            except Exception:
+                conn.send({"error": "Message not saved"})
+                continue
+            if not msg:
+                conn.send({"error": "Forbidden"})
+                continue
+            if data.get("client_msg_id") is not None:
+                conn.send({"type": "ack", "client_msg_id": data["client_msg_id"], "id": msg["id"]})
 
             # Publish to Redis → all pods (including this one) will deliver it
             await manager.publish_message(conversation_id, msg)
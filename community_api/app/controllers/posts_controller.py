@@ -1,20 +1,87 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.storage import db
+from app.storage.view_counter import view_counter
 from app.utils.responses import success_response, raise_http_error
-
-
-def list_posts(offset: int, limit: int):
-    items = db.list_posts(offset, limit)
-    return success_response("POSTS_RETRIEVED", {"items": items})
-
-
-def get_post(post_id: int):
-    p = db.get_post(post_id, increase_hits=True)
+from app.utils.cursor import encode_cursor, decode_cursor
+
+
+async def _add_liked_by_me(session: AsyncSession, u, items: list):
+    # Anonymous viewers get no likedByMe and cost no query
+    if not u:
+        return
+    liked = await db.liked_post_ids(session, u["userId"], [p["postId"] for p in items])
+    for p in items:
+        p["likedByMe"] = p["postId"] in liked
+
+
+async def _add_authors(session: AsyncSession, items: list):
+    authors = await db.get_user_summaries(session, list({i["authorUserId"] for i in items}))
+    for i in items:
+        i["author"] = authors.get(i["authorUserId"])
+
+
+# Computed per page rather than selected from posts
+LIST_EXTRA_FIELDS = ("author", "likedByMe")
+MAX_EXCERPT = 1000
+
+
+async def list_posts(session: AsyncSession, offset: int, limit: int, cursor: Optional[str] = None, u=None,
+                     fields: Optional[str] = None, excerpt: Optional[int] = None):
+    before = None
+    if cursor:
+        before = decode_cursor(cursor)
+        if not before:
+            raise_http_error(400, "INVALID_CURSOR")
+
+    # fields: comma-separated response fields; None means all of them
+    wanted = None
+    columns = None
+    if fields is not None:
+        wanted = {f.strip() for f in fields.split(",") if f.strip()}
+        if not wanted or wanted - set(db.POST_COLUMNS) - set(LIST_EXTRA_FIELDS):
+            raise_http_error(400, "INVALID_FIELDS")
+        if "author" in wanted:
+            wanted.add("authorUserId")
+        columns = [f for f in db.POST_COLUMNS if f in wanted]
+    if excerpt is not None and not 0 < excerpt <= MAX_EXCERPT:
+        raise_http_error(400, "BAD_REQUEST")
+
+    items = await db.list_posts(session, offset, limit, before=before, fields=columns, excerpt=excerpt)
+    if wanted is None or wanted & {"hits", "uniqueViews"}:
+        pending = await view_counter.pending([p["postId"] for p in items])
+        for p in items:
+            hits, unique = pending.get(p["postId"], (0, 0))
+            if "hits" in p:
+                p["hits"] += hits
+            if "uniqueViews" in p:
+                p["uniqueViews"] += unique
+    if wanted is None or "author" in wanted:
+        await _add_authors(session, items)
+    if wanted is None or "likedByMe" in wanted:
+        await _add_liked_by_me(session, u, items)
+    next_cursor = None
+    # A full page may have more after it (limit=0 gives an empty page and no cursor)
+    if items and len(items) == limit:
+        last = items[-1]
+        next_cursor = encode_cursor(datetime.fromisoformat(last["createdAt"]), last["postId"])
+    return success_response("POSTS_RETRIEVED", {"items": items, "nextCursor": next_cursor})
+
+
+async def get_post(session: AsyncSession, post_id: int, viewer: str, u=None):
+    p = await db.get_post(session, post_id)
     if not p:
         raise_http_error(404, "NOT_FOUND")
+    # Persisted counts plus views still buffered in Redis by any pod
+    hits, unique = await view_counter.record_view(post_id, viewer)
+    p["hits"] += hits
+    p["uniqueViews"] += unique
+    await _add_liked_by_me(session, u, [p])
     return success_response("POST_RETRIEVED", p)
 
 
-def create_post(u, payload: dict):
+async def create_post(session: AsyncSession, u, payload: dict):
     title = payload.get("title")
     content = payload.get("content")
     file_url = payload.get("fileUrl")
@@ -28,22 +95,23 @@ def create_post(u, payload: dict):
 
     real_file_url = None
     if file_url and file_url.startswith("data:"):
-        fid = db.save_file(file_url)
+        fid = await db.save_file(session, file_url)
         if fid:
             real_file_url = f"/public/files/{fid}"
     else:
         real_file_url = file_url
 
-    p = db.create_post(title=title, content=content, author_user_id=u["userId"], file_url=real_file_url)
+    p = await db.create_post(session, title=title, content=content, author_user_id=u["userId"], file_url=real_file_url)
+    await session.commit()
     return success_response("POST_CREATED", {"postId": p["postId"]}, http_status=201)
 
 
-def update_post(u, post_id: int, payload: dict):
+async def update_post(session: AsyncSession, u, post_id: int, payload: dict):
     title = payload.get("title")
     content = payload.get("content")
     file_url = payload.get("fileUrl")
 
-    p = db.get_post(post_id, increase_hits=False)
+    p = await db.get_post(session, post_id)
     if not p:
         raise_http_error(404, "NOT_FOUND")
     if p["authorUserId"] != u["userId"]:
@@ -58,80 +126,101 @@ def update_post(u, post_id: int, payload: dict):
 
     real_file_url = None
     if file_url and file_url.startswith("data:"):
-        fid = db.save_file(file_url)
+        fid = await db.save_file(session, file_url)
         if fid:
             real_file_url = f"/public/files/{fid}"
     else:
         real_file_url = file_url
 
-    db.update_post(post_id, title, content, real_file_url)
+    await db.update_post(session, post_id, title, content, real_file_url)
+    await session.commit()
     return success_response("POST_UPDATED", None)
 
 
-def delete_post(u, post_id: int):
-    p = db.get_post(post_id, increase_hits=False)
+async def delete_post(session: AsyncSession, u, post_id: int):
+    p = await db.get_post(session, post_id)
     if not p:
         raise_http_error(404, "NOT_FOUND")
     if p["authorUserId"] != u["userId"]:
         raise_http_error(403, "FORBIDDEN")
 
-    db.delete_post(post_id)
+    await db.delete_post(session, post_id)
+    await session.commit()
     return success_response("POST_DELETED", None)
 
 
-def like_post(u, post_id: int):
-    if not db.get_post(post_id, increase_hits=False):
+async def like_post(session: AsyncSession, u, post_id: int):
+    if not await db.get_post(session, post_id):
         raise_http_error(404, "NOT_FOUND")
-    cnt = db.like_post(post_id, u["userId"])
+    cnt = await db.like_post(session, post_id, u["userId"])
+    await session.commit()
     return success_response("POST_LIKED", {"likeCount": cnt}, http_status=201)
 
 
-def unlike_post(u, post_id: int):
-    if not db.get_post(post_id, increase_hits=False):
+async def unlike_post(session: AsyncSession, u, post_id: int):
+    if not await db.get_post(session, post_id):
         raise_http_error(404, "NOT_FOUND")
-    cnt = db.unlike_post(post_id, u["userId"])
+    cnt = await db.unlike_post(session, post_id, u["userId"])
+    await session.commit()
     return success_response("POST_UNLIKED", {"likeCount": cnt})
 
 
-def list_comments(post_id: int):
-    if not db.get_post(post_id, increase_hits=False):
+MAX_COMMENT_PAGE = 100
+
+
+async def list_comments(session: AsyncSession, post_id: int, limit: int, cursor: Optional[str] = None):
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if not after:
+            raise_http_error(400, "INVALID_CURSOR")
+    if not await db.post_exists(session, post_id):
         raise_http_error(404, "NOT_FOUND")
-    items = db.list_comments(post_id)
-    return success_response("COMMENTS_RETRIEVED", {"items": items})
+    limit = max(1, min(limit, MAX_COMMENT_PAGE))
+    items = await db.list_comments(session, post_id, limit, after=after)
+    await _add_authors(session, items)
+    next_cursor = None
+    if len(items) == limit:
+        last = items[-1]
+        next_cursor = encode_cursor(datetime.fromisoformat(last["createdAt"]), last["commentId"])
+    return success_response("COMMENTS_RETRIEVED", {"items": items, "nextCursor": next_cursor})
 
 
-def create_comment(u, post_id: int, payload: dict):
+async def create_comment(session: AsyncSession, u, post_id: int, payload: dict):
     content = payload.get("content")
     if not content:
         raise_http_error(400, "COMMENT_REQUIRED")
-    if not db.get_post(post_id, increase_hits=False):
+    if not await db.get_post(session, post_id):
         raise_http_error(404, "NOT_FOUND")
 
-    c = db.create_comment(post_id, content, u["userId"])
+    c = await db.create_comment(session, post_id, content, u["userId"])
+    await session.commit()
     return success_response("COMMENT_CREATED", {"commentId": c["commentId"]}, http_status=201)
 
 
-def update_comment(u, post_id: int, comment_id: int, payload: dict):
+async def update_comment(session: AsyncSession, u, post_id: int, comment_id: int, payload: dict):
     content = payload.get("content")
     if not content:
         raise_http_error(400, "COMMENT_REQUIRED")
 
-    c = db.get_comment(comment_id)
+    c = await db.get_comment(session, comment_id)
     if not c or c["postId"] != post_id:
         raise_http_error(404, "NOT_FOUND")
     if c["authorUserId"] != u["userId"]:
         raise_http_error(403, "FORBIDDEN")
 
-    db.update_comment(comment_id, content)
+    await db.update_comment(session, comment_id, content)
+    await session.commit()
     return success_response("COMMENT_UPDATED", None)
 
 
-def delete_comment(u, post_id: int, comment_id: int):
-    c = db.get_comment(comment_id)
+async def delete_comment(session: AsyncSession, u, post_id: int, comment_id: int):
+    c = await db.get_comment(session, comment_id)
     if not c or c["postId"] != post_id:
         raise_http_error(404, "NOT_FOUND")
     if c["authorUserId"] != u["userId"]:
         raise_http_error(403, "FORBIDDEN")
 
-    db.delete_comment(comment_id)
+    await db.delete_comment(session, comment_id)
+    await session.commit()
     return success_response("COMMENT_DELETED", None)
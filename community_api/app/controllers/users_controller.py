@@ -6,13 +6,17 @@ from app.schemas.users import (
     UpdatePasswordRequest,
     UpdateProfileImageUrlRequest,
 )
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.storage import db
+from app.storage.sessions import session_store
 from app.utils.responses import success_response, success_payload, raise_http_error
-from app.utils.security import valid_password, hash_pw
+from app.utils.security import valid_password
+from app.utils.password_hasher import password_hasher
 
 
-def get_user(user_id: int):
-    u = db.get_user(user_id)
+async def get_user(session: AsyncSession, user_id: int):
+    u = await db.get_user(session, user_id)
     if not u:
         raise_http_error(404, "NOT_FOUND")
 
@@ -27,7 +31,23 @@ def get_user(user_id: int):
     )
 
 
-def get_me(u: UserDict):
+MAX_BULK_USER_IDS = 100
+
+
+async def get_users(session: AsyncSession, ids: str):
+    # ids: comma-separated user ids; duplicates are collapsed, order is kept
+    try:
+        user_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise_http_error(400, "BAD_REQUEST")
+    if not user_ids or len(user_ids) > MAX_BULK_USER_IDS:
+        raise_http_error(400, "BAD_REQUEST")
+
+    users = await db.get_user_summaries(session, user_ids)
+    return success_response("USERS_RETRIEVED", {"items": [users[uid] for uid in user_ids if uid in users]})
+
+
+async def get_me(u: UserDict):
     return success_response(
         "USER_RETRIEVED",
         {
@@ -39,7 +59,7 @@ def get_me(u: UserDict):
     )
 
 
-def update_me(u: UserDict, payload: UpdateMeRequest):
+async def update_me(session: AsyncSession, u: UserDict, payload: UpdateMeRequest):
     nickname = payload.nickname
 
     # (기존 에러코드 유지)
@@ -48,7 +68,7 @@ def update_me(u: UserDict, payload: UpdateMeRequest):
     if len(nickname) > 10:
         raise_http_error(400, "INVALID_NICKNAME")
 
-    other = db.get_user_by_nickname(nickname)
+    other = await db.get_user_by_nickname(session, nickname)
     if other and other["userId"] != u["userId"]:
         raise_http_error(409, "NICKNAME_ALREADY_EXISTS")
 
@@ -58,48 +78,54 @@ def update_me(u: UserDict, payload: UpdateMeRequest):
     if payload.profileImageUrl is not None:
         url = payload.profileImageUrl
         if url and url.startswith("data:"):
-            fid = db.save_file(url)
+            fid = await db.save_file(session, url)
             if fid:
                 url = f"/public/files/{fid}"
         
         u["profileImageUrl"] = url
-        db.update_user_profile_image(u["userId"], url)
+        await db.update_user_profile_image(session, u["userId"], url)
 
     u["updatedAt"] = db.now_iso()
     
     # DB Update (Nickname)
-    db.update_user_nickname(u["userId"], nickname)
-    
+    try:
+        await db.update_user_nickname(session, u["userId"], nickname)
+        await session.commit()
+    except IntegrityError:
+        # Taken by a concurrent rename or signup after the check above
+        await session.rollback()
+        raise_http_error(409, "NICKNAME_ALREADY_EXISTS")
     return success_response("USER_UPDATED", None)
 
 
-def update_password(u: UserDict, payload: UpdatePasswordRequest):
+async def update_password(session: AsyncSession, u: UserDict, payload: UpdatePasswordRequest):
     current_pw = payload.currentPassword
     new_pw = payload.newPassword
 
     # 현재 비밀번호 검증
-    if hash_pw(current_pw) != u["passwordHash"]:
+    if not await password_hasher.verify(current_pw, u["passwordHash"]):
         raise_http_error(400, "CURRENT_PASSWORD_INCORRECT")
 
     if not valid_password(new_pw):
         raise_http_error(400, "INVALID_PASSWORD")
 
-    u["passwordHash"] = hash_pw(new_pw)
+    u["passwordHash"] = await password_hasher.hash(new_pw)
     u["updatedAt"] = db.now_iso()
     
     # DB Update
-    db.update_user_password(u["userId"], u["passwordHash"])
+    await db.update_user_password(session, u["userId"], u["passwordHash"])
     
+    await session.commit()
     return success_response("PASSWORD_UPDATED", None)
 
 
-def update_profile_image_url(u: UserDict, payload: UpdateProfileImageUrlRequest):
+async def update_profile_image_url(session: AsyncSession, u: UserDict, payload: UpdateProfileImageUrlRequest):
     url = payload.profileImageUrl
     if not url:
         raise_http_error(400, "BAD_REQUEST")
 
     if url and url.startswith("data:"):
-        fid = db.save_file(url)
+        fid = await db.save_file(session, url)
         if fid:
             url = f"/public/files/{fid}"
 
@@ -107,16 +133,18 @@ def update_profile_image_url(u: UserDict, payload: UpdateProfileImageUrlRequest)
     u["updatedAt"] = db.now_iso()
     
     # DB Update
-    db.update_user_profile_image(u["userId"], url)
+    await db.update_user_profile_image(session, u["userId"], url)
 
+    await session.commit()
     return success_response("PROFILE_IMAGE_UPDATED", {"profileImageUrl": url})
 
 
-def delete_me(u_and_sid):
+async def delete_me(session: AsyncSession, u_and_sid):
     u, sid = u_and_sid
 
-    db.delete_user(u["userId"])
-    db.delete_session(sid)
+    await db.delete_user(session, u["userId"])
+    await session_store.delete_user(session, u["userId"])
+    await session.commit()
 
     res = JSONResponse(content=success_payload("USER_DELETED", None))
     res.delete_cookie("sessionId", path="/")
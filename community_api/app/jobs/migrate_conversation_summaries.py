@@ -0,0 +1,111 @@
+"""
+Brings an existing database up to the denormalized inbox (conversation
+summaries) and the keyset chat-history index:
+
+- conversations: last_message_id, last_message_preview, last_message_at,
+  user1_unread_count, user2_unread_count, and the
+  ix_conversations_user{1,2}_activity indexes
+- messages: ix_messages_conversation_id_id (conversation_id, id)
+
+then backfills the summaries from `messages`: the latest message, its
+preview and time, and per-participant unread counts from the legacy
+messages.is_read flags (if that column is still there). Conversations
+are processed in committed id batches. Equivalent DDL on MySQL:
+
+    ALTER TABLE conversations
+        ADD COLUMN last_message_id INTEGER NULL,
+        ADD COLUMN last_message_preview VARCHAR(200) NULL,
+        ADD COLUMN last_message_at DATETIME NULL,   -- NOT NULL after backfill
+        ADD COLUMN user1_unread_count INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN user2_unread_count INTEGER NOT NULL DEFAULT 0;
+    CREATE INDEX ix_conversations_user1_activity ON conversations (user1_id, last_message_at, id);
+    CREATE INDEX ix_conversations_user2_activity ON conversations (user2_id, last_message_at, id);
+    CREATE INDEX ix_messages_conversation_id_id ON messages (conversation_id, id);
+
+Run once, before serving chat with this code (safe to re-run):
+
+    python -m app.jobs.migrate_conversation_summaries
+"""
+import asyncio
+import os
+
+from sqlalchemy import column, false, func, select, table, update
+
+from app.database import engine
+from app.jobs import schema
+from app.models.orm import Conversation, Message
+from app.storage.db import PREVIEW_LENGTH
+
+BATCH_SIZE = int(os.getenv("CONVERSATION_MIGRATION_BATCH_SIZE", "1000"))
+
+conversations = Conversation.__table__
+messages = Message.__table__
+# messages as it was before read watermarks (is_read is no longer mapped)
+legacy_messages = table("messages", column("id"), column("conversation_id"), column("sender_id"), column("is_read"))
+
+
+def _migrate_schema(conn):
+    schema.add_columns(conn, conversations, {
+        "last_message_id": None,
+        "last_message_preview": None,
+        "last_message_at": None,
+        "user1_unread_count": "0",
+        "user2_unread_count": "0",
+    })
+    schema.add_indexes(conn, conversations)
+    schema.add_indexes(conn, messages)
+    return schema.has_column(conn, "messages", "is_read")
+
+
+def _unread(user_column):
+    return select(func.count()).select_from(legacy_messages).where(
+        legacy_messages.c.conversation_id == conversations.c.id,
+        legacy_messages.c.sender_id != user_column,
+        legacy_messages.c.is_read == false(),
+    ).scalar_subquery()
+
+
+async def backfill(conn, start_id: int, end_id: int, with_unread: bool):
+    in_batch = (conversations.c.id >= start_id) & (conversations.c.id < end_id)
+    await conn.execute(update(conversations).where(in_batch).values(
+        last_message_id=select(func.max(messages.c.id))
+        .where(messages.c.conversation_id == conversations.c.id).scalar_subquery()
+    ))
+    last = messages.c.id == conversations.c.last_message_id
+    await conn.execute(update(conversations).where(in_batch).values(
+        last_message_preview=select(func.substr(messages.c.content, 1, PREVIEW_LENGTH)).where(last).scalar_subquery(),
+        last_message_at=func.coalesce(
+            select(messages.c.created_at).where(last).scalar_subquery(),
+            conversations.c.created_at,
+            func.now(),
+        ),
+    ))
+    if with_unread:
+        await conn.execute(update(conversations).where(in_batch).values(
+            user1_unread_count=_unread(conversations.c.user1_id),
+            user2_unread_count=_unread(conversations.c.user2_id),
+        ))
+
+
+async def migrate() -> int:
+    async with engine.begin() as conn:
+        with_unread = await conn.run_sync(_migrate_schema)
+        last_id = await conn.scalar(select(func.max(conversations.c.id))) or 0
+    for start_id in range(1, last_id + 1, BATCH_SIZE):
+        async with engine.begin() as conn:
+            await backfill(conn, start_id, start_id + BATCH_SIZE, with_unread)
+    async with engine.begin() as conn:
+        await conn.run_sync(schema.modify_columns, conversations, ["last_message_at"])
+    return last_id
+
+
+async def main():
+    try:
+        last_id = await migrate()
+        print(f"conversation summaries backfilled up to id {last_id}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
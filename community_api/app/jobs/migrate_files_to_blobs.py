@@ -0,0 +1,72 @@
+"""
+Moves image bytes from files.data (LONGBLOB) into the blob store
+(BLOB_BACKEND) and points each row at its content hash. Rows are read in
+batches, so memory stays bounded; each batch commits on its own and the job
+can be stopped and re-run at any time. Public /public/files/{id} URLs do not
+change.
+
+It first brings the table up to the model (uploads and image reads fail
+until it has), so run it before deploying:
+
+    ALTER TABLE files
+        ADD COLUMN blob_key VARCHAR(64) NULL,
+        ADD COLUMN size INTEGER NULL,
+        MODIFY COLUMN data LONGBLOB NULL;   -- MySQL only; SQLite keeps NOT NULL
+    CREATE INDEX ix_files_blob_key ON files (blob_key);
+
+    python -m app.jobs.migrate_files_to_blobs
+
+Afterwards, OPTIMIZE TABLE files returns the freed space to MySQL.
+"""
+import asyncio
+import os
+
+from app.database import engine
+from app.jobs import schema
+from app.models.orm import File
+from app.storage import db
+from app.storage.blobs import BLOB_BACKEND, blob_key, blob_store
+
+# Rows per batch (each holds up to BATCH_SIZE images in memory)
+BATCH_SIZE = int(os.getenv("FILE_MIGRATION_BATCH_SIZE", "100"))
+
+
+def _migrate_schema(conn):
+    files = File.__table__
+    schema.add_columns(conn, files, {"blob_key": None, "size": None})
+    schema.add_indexes(conn, files)
+    schema.modify_columns(conn, files, ["data"])
+
+
+async def migrate() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(_migrate_schema)
+    moved = 0
+    last_id = ""
+    async with db.get_db_session() as session:
+        while True:
+            rows = await db.list_inline_files(session, last_id, BATCH_SIZE)
+            if not rows:
+                break
+            blobs = {}
+            for fid, mime, data in rows:
+                key = blob_key(data)
+                await blob_store.put(key, data, mime)
+                blobs[fid] = (key, len(data))
+            await db.set_file_blobs(session, blobs)
+            await session.commit()
+            moved += len(rows)
+            last_id = rows[-1][0]
+    return moved
+
+
+async def main():
+    try:
+        moved = await migrate()
+        print(f"moved {moved} files to the {BLOB_BACKEND} blob store")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
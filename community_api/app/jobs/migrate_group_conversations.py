@@ -0,0 +1,45 @@
+"""
+Brings an existing database up to group rooms:
+
+    ALTER TABLE conversations
+        MODIFY COLUMN user1_id INTEGER NULL,
+        MODIFY COLUMN user2_id INTEGER NULL,
+        ADD COLUMN is_group BOOL NOT NULL DEFAULT 0,
+        ADD COLUMN title VARCHAR(100) NULL;
+    CREATE TABLE conversation_participants (...);   -- as in app.models.orm
+
+Existing conversations are all direct ones, so they need no backfill:
+is_group defaults to false and title stays NULL. user1_id/user2_id are
+only relaxed on MySQL (SQLite cannot alter a column; recreate the table
+there if group rooms are needed). Run once, before serving chat with this
+code (safe to re-run):
+
+    python -m app.jobs.migrate_group_conversations
+"""
+import asyncio
+
+from app.database import engine
+from app.jobs import schema
+from app.models.orm import Conversation, ConversationParticipant
+
+conversations = Conversation.__table__
+participants = ConversationParticipant.__table__
+
+
+def _migrate_schema(conn):
+    schema.modify_columns(conn, conversations, ["user1_id", "user2_id"])
+    schema.add_columns(conn, conversations, {"is_group": "0", "title": None})
+    participants.create(conn, checkfirst=True)
+
+
+async def main():
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(_migrate_schema)
+        print("conversations migrated for group rooms")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,29 @@
+"""
+Creates the index the keyset-paginated post feed walks, so a page costs
+the same at any depth instead of a filesort over every live post:
+
+    CREATE INDEX ix_posts_feed ON posts (deleted_at, created_at, id);
+
+Run once on an existing database, before or right after deploying the
+cursor feed (safe to re-run; it only creates what is missing):
+
+    python -m app.jobs.migrate_post_feed_index
+"""
+import asyncio
+
+from app.database import engine
+from app.jobs import schema
+from app.models.orm import Post
+
+
+async def main():
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(schema.add_indexes, Post.__table__)
+        print("posts feed index is in place")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
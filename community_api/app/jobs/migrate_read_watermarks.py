@@ -0,0 +1,100 @@
+"""
+Moves direct conversations from per-message read flags (messages.is_read)
+to per-participant read watermarks:
+
+    ALTER TABLE conversations
+        ADD COLUMN user1_last_read_id INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN user2_last_read_id INTEGER NOT NULL DEFAULT 0;
+
+then, per conversation, sets user{1,2}_last_read_id to the newest message
+from the other participant that is flagged read, and recounts
+user{1,2}_unread_count as the other participant's messages past that
+watermark, so the counters agree with mark_messages_read. Conversations are
+processed in committed id batches.
+
+Run after migrate_conversation_summaries (it needs the unread counters) and
+before serving chat with this code; safe to re-run while messages.is_read
+still exists. Once it has run, the flag is no longer read or written:
+
+    python -m app.jobs.migrate_read_watermarks
+    ALTER TABLE messages DROP COLUMN is_read;
+"""
+import asyncio
+import os
+
+from sqlalchemy import column, func, select, table, true, update
+
+from app.database import engine
+from app.jobs import schema
+from app.models.orm import Conversation
+
+BATCH_SIZE = int(os.getenv("WATERMARK_MIGRATION_BATCH_SIZE", "1000"))
+
+conversations = Conversation.__table__
+# messages as it was before read watermarks (is_read is no longer mapped)
+legacy_messages = table("messages", column("id"), column("conversation_id"), column("sender_id"), column("is_read"))
+
+
+def _migrate_schema(conn):
+    schema.add_columns(conn, conversations, {"user1_last_read_id": "0", "user2_last_read_id": "0"})
+    return schema.has_column(conn, "messages", "is_read")
+
+
+def _from_other_side(user_column):
+    return (
+        (legacy_messages.c.conversation_id == conversations.c.id)
+        & (legacy_messages.c.sender_id != user_column)
+    )
+
+
+def _watermark(user_column):
+    return func.coalesce(
+        select(func.max(legacy_messages.c.id))
+        .where(_from_other_side(user_column), legacy_messages.c.is_read == true())
+        .scalar_subquery(),
+        0,
+    )
+
+
+def _unread(user_column, watermark_column):
+    return select(func.count()).select_from(legacy_messages).where(
+        _from_other_side(user_column), legacy_messages.c.id > watermark_column
+    ).scalar_subquery()
+
+
+async def backfill(conn, start_id: int, end_id: int):
+    in_batch = (conversations.c.id >= start_id) & (conversations.c.id < end_id)
+    c = conversations.c
+    await conn.execute(update(conversations).where(in_batch).values(
+        user1_last_read_id=_watermark(c.user1_id),
+        user2_last_read_id=_watermark(c.user2_id),
+    ))
+    await conn.execute(update(conversations).where(in_batch).values(
+        user1_unread_count=_unread(c.user1_id, c.user1_last_read_id),
+        user2_unread_count=_unread(c.user2_id, c.user2_last_read_id),
+    ))
+
+
+async def migrate() -> int:
+    async with engine.begin() as conn:
+        has_flags = await conn.run_sync(_migrate_schema)
+        last_id = await conn.scalar(select(func.max(conversations.c.id))) or 0
+    if not has_flags:
+        # messages.is_read is already gone: nothing left to derive watermarks from
+        return 0
+    for start_id in range(1, last_id + 1, BATCH_SIZE):
+        async with engine.begin() as conn:
+            await backfill(conn, start_id, start_id + BATCH_SIZE)
+    return last_id
+
+
+async def main():
+    try:
+        last_id = await migrate()
+        print(f"read watermarks backfilled up to id {last_id}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,30 @@
+"""
+Adds the column the unique-viewer mode (POST_VIEW_MODE=unique) folds its
+HyperLogLog counts into. Post maps it in every mode, so run this once on an
+existing database before deploying (safe to re-run):
+
+    ALTER TABLE posts ADD COLUMN unique_views INTEGER NOT NULL DEFAULT 0;
+
+    python -m app.jobs.migrate_unique_views
+
+Existing posts start at 0: viewers before the column existed were never
+tracked per viewer.
+"""
+import asyncio
+
+from app.database import engine
+from app.jobs import schema
+from app.models.orm import Post
+
+
+async def main():
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(schema.add_columns, Post.__table__, {"unique_views": "0"})
+        print("posts.unique_views is in place")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+"""
+Repairs drift between posts.comment_count and the live (not soft-deleted)
+comments rows.
+
+Run periodically (e.g. as a Kubernetes CronJob). On an existing database
+the first run also adds the posts.comment_count column and backfills it,
+and creates the ix_comments_post_page index used by comment pagination;
+it also repairs counts that account deletions left too high before they
+decremented them:
+
+    python -m app.jobs.reconcile_comment_counts
+"""
+import asyncio
+import os
+
+from app.database import engine
+from app.jobs import schema
+from app.models.orm import Comment, Post
+from app.storage import db
+
+# Posts per UPDATE; each batch commits on its own so row locks stay short
+BATCH_SIZE = int(os.getenv("COMMENT_RECONCILE_BATCH_SIZE", "1000"))
+
+
+def _migrate_schema(conn):
+    schema.add_columns(conn, Post.__table__, {"comment_count": "0"})
+    schema.add_indexes(conn, Comment.__table__)
+
+
+async def reconcile() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(_migrate_schema)
+    repaired = 0
+    async with db.get_db_session() as session:
+        last_id = await db.max_post_id(session)
+        for start_id in range(1, last_id + 1, BATCH_SIZE):
+            repaired += await db.reconcile_comment_counts(session, start_id, start_id + BATCH_SIZE)
+            await session.commit()
+    return repaired
+
+
+async def main():
+    try:
+        repaired = await reconcile()
+        print(f"comment_count repaired on {repaired} posts")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
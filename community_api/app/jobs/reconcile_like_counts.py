@@ -0,0 +1,43 @@
+"""
+Repairs drift between posts.like_count and the post_likes rows.
+
+Run periodically (e.g. as a Kubernetes CronJob). On an existing database
+the first run adds the posts.like_count column and backfills it, so run it
+once before deploying code that reads like_count:
+
+    python -m app.jobs.reconcile_like_counts
+"""
+import asyncio
+import os
+
+from app.database import engine
+from app.jobs import schema
+from app.models.orm import Post
+from app.storage import db
+
+# Posts per UPDATE; each batch commits on its own so row locks stay short
+BATCH_SIZE = int(os.getenv("LIKE_RECONCILE_BATCH_SIZE", "1000"))
+
+
+async def reconcile() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(schema.add_columns, Post.__table__, {"like_count": "0"})
+    repaired = 0
+    async with db.get_db_session() as session:
+        last_id = await db.max_post_id(session)
+        for start_id in range(1, last_id + 1, BATCH_SIZE):
+            repaired += await db.reconcile_like_counts(session, start_id, start_id + BATCH_SIZE)
+            await session.commit()
+    return repaired
+
+
+async def main():
+    try:
+        repaired = await reconcile()
+        print(f"like_count repaired on {repaired} posts")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
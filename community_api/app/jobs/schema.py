@@ -0,0 +1,54 @@
+"""
+Helpers for the migration jobs: bring an existing table up to the ORM model.
+create_all only creates missing tables, so columns and indexes added to
+existing tables go through these. Every step checks the live schema first,
+so a job can be re-run safely. Call them through AsyncConnection.run_sync.
+"""
+from typing import Dict, Iterable, Optional
+from sqlalchemy import Table, inspect, text
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+
+def _column_spec(conn, table: Table, name: str, nullable: Optional[bool] = None) -> str:
+    column = table.c[name]
+    if nullable is not None and nullable != column.nullable:
+        column = column._copy()
+        column.nullable = nullable
+    return str(CreateColumn(column).compile(dialect=conn.dialect))
+
+
+def add_columns(conn, table: Table, columns: Dict[str, Optional[str]]):
+    """
+    Add the model's columns that the live table lacks. The value is an SQL
+    DEFAULT for existing rows; None adds the column NULL-able, for the job to
+    backfill and then tighten with modify_columns.
+    """
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    for name, default in columns.items():
+        if name in existing:
+            continue
+        if default is None:
+            spec = _column_spec(conn, table, name, nullable=True)
+        else:
+            spec = f"{_column_spec(conn, table, name)} DEFAULT {default}"
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {spec}"))
+
+
+def modify_columns(conn, table: Table, names: Iterable[str]):
+    """Re-declare columns as the model has them (nullability). MySQL only; SQLite is left as is."""
+    if conn.dialect.name != "mysql":
+        return
+    for name in names:
+        conn.execute(text(f"ALTER TABLE {table.name} MODIFY COLUMN {_column_spec(conn, table, name)}"))
+
+
+def add_indexes(conn, table: Table):
+    """Create the model's indexes that the live table lacks."""
+    existing = {i["name"] for i in inspect(conn).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            conn.execute(CreateIndex(index))
+
+
+def has_column(conn, table_name: str, name: str) -> bool:
+    return any(c["name"] == name for c in inspect(conn).get_columns(table_name))
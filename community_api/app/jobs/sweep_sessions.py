@@ -0,0 +1,56 @@
+"""
+Deletes expired rows from the sessions table (SESSION_BACKEND=db). Rows from
+before expires_at existed are first given a full SESSION_TTL from the run
+that finds them, so they expire like new ones unless used in the meantime.
+
+Run periodically (e.g. as a Kubernetes CronJob). On an existing database
+the first run also adds sessions.expires_at and its index; run it once
+before deploying code that maps that column:
+
+    python -m app.jobs.sweep_sessions
+"""
+import asyncio
+import os
+
+from app.database import engine
+from app.jobs import schema
+from app.models.orm import Session
+from app.storage import db
+from app.storage.sessions import SESSION_TTL
+
+# Rows per DELETE; each batch commits on its own so locks stay short
+BATCH_SIZE = int(os.getenv("SESSION_SWEEP_BATCH_SIZE", "1000"))
+
+
+def _migrate_schema(conn):
+    schema.add_columns(conn, Session.__table__, {"expires_at": None})
+    schema.add_indexes(conn, Session.__table__)
+
+
+async def sweep() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(_migrate_schema)
+    deleted = 0
+    async with db.get_db_session() as session:
+        while await db.expire_legacy_sessions(session, SESSION_TTL, BATCH_SIZE) == BATCH_SIZE:
+            await session.commit()
+        await session.commit()
+        while True:
+            n = await db.delete_expired_sessions(session, BATCH_SIZE)
+            await session.commit()
+            deleted += n
+            if n < BATCH_SIZE:
+                break
+    return deleted
+
+
+async def main():
+    try:
+        deleted = await sweep()
+        print(f"deleted {deleted} expired sessions")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
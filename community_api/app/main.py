@@ -8,7 +8,11 @@ from fastapi.responses import JSONResponse
 
 from app.routers.index import register_routers
 from app.utils.responses import success_response
+from app.database import engine, init_db
 from app.utils.redis_client import close_redis
+from app.utils import db_metrics
+from app.utils.invalidation import bus
+from app.utils.password_hasher import password_hasher
 
 
 @asynccontextmanager
@@ -16,17 +20,34 @@ async def lifespan(app: FastAPI):
     # ── Startup ──────────────────────────────────────
     # Import here to avoid circular imports at module load time
     from app.controllers.chat_controller import manager
+    from app.storage.message_writer import message_writer
+    from app.storage.view_counter import view_counter
+    from app.storage.user_names import user_names
+    await init_db()
     task = asyncio.create_task(manager.subscribe_loop())
+    message_writer.start()
+    view_counter.start()
+    bus.start()
+    # Builds the email/nickname filters in the background, then rebuilds them
+    user_names.start()
 
     yield
 
     # ── Shutdown ─────────────────────────────────────
+    # Commit messages already accepted before the subscriber goes away
+    await message_writer.close()
+    # Write buffered post views to posts.hits before Redis/DB go away
+    await view_counter.close()
+    await bus.close()
+    await user_names.close()
+    password_hasher.close()
     task.cancel()
     try:
         await task
     except asyncio.CancelledError:
         pass
     await close_redis()
+    await engine.dispose()
 
 
 app = FastAPI(title="Community API", lifespan=lifespan)
@@ -57,6 +78,20 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def count_db_usage(request: Request, call_next):
+    # Connection checkouts and round trips per endpoint, reported on /metrics
+    token, stats = db_metrics.begin_request()
+    route = None
+    try:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        return response
+    finally:
+        key = f"{request.method} {route.path}" if route is not None else None
+        db_metrics.end_request(token, key, stats)
+
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(_: Request, exc: HTTPException):
     if isinstance(exc.detail, dict) and "code" in exc.detail:
@@ -73,6 +108,25 @@ def health():
     return success_response("OK", None)
 
 
+@app.get("/metrics")
+def metrics():
+    from app.controllers.chat_controller import manager
+    from app.storage.message_writer import message_writer
+    from app.storage.view_counter import view_counter
+    from app.storage.session_cache import session_cache
+    from app.storage.user_names import user_names
+    return success_response("METRICS_RETRIEVED", {
+        "chat": manager.metrics(),
+        "messageWriter": message_writer.metrics(),
+        "viewCounter": view_counter.metrics(),
+        "db": db_metrics.metrics(),
+        "sessionCache": session_cache.metrics(),
+        "invalidation": bus.metrics(),
+        "passwordHasher": password_hasher.metrics(),
+        "userNames": user_names.metrics(),
+    })
+
+
 register_routers(app)
 
 # ✅ AWS Lambda용 핸들러 (Mangum) 추가
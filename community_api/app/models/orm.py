@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Table, LargeBinary, Boolean
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Table, LargeBinary, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.mysql import LONGBLOB
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
 from datetime import datetime, timedelta
 from app.database import Base
 
@@ -9,6 +10,15 @@ def now_kst():
     return datetime.utcnow() + timedelta(hours=9)
 
 
+# Timestamps filled by the database (func.now()). SQLite stores CURRENT_TIMESTAMP
+# to the second, so bind values in that format too: a keyset cursor read back
+# from such a row then compares equal to it instead of sorting after it
+ServerTimestamp = DateTime(timezone=True).with_variant(
+    SQLITE_DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
+
 # Many-to-Many relationship for Post Likes
 post_likes = Table(
     "post_likes",
@@ -22,8 +32,13 @@ class File(Base):
     
     id = Column(String(36), primary_key=True)
     mime_type = Column(String(100), nullable=False)
-    # MySQL BLOB (64KB) is too small. Use LONGBLOB (4GB) for images.
-    data = Column(LONGBLOB, nullable=False) 
+    # SHA-256 of the content, stored in app.storage.blobs; NULL for rows
+    # still holding their bytes in `data` (see app.jobs.migrate_files_to_blobs)
+    blob_key = Column(String(64), nullable=True, index=True)
+    size = Column(Integer, nullable=True)
+    # Legacy inline bytes. MySQL BLOB (64KB) is too small. Use LONGBLOB (4GB) for images;
+    # other dialects (SQLite for tests) get their plain binary type.
+    data = Column(LargeBinary().with_variant(LONGBLOB, "mysql"), nullable=True)
     created_at = Column(DateTime(timezone=True), default=now_kst)
 
 class User(Base):
@@ -49,6 +64,9 @@ class Session(Base):
     session_id = Column(String(36), primary_key=True) # UUID string
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime(timezone=True), default=now_kst)
+    # Sliding expiry (app.storage.sessions); NULL on rows created before it
+    # existed, which get one on their next use
+    expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
 
     user = relationship("User", back_populates="sessions")
 
@@ -61,10 +79,21 @@ class Post(Base):
     author_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     file_url = Column(String(500), nullable=True)
     hits = Column(Integer, default=0)
+    # Materialized len(likers), moved together with each post_likes insert/delete
+    like_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Distinct viewers summed over closed windows (POST_VIEW_MODE=unique)
+    unique_views = Column(Integer, default=0, server_default="0", nullable=False)
+    # Live comments, moved by create_comment / delete_comment
+    comment_count = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime(timezone=True), default=now_kst)
     updated_at = Column(DateTime(timezone=True), default=now_kst, onupdate=now_kst)
     deleted_at = Column(DateTime(timezone=True), nullable=True)
 
+    __table_args__ = (
+        # Feed: live posts newest first, keyset-paginated on (created_at, id)
+        Index("ix_posts_feed", "deleted_at", "created_at", "id"),
+    )
+
     # Relationships
     author = relationship("User", back_populates="posts")
     comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan")
@@ -77,10 +106,15 @@ class Comment(Base):
     post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
     author_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    created_at = Column(ServerTimestamp, server_default=func.now())
+    updated_at = Column(ServerTimestamp, server_default=func.now(), onupdate=func.now())
     deleted_at = Column(DateTime(timezone=True), nullable=True)
 
+    __table_args__ = (
+        # A post's live comments oldest first, keyset-paginated on (created_at, id)
+        Index("ix_comments_post_page", "post_id", "deleted_at", "created_at", "id"),
+    )
+
     # Relationships
     post = relationship("Post", back_populates="comments")
     author = relationship("User", back_populates="comments")
@@ -89,14 +123,49 @@ class Conversation(Base):
     __tablename__ = "conversations"
 
     id = Column(Integer, primary_key=True, index=True)
-    user1_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    user2_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    # Direct conversations use the user1_id/user2_id pair; group rooms leave
+    # them NULL and list their members in conversation_participants
+    user1_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    user2_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    is_group = Column(Boolean, default=False, nullable=False)
+    title = Column(String(100), nullable=True)
     created_at = Column(DateTime(timezone=True), default=now_kst)
     updated_at = Column(DateTime(timezone=True), default=now_kst, onupdate=now_kst)
 
+    # Denormalized inbox summary (maintained by create_message / mark_messages_read)
+    last_message_id = Column(Integer, nullable=True)
+    last_message_preview = Column(String(200), nullable=True)
+    last_message_at = Column(DateTime(timezone=True), default=now_kst, nullable=False)
+    user1_unread_count = Column(Integer, default=0, nullable=False)
+    user2_unread_count = Column(Integer, default=0, nullable=False)
+    # Read watermarks: highest message id each participant has read
+    user1_last_read_id = Column(Integer, default=0, nullable=False)
+    user2_last_read_id = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        # Inbox: a user's conversations ordered by last activity
+        Index("ix_conversations_user1_activity", "user1_id", "last_message_at", "id"),
+        Index("ix_conversations_user2_activity", "user2_id", "last_message_at", "id"),
+    )
+
     user1 = relationship("User", foreign_keys=[user1_id])
     user2 = relationship("User", foreign_keys=[user2_id])
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", order_by="Message.created_at")
+    participants = relationship("ConversationParticipant", back_populates="conversation", cascade="all, delete-orphan")
+
+class ConversationParticipant(Base):
+    __tablename__ = "conversation_participants"
+
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True)
+    role = Column(String(20), default="member", nullable=False)  # "owner" | "member"
+    muted = Column(Boolean, default=False, nullable=False)
+    # Read watermark: highest message id this member has read
+    last_read_id = Column(Integer, default=0, nullable=False)
+    joined_at = Column(DateTime(timezone=True), default=now_kst)
+
+    conversation = relationship("Conversation", back_populates="participants")
+    user = relationship("User")
 
 class Message(Base):
     __tablename__ = "messages"
@@ -105,8 +174,12 @@ class Message(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False, index=True)
     sender_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=False)
-    is_read = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), default=now_kst)
 
+    __table_args__ = (
+        # History windows: WHERE conversation_id = ? AND id < / > ? ORDER BY id
+        Index("ix_messages_conversation_id_id", "conversation_id", "id"),
+    )
+
     conversation = relationship("Conversation", back_populates="messages")
     sender = relationship("User", foreign_keys=[sender_id])
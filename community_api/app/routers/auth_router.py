@@ -1,29 +1,35 @@
 from fastapi import APIRouter, Body, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
 from app.controllers import auth_controller as controller
 from app.routers.deps import require_user, require_user_with_sid
 
 router = APIRouter(prefix="/v1/auth", tags=["Auth"])
 
 @router.post("/signup", status_code=201)
-def signup(payload: dict = Body(...)):
-    return controller.signup(payload)
+async def signup(payload: dict = Body(...), session: AsyncSession = Depends(get_db)):
+    return await controller.signup(session, payload)
 
 @router.post("/login")
-def login(payload: dict = Body(...)):
-    return controller.login(payload)
+async def login(payload: dict = Body(...), session: AsyncSession = Depends(get_db)):
+    return await controller.login(session, payload)
 
 @router.post("/logout")
-def logout(u_and_sid=Depends(require_user_with_sid)):
-    return controller.logout(u_and_sid)
+async def logout(u_and_sid=Depends(require_user_with_sid), session: AsyncSession = Depends(get_db)):
+    return await controller.logout(session, u_and_sid)
+
+@router.post("/logout-all")
+async def logout_all(u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.logout_all(session, u)
 
 @router.get("/me")
-def me(u=Depends(require_user)):
-    return controller.me(u)
+async def me(u=Depends(require_user)):
+    return await controller.me(u)
 
 @router.get("/availability/email")
-def email_availability(email: str):
-    return controller.email_availability(email)
+async def email_availability(email: str, session: AsyncSession = Depends(get_db)):
+    return await controller.email_availability(session, email)
 
 @router.get("/availability/nickname")
-def nickname_availability(nickname: str):
-    return controller.nickname_availability(nickname)
+async def nickname_availability(nickname: str, session: AsyncSession = Depends(get_db)):
+    return await controller.nickname_availability(session, nickname)
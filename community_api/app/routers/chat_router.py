@@ -1,21 +1,54 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, Cookie
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, WebSocket, WebSocketDisconnect, Cookie
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
 from app.routers.deps import require_user
 from app.controllers import chat_controller as controller
+from app.schemas.chat import GroupCreateRequest, ParticipantsAddRequest, ParticipationUpdateRequest
 from app.storage import db
+from app.storage.session_cache import session_cache
 
 router = APIRouter(prefix="/v1/chat", tags=["Chat"])
 
 @router.get("/conversations")
-def get_conversations(u=Depends(require_user)):
-    return controller.get_my_conversations(u)
+async def get_conversations(
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
+    u=Depends(require_user),
+    session: AsyncSession = Depends(get_db),
+):
+    return await controller.get_my_conversations(session, u, limit, cursor)
 
 @router.get("/conversations/{conversation_id}/messages")
-def get_messages(conversation_id: int, u=Depends(require_user)):
-    return controller.get_conversation_messages(u, conversation_id)
+async def get_messages(
+    conversation_id: int,
+    limit: int = Query(50, ge=1, le=100),
+    before_id: Optional[int] = Query(None, ge=1),
+    after_id: Optional[int] = Query(None, ge=0),
+    u=Depends(require_user),
+    session: AsyncSession = Depends(get_db),
+):
+    return await controller.get_conversation_messages(session, u, conversation_id, limit, before_id, after_id)
 
 @router.post("/conversations")
-def create_conversation(payload: dict, u=Depends(require_user)):
-    return controller.create_or_get_conversation(u, payload)
+async def create_conversation(payload: dict, u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.create_or_get_conversation(session, u, payload)
+
+@router.post("/groups")
+async def create_group(payload: GroupCreateRequest, u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.create_group(session, u, payload)
+
+@router.post("/conversations/{conversation_id}/participants")
+async def add_participants(conversation_id: int, payload: ParticipantsAddRequest, u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.add_group_participants(session, u, conversation_id, payload)
+
+@router.patch("/conversations/{conversation_id}/participants/me")
+async def update_my_participation(conversation_id: int, payload: ParticipationUpdateRequest, u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.update_my_participation(session, u, conversation_id, payload)
+
+@router.delete("/conversations/{conversation_id}/participants/{user_id}")
+async def remove_participant(conversation_id: int, user_id: int, u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.remove_group_participant(session, u, conversation_id, user_id)
 
 # WebSocket does not easily support Depends with HTTPException, so we handle auth manually
 @router.websocket("/ws")
@@ -26,14 +59,17 @@ async def chat_websocket(websocket: WebSocket):
         await websocket.close(code=1008)
         return
         
-    u = db.session_user(sessionId)
+    async with db.get_db_session() as session:
+        u = await session_cache.session_user(session, sessionId)
     if not u:
         await websocket.close(code=1008)
         return
         
     user_id = u["userId"]
+    # Streams delivery mode: replay everything after the client's last seen stream id
+    last_stream_id = websocket.query_params.get("last_stream_id")
     
     try:
-        await controller.handle_chat_websocket(websocket, user_id)
+        await controller.handle_chat_websocket(websocket, user_id, last_stream_id)
     except WebSocketDisconnect:
         controller.manager.disconnect(websocket, user_id)
@@ -1,22 +1,46 @@
-from fastapi import Cookie
-from app.storage import db
+import hashlib
+from fastapi import Cookie, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.storage.session_cache import session_cache
 from app.utils.responses import raise_http_error
 from app.models.user import UserDict
 
 
-def require_user(sessionId: str | None = Cookie(None)) -> UserDict:
+async def require_user(sessionId: str | None = Cookie(None), session: AsyncSession = Depends(get_db)) -> UserDict:
     if not sessionId:
         raise_http_error(401, "UNAUTHORIZED")
-    u = db.session_user(sessionId)
+    u = await session_cache.session_user(session, sessionId)
     if not u:
         raise_http_error(401, "UNAUTHORIZED")
     return u
 
 
-def require_user_with_sid(sessionId: str | None = Cookie(None)) -> tuple[UserDict, str]:
+async def require_user_with_sid(
+    sessionId: str | None = Cookie(None), session: AsyncSession = Depends(get_db)
+) -> tuple[UserDict, str]:
     if not sessionId:
         raise_http_error(401, "UNAUTHORIZED")
-    u = db.session_user(sessionId)
+    u = await session_cache.session_user(session, sessionId)
     if not u:
         raise_http_error(401, "UNAUTHORIZED")
     return u, sessionId
+
+
+async def optional_user(
+    sessionId: str | None = Cookie(None), session: AsyncSession = Depends(get_db)
+) -> UserDict | None:
+    # Like require_user, but anonymous (or expired) sessions get None
+    if not sessionId:
+        return None
+    return await session_cache.session_user(session, sessionId)
+
+
+def viewer_key(request: Request, sessionId: str | None = Cookie(None)) -> str:
+    # Identifies a viewer for unique-view counting: the session if there is
+    # one, otherwise a fingerprint of client address and user agent
+    if sessionId:
+        return f"s:{sessionId}"
+    host = request.client.host if request.client else ""
+    ua = request.headers.get("user-agent", "")
+    return "a:" + hashlib.sha1(f"{host}|{ua}".encode()).hexdigest()
@@ -1,49 +1,73 @@
+from typing import Optional
 from fastapi import APIRouter, Body, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
 from app.controllers import posts_controller as controller
-from app.routers.deps import require_user
+from app.routers.deps import optional_user, require_user, viewer_key
 
 router = APIRouter(prefix="/v1/posts", tags=["Posts"])
 
 @router.get("")
-def list_posts(offset: int = 0, limit: int = 10):
-    return controller.list_posts(offset, limit)
+async def list_posts(
+    offset: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    excerpt: Optional[int] = None,
+    u=Depends(optional_user),
+    session: AsyncSession = Depends(get_db),
+):
+    # cursor (from the previous page's nextCursor) takes precedence over offset.
+    # fields=postId,title,... limits the columns read; excerpt=N returns the
+    # first N characters of content instead of the whole text.
+    return await controller.list_posts(session, offset, limit, cursor, u, fields, excerpt)
 
 @router.get("/{post_id:int}")
-def get_post(post_id: int):
-    return controller.get_post(post_id)
+async def get_post(
+    post_id: int,
+    viewer: str = Depends(viewer_key),
+    u=Depends(optional_user),
+    session: AsyncSession = Depends(get_db),
+):
+    return await controller.get_post(session, post_id, viewer, u)
 
 @router.post("", status_code=201)
-def create_post(payload: dict = Body(...), u=Depends(require_user)):
-    return controller.create_post(u, payload)
+async def create_post(payload: dict = Body(...), u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.create_post(session, u, payload)
 
 @router.patch("/{post_id:int}")
-def update_post(post_id: int, payload: dict = Body(...), u=Depends(require_user)):
-    return controller.update_post(u, post_id, payload)
+async def update_post(post_id: int, payload: dict = Body(...), u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.update_post(session, u, post_id, payload)
 
 @router.delete("/{post_id:int}")
-def delete_post(post_id: int, u=Depends(require_user)):
-    return controller.delete_post(u, post_id)
+async def delete_post(post_id: int, u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.delete_post(session, u, post_id)
 
 @router.post("/{post_id:int}/likes", status_code=201)
-def like_post(post_id: int, u=Depends(require_user)):
-    return controller.like_post(u, post_id)
+async def like_post(post_id: int, u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.like_post(session, u, post_id)
 
 @router.delete("/{post_id:int}/likes")
-def unlike_post(post_id: int, u=Depends(require_user)):
-    return controller.unlike_post(u, post_id)
+async def unlike_post(post_id: int, u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.unlike_post(session, u, post_id)
 
 @router.get("/{post_id:int}/comments")
-def list_comments(post_id: int):
-    return controller.list_comments(post_id)
+async def list_comments(
+    post_id: int,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_db),
+):
+    return await controller.list_comments(session, post_id, limit, cursor)
 
 @router.post("/{post_id:int}/comments", status_code=201)
-def create_comment(post_id: int, payload: dict = Body(...), u=Depends(require_user)):
-    return controller.create_comment(u, post_id, payload)
+async def create_comment(post_id: int, payload: dict = Body(...), u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.create_comment(session, u, post_id, payload)
 
 @router.patch("/{post_id:int}/comments/{comment_id:int}")
-def update_comment(post_id: int, comment_id: int, payload: dict = Body(...), u=Depends(require_user)):
-    return controller.update_comment(u, post_id, comment_id, payload)
+async def update_comment(post_id: int, comment_id: int, payload: dict = Body(...), u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.update_comment(session, u, post_id, comment_id, payload)
 
 @router.delete("/{post_id:int}/comments/{comment_id:int}")
-def delete_comment(post_id: int, comment_id: int, u=Depends(require_user)):
-    return controller.delete_comment(u, post_id, comment_id)
+async def delete_comment(post_id: int, comment_id: int, u=Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.delete_comment(session, u, post_id, comment_id)
@@ -1,5 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
 from app.storage import db
 from app.utils.responses import raise_http_error
 
@@ -7,8 +9,8 @@ router = APIRouter(prefix="/public", tags=["Public"])
 
 
 @router.get("/files/{file_id}")
-def get_file(file_id: str):
-    data, mime = db.get_file_data(file_id)
+async def get_file(file_id: str, session: AsyncSession = Depends(get_db)):
+    data, mime = await db.get_file_data(session, file_id)
     if data is None:
         raise_http_error(404, "NOT_FOUND")
     return Response(content=data, media_type=mime)
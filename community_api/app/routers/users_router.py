@@ -1,4 +1,6 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
 from app.controllers import users_controller as controller
 from app.models.user import UserDict
 from app.routers.deps import require_user, require_user_with_sid
@@ -11,33 +13,40 @@ from app.schemas.users import (
 router = APIRouter(prefix="/v1/users", tags=["Users"])
 
 
+@router.get("")
+async def get_users(ids: str, session: AsyncSession = Depends(get_db)):
+    return await controller.get_users(session, ids)
+
+
 @router.get("/me")
-def get_me(u: UserDict = Depends(require_user)):
-    return controller.get_me(u)
+async def get_me(u: UserDict = Depends(require_user)):
+    return await controller.get_me(u)
 
 
 @router.patch("/me")
-def update_me(payload: UpdateMeRequest, u: UserDict = Depends(require_user)):
-    return controller.update_me(u, payload)
+async def update_me(payload: UpdateMeRequest, u: UserDict = Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.update_me(session, u, payload)
 
 
 @router.patch("/me/password")
-def update_password(payload: UpdatePasswordRequest, u: UserDict = Depends(require_user)):
-    return controller.update_password(u, payload)
+async def update_password(payload: UpdatePasswordRequest, u: UserDict = Depends(require_user), session: AsyncSession = Depends(get_db)):
+    return await controller.update_password(session, u, payload)
 
 
 @router.patch("/me/profile-image-url")
-def update_profile_image_url(
-    payload: UpdateProfileImageUrlRequest, u: UserDict = Depends(require_user)
+async def update_profile_image_url(
+    payload: UpdateProfileImageUrlRequest,
+    u: UserDict = Depends(require_user),
+    session: AsyncSession = Depends(get_db),
 ):
-    return controller.update_profile_image_url(u, payload)
+    return await controller.update_profile_image_url(session, u, payload)
 
 
 @router.delete("/me")
-def delete_me(u_and_sid=Depends(require_user_with_sid)):
-    return controller.delete_me(u_and_sid)
+async def delete_me(u_and_sid=Depends(require_user_with_sid), session: AsyncSession = Depends(get_db)):
+    return await controller.delete_me(session, u_and_sid)
 
 
 @router.get("/{user_id:int}")
-def get_user(user_id: int):
-    return controller.get_user(user_id)
+async def get_user(user_id: int, session: AsyncSession = Depends(get_db)):
+    return await controller.get_user(session, user_id)
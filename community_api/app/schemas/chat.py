@@ -12,12 +12,26 @@ class MessageResponse(BaseModel):
 
 class ConversationResponse(BaseModel):
     id: int
-    other_user_id: int
-    other_user_nickname: str
+    is_group: bool
+    title: Optional[str]
+    other_user_id: Optional[int]
+    other_user_nickname: Optional[str]
     other_user_profile: Optional[str]
     last_message: Optional[str]
     last_message_at: Optional[datetime]
     unread_count: int
+    muted: bool
+    cursor: str
 
 class ConversationCreateRequest(BaseModel):
     other_user_id: int
+
+class GroupCreateRequest(BaseModel):
+    title: str
+    member_ids: List[int]
+
+class ParticipantsAddRequest(BaseModel):
+    member_ids: List[int]
+
+class ParticipationUpdateRequest(BaseModel):
+    muted: bool
@@ -0,0 +1,97 @@
+import os
+import uuid
+import asyncio
+import hashlib
+from typing import Optional
+from botocore.exceptions import ClientError
+from app.utils.s3 import s3_client, AWS_S3_BUCKET_NAME
+
+# "s3": objects in the bucket configured for app.utils.s3, under BLOB_S3_PREFIX;
+# shared by every replica, so it is the default. "local": sharded files under
+# BLOB_LOCAL_ROOT, for a single process or replicas that mount one shared volume.
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "s3")
+BLOB_LOCAL_ROOT = os.getenv("BLOB_LOCAL_ROOT", "./blobs")
+BLOB_S3_PREFIX = os.getenv("BLOB_S3_PREFIX", "blobs")
+
+
+def blob_key(data: bytes) -> str:
+    """Content address: identical bytes share one key and are stored once."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class LocalBlobStore:
+    """
+    Blobs as files at <root>/<key[:2]>/<key[2:4]>/<key>. A write goes to a
+    temporary file in the same directory and is renamed into place, so
+    readers never see a partial blob.
+    """
+
+    def __init__(self, root: str = BLOB_LOCAL_ROOT):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def _put(self, key: str, data: bytes):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def put(self, key: str, data: bytes, mime: str):
+        await asyncio.to_thread(self._put, key, data)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+
+class S3BlobStore:
+    """Blobs as S3 objects <prefix>/<key>, through the shared client in app.utils.s3."""
+
+    def __init__(self, prefix: str = BLOB_S3_PREFIX):
+        self.prefix = prefix
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}"
+
+    def _put(self, key: str, data: bytes, mime: str):
+        try:
+            # Already stored: same key means same bytes
+            s3_client.head_object(Bucket=AWS_S3_BUCKET_NAME, Key=self._object_key(key))
+            return
+        except ClientError:
+            pass
+        s3_client.put_object(Bucket=AWS_S3_BUCKET_NAME, Key=self._object_key(key), Body=data, ContentType=mime)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        try:
+            obj = s3_client.get_object(Bucket=AWS_S3_BUCKET_NAME, Key=self._object_key(key))
+        except ClientError:
+            return None
+        return obj["Body"].read()
+
+    async def put(self, key: str, data: bytes, mime: str):
+        await asyncio.to_thread(self._put, key, data, mime)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+
+blob_store = S3BlobStore() if BLOB_BACKEND == "s3" else LocalBlobStore()
@@ -1,13 +1,18 @@
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 import uuid
 import base64
-from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine, Base
-from app.models.orm import User, Session as DBSession, Post, Comment, File, Conversation, Message
-
-# Initialize tables (Creating tables if not exist)
-Base.metadata.create_all(bind=engine)
+from sqlalchemy import bindparam, delete, func, insert, select, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, joinedload
+from app.database import SessionLocal
+from app.models.orm import User, Session as DBSession, Post, Comment, File, Conversation, Message, ConversationParticipant, post_likes
+from app.utils.cursor import encode_cursor
+from app.utils.invalidation import bus
+from app.storage.blobs import blob_key, blob_store
+
+# Characters of the last message kept on the conversation row for the inbox
+PREVIEW_LENGTH = 100
 
 def now_kst():
     return datetime.utcnow() + timedelta(hours=9)
@@ -18,10 +23,26 @@ def now_iso() -> str:
 def new_id() -> str:
     return str(uuid.uuid4())
 
-# Helper to get DB session
-def get_db_session():
+# Helper to get DB session.
+# Storage functions take the caller's session and only flush: HTTP requests get
+# one session from app.database.get_db and the controller commits it once, so
+# rows loaded earlier in the request come from the identity map.
+# Code outside a request (WebSocket, background writers) opens its own.
+# AsyncSession cannot lazy-load, so relationships read by the to_*_dict helpers
+# are loaded eagerly by the query that fetches the row.
+def get_db_session() -> AsyncSession:
     return SessionLocal()
 
+# Relationships every loaded Post carries (see to_post_dict / get_post)
+POST_LOAD = (joinedload(Post.author),)
+
+async def _active(db: AsyncSession, model, row_id, options=()):
+    # Primary-key lookup that hits the identity map before the database
+    row = await db.get(model, row_id, options=options)
+    if row is None or row.deleted_at is not None:
+        return None
+    return row
+
 # ---------- Helper: Convert ORM to Dict ----------
 def to_user_dict(u: User) -> dict:
     if not u:
@@ -36,13 +57,18 @@ def to_user_dict(u: User) -> dict:
         "updatedAt": u.updated_at.isoformat(),
     }
 
-def to_post_dict(p: Post, user_id_for_like: Optional[int] = None) -> dict:
+def to_user_summary(u: User) -> dict:
+    # Public author fields embedded in post and comment listings
+    return {
+        "userId": u.id,
+        "nickname": u.nickname,
+        "profileImageUrl": u.profile_image_url,
+    }
+
+def to_post_dict(p: Post) -> dict:
     if not p:
         return None
     
-    # Calculate likes count
-    like_count = len(p.likers)
-    
     return {
         "postId": p.id,
         "title": p.title,
@@ -50,11 +76,43 @@ def to_post_dict(p: Post, user_id_for_like: Optional[int] = None) -> dict:
         "authorUserId": p.author_user_id,
         "fileUrl": p.file_url,
         "hits": p.hits,
-        "likeCount": like_count,
+        "likeCount": p.like_count,
+        "uniqueViews": p.unique_views,
+        "commentCount": p.comment_count,
         "createdAt": p.created_at.isoformat(),
         "updatedAt": p.updated_at.isoformat(),
     }
 
+# Response field → column, for list_posts projections
+POST_COLUMNS = {
+    "postId": Post.id,
+    "title": Post.title,
+    "content": Post.content,
+    "authorUserId": Post.author_user_id,
+    "fileUrl": Post.file_url,
+    "hits": Post.hits,
+    "likeCount": Post.like_count,
+    "uniqueViews": Post.unique_views,
+    "commentCount": Post.comment_count,
+    "createdAt": Post.created_at,
+    "updatedAt": Post.updated_at,
+}
+
+def to_message_dict(m: Message, conv: Optional[Conversation] = None) -> dict:
+    # A message is read once the recipient's watermark has reached its id
+    is_read = False
+    if conv is not None and not conv.is_group:
+        recipient_watermark = conv.user2_last_read_id if m.sender_id == conv.user1_id else conv.user1_last_read_id
+        is_read = m.id <= recipient_watermark
+    return {
+        "id": m.id,
+        "conversation_id": m.conversation_id,
+        "sender_id": m.sender_id,
+        "content": m.content,
+        "is_read": is_read,
+        "created_at": m.created_at.isoformat()
+    }
+
 def to_comment_dict(c: Comment) -> dict:
     if not c:
         return None
@@ -69,291 +127,407 @@ def to_comment_dict(c: Comment) -> dict:
 
 
 # ---------- User functions ----------
-def create_user(email: str, pw_hash: str, nickname: str, profile_url: Optional[str]):
-    db = get_db_session()
-    try:
-        user = User(
-            email=email,
-            password_hash=pw_hash,
-            nickname=nickname,
-            profile_image_url=profile_url
+async def create_user(db: AsyncSession, email: str, pw_hash: str, nickname: str, profile_url: Optional[str]):
+    user = User(
+        email=email,
+        password_hash=pw_hash,
+        nickname=nickname,
+        profile_image_url=profile_url
+    )
+    db.add(user)
+    await db.flush()
+    bus.defer(db, "user_email", email)
+    bus.defer(db, "user_nickname", nickname)
+    return to_user_dict(user)
+
+async def get_user(db: AsyncSession, user_id: int) -> Optional[dict]:
+    return to_user_dict(await _active(db, User, user_id))
+
+async def get_user_summaries(db: AsyncSession, user_ids: List[int]) -> Dict[int, dict]:
+    # Batched author loader: ids already resolved in this session (one HTTP
+    # request) come from session.info, the rest from a single IN query.
+    # Deleted or unknown users are left out.
+    cache: Dict[int, Optional[dict]] = db.info.setdefault("user_summaries", {})
+    missing = {uid for uid in user_ids if uid not in cache}
+    if missing:
+        users = await db.scalars(select(User).where(User.id.in_(missing), User.deleted_at.is_(None)))
+        for u in users:
+            cache[u.id] = to_user_summary(u)
+        for uid in missing:
+            cache.setdefault(uid, None)
+    return {uid: cache[uid] for uid in user_ids if cache[uid] is not None}
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[dict]:
+    user = await db.scalar(select(User).where(User.email == email, User.deleted_at.is_(None)))
+    return to_user_dict(user)
+
+async def get_user_by_nickname(db: AsyncSession, nickname: str) -> Optional[dict]:
+    user = await db.scalar(select(User).where(User.nickname == nickname, User.deleted_at.is_(None)))
+    return to_user_dict(user)
+
+async def count_active_users(db: AsyncSession) -> int:
+    return await db.scalar(select(func.count()).select_from(User).where(User.deleted_at.is_(None)))
+
+async def stream_active_user_names(db: AsyncSession):
+    # (email, nickname) of every active user, fetched in chunks
+    result = await db.stream(
+        select(User.email, User.nickname).where(User.deleted_at.is_(None))
+        .execution_options(yield_per=5000)
+    )
+    async for email, nickname in result:
+        yield email, nickname
+
+async def get_active_user_ids(db: AsyncSession, user_ids: List[int]) -> List[int]:
+    rows = await db.scalars(select(User.id).where(User.id.in_(user_ids), User.deleted_at.is_(None)))
+    return list(rows)
+
+async def update_user_nickname(db: AsyncSession, user_id: int, nickname: str):
+    user = await db.get(User, user_id)
+    if user:
+        user.nickname = nickname
+        user.updated_at = now_kst()
+        await db.flush()
+        bus.defer(db, "user", user_id)
+        bus.defer(db, "user_nickname", nickname)
+
+async def update_user_password(db: AsyncSession, user_id: int, password_hash: str):
+    user = await db.get(User, user_id)
+    if user:
+        user.password_hash = password_hash
+        user.updated_at = now_kst()
+        await db.flush()
+        bus.defer(db, "user", user_id)
+
+async def update_user_profile_image(db: AsyncSession, user_id: int, profile_url: str):
+    user = await db.get(User, user_id)
+    if user:
+        user.profile_image_url = profile_url
+        user.updated_at = now_kst()
+        await db.flush()
+        bus.defer(db, "user", user_id)
+
+async def delete_user(db: AsyncSession, user_id: int):
+    user = await db.get(User, user_id)
+    if user:
+        # Soft Delete: Set deleted_at AND change unique fields (email, nickname)
+        # to allow re-signup with the same email/nickname.
+        ts = int(now_kst().timestamp())
+        user.deleted_at = now_kst()
+        user.email = f"del_{ts}_{user.email}"
+        # Nickname max 50 chars. Ensure uniqueness but fit in length.
+        user.nickname = f"del_{ts}_{user.nickname}"[:50]
+        
+        # Sessions are removed by the caller through app.storage.sessions,
+        # whichever backend holds them
+        bus.defer(db, "user", user_id)
+        
+        # Cascade Soft Delete: Posts
+        await db.execute(
+            update(Post).where(Post.author_user_id == user_id).values(deleted_at=now_kst())
+            .execution_options(synchronize_session=False)
         )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-        return to_user_dict(user)
-    finally:
-        db.close()
-
-def get_user(user_id: int) -> Optional[dict]:
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
-        return to_user_dict(user)
-    finally:
-        db.close()
-
-def get_user_by_email(email: str) -> Optional[dict]:
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.email == email, User.deleted_at.is_(None)).first()
-        return to_user_dict(user)
-    finally:
-        db.close()
-
-def get_user_by_nickname(nickname: str) -> Optional[dict]:
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.nickname == nickname, User.deleted_at.is_(None)).first()
-        return to_user_dict(user)
-    finally:
-        db.close()
-
-def update_user_nickname(user_id: int, nickname: str):
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.id == user_id).first()
-        if user:
-            user.nickname = nickname
-            user.updated_at = now_kst()
-            db.commit()
-    finally:
-        db.close()
-
-def update_user_password(user_id: int, password_hash: str):
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.id == user_id).first()
-        if user:
-            user.password_hash = password_hash
-            user.updated_at = now_kst()
-            db.commit()
-    finally:
-        db.close()
-
-def update_user_profile_image(user_id: int, profile_url: str):
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.id == user_id).first()
-        if user:
-            user.profile_image_url = profile_url
-            user.updated_at = now_kst()
-            db.commit()
-    finally:
-        db.close()
-
-def delete_user(user_id: int):
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.id == user_id).first()
-        if user:
-            # Soft Delete: Set deleted_at AND change unique fields (email, nickname)
-            # to allow re-signup with the same email/nickname.
-            ts = int(now_kst().timestamp())
-            user.deleted_at = now_kst()
-            user.email = f"del_{ts}_{user.email}"
-            # Nickname max 50 chars. Ensure uniqueness but fit in length.
-            user.nickname = f"del_{ts}_{user.nickname}"[:50]
-            
-            # Delete all sessions for this user so they are logged out everywhere
-            db.query(DBSession).filter(DBSession.user_id == user_id).delete()
-            
-            # Cascade Soft Delete: Posts
-            db.query(Post).filter(Post.author_user_id == user_id).update({Post.deleted_at: now_kst()}, synchronize_session=False)
-
-            # Cascade Soft Delete: Comments
-            db.query(Comment).filter(Comment.author_user_id == user_id).update({Comment.deleted_at: now_kst()}, synchronize_session=False)
-            
-            db.commit()
-    finally:
-        db.close()
+
+        # Cascade Soft Delete: Comments, taking them off each post's comment_count first
+        live_comments = (Comment.author_user_id == user_id, Comment.deleted_at.is_(None))
+        removed = select(func.count()).select_from(Comment)\
+            .where(Comment.post_id == Post.id, *live_comments).correlate(Post).scalar_subquery()
+        await db.execute(
+            update(Post)
+            .where(Post.id.in_(select(Comment.post_id).where(*live_comments)))
+            .values(comment_count=Post.comment_count - removed)
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            update(Comment).where(*live_comments).values(deleted_at=now_kst())
+            .execution_options(synchronize_session=False)
+        )
+        
+        await db.flush()
 
 # ---------- Session functions ----------
-def create_session(user_id: int) -> str:
-    db = get_db_session()
-    try:
-        sid = new_id()
-        session = DBSession(session_id=sid, user_id=user_id)
-        db.add(session)
-        db.commit()
-        return sid
-    finally:
-        db.close()
-
-def delete_session(session_id: str):
-    db = get_db_session()
-    try:
-        session = db.query(DBSession).filter(DBSession.session_id == session_id).first()
-        if session:
-            db.delete(session)
-            db.commit()
-    finally:
-        db.close()
-
-def session_user(session_id: str) -> Optional[dict]:
-    db = get_db_session()
-    try:
-        session = db.query(DBSession).filter(DBSession.session_id == session_id).first()
-        # Ensure user exists AND is not deleted
-        if session and session.user and not session.user.deleted_at:
-            return to_user_dict(session.user)
+# Session.info flag: session_user moved an expiry and the caller should commit
+SESSION_SLID_KEY = "session_slid"
+
+async def create_session(db: AsyncSession, user_id: int, ttl: int) -> str:
+    sid = new_id()
+    session = DBSession(session_id=sid, user_id=user_id, expires_at=now_kst() + timedelta(seconds=ttl))
+    db.add(session)
+    await db.flush()
+    return sid
+
+async def delete_session(db: AsyncSession, session_id: str):
+    session = await db.get(DBSession, session_id)
+    if session:
+        await db.delete(session)
+        await db.flush()
+        bus.defer(db, "session", session_id)
+
+async def delete_user_sessions(db: AsyncSession, user_id: int):
+    # Log the user out everywhere
+    await db.execute(delete(DBSession).where(DBSession.user_id == user_id))
+    bus.defer(db, "user", user_id)
+
+async def session_user(db: AsyncSession, session_id: str, ttl: Optional[int] = None) -> Optional[dict]:
+    # Loads the user into the request's identity map for later lookups
+    session = await db.get(DBSession, session_id, options=[joinedload(DBSession.user)])
+    now = now_kst()
+    if session and session.expires_at is not None and session.expires_at <= now:
         return None
-    finally:
-        db.close()
+    # Ensure user exists AND is not deleted
+    if not (session and session.user and not session.user.deleted_at):
+        return None
+    # Sliding expiry, written at most once per half TTL
+    if ttl is not None and (session.expires_at is None or session.expires_at - now < timedelta(seconds=ttl / 2)):
+        session.expires_at = now + timedelta(seconds=ttl)
+        await db.flush()
+        db.info[SESSION_SLID_KEY] = True
+    return to_user_dict(session.user)
+
+async def take_session_user_id(db: AsyncSession, session_id: str) -> Optional[int]:
+    # Removes a live DB session row and returns its user id (used to move
+    # sessions to another backend). Legacy rows without an expiry are live,
+    # as in session_user.
+    session = await db.get(DBSession, session_id)
+    if not session:
+        return None
+    live = session.expires_at is None or session.expires_at > now_kst()
+    await db.delete(session)
+    await db.flush()
+    return session.user_id if live else None
+
+async def expire_legacy_sessions(db: AsyncSession, ttl: int, limit: int) -> int:
+    # One sweeper batch: give legacy rows (no expiry) a full TTL from now,
+    # so the sweeper can retire them without logging anyone out early
+    sids = list(await db.scalars(
+        select(DBSession.session_id).where(DBSession.expires_at.is_(None)).limit(limit)
+    ))
+    if sids:
+        await db.execute(
+            update(DBSession).where(DBSession.session_id.in_(sids))
+            .values(expires_at=now_kst() + timedelta(seconds=ttl))
+        )
+    return len(sids)
+
+async def delete_expired_sessions(db: AsyncSession, limit: int) -> int:
+    # One sweeper batch: rows past their expiry
+    sids = list(await db.scalars(
+        select(DBSession.session_id).where(DBSession.expires_at < now_kst()).limit(limit)
+    ))
+    if sids:
+        await db.execute(delete(DBSession).where(DBSession.session_id.in_(sids)))
+    return len(sids)
 
 # ---------- Post functions ----------
-def create_post(title: str, content: str, author_user_id: int, file_url: Optional[str]):
-    db = get_db_session()
-    try:
-        post = Post(
-            title=title,
-            content=content,
-            author_user_id=author_user_id,
-            file_url=file_url
-        )
-        db.add(post)
-        db.commit()
-        db.refresh(post)
-        return to_post_dict(post)
-    finally:
-        db.close()
-
-def update_post(post_id: int, title: str, content: str, file_url: Optional[str]):
-    db = get_db_session()
-    try:
-        post = db.query(Post).filter(Post.id == post_id).first()
-        if post:
-            post.title = title
-            post.content = content
-            post.file_url = file_url
-            db.commit()
-    finally:
-        db.close()
-
-def delete_post(post_id: int):
-    db = get_db_session()
-    try:
-        post = db.query(Post).filter(Post.id == post_id).first()
-        if post:
-            post.deleted_at = now_kst()
-            db.commit()
-    finally:
-        db.close()
-
-def get_post(post_id: int, increase_hits: bool = True) -> Optional[dict]:
-    db = get_db_session()
-    try:
-        post = db.query(Post).join(User, Post.author_user_id == User.id)\
-            .filter(Post.id == post_id, Post.deleted_at.is_(None), User.deleted_at.is_(None)).first()
-        if not post:
-            return None
-        
-        if increase_hits:
-            post.hits += 1
-            db.commit()
-            db.refresh(post)
-            
-        return to_post_dict(post)
-    finally:
-        db.close()
-
-def list_posts(offset: int, limit: int) -> List[dict]:
-    db = get_db_session()
-    try:
-        posts = db.query(Post).join(User, Post.author_user_id == User.id)\
-            .filter(Post.deleted_at.is_(None), User.deleted_at.is_(None))\
-            .order_by(Post.created_at.desc()).offset(offset).limit(limit).all()
-        return [to_post_dict(p) for p in posts]
-    finally:
-        db.close()
-
-def like_post(post_id: int, user_id: int) -> int:
-    db = get_db_session()
-    try:
-        post = db.query(Post).filter(Post.id == post_id, Post.deleted_at.is_(None)).first()
-        user = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
-        
-        if post and user:
-            if user not in post.likers:
-                post.likers.append(user)
-                db.commit()
-                db.refresh(post)
-        return len(post.likers) if post else 0
-    finally:
-        db.close()
-
-def unlike_post(post_id: int, user_id: int) -> int:
-    db = get_db_session()
-    try:
-        post = db.query(Post).filter(Post.id == post_id, Post.deleted_at.is_(None)).first()
-        user = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
-        
-        if post and user:
-            if user in post.likers:
-                post.likers.remove(user)
-                db.commit()
-                db.refresh(post)
-        return len(post.likers) if post else 0
-    finally:
-        db.close()
+async def create_post(db: AsyncSession, title: str, content: str, author_user_id: int, file_url: Optional[str]):
+    post = Post(
+        title=title,
+        content=content,
+        author_user_id=author_user_id,
+        file_url=file_url
+    )
+    db.add(post)
+    await db.flush()
+    return to_post_dict(post)
+
+async def update_post(db: AsyncSession, post_id: int, title: str, content: str, file_url: Optional[str]):
+    post = await db.get(Post, post_id, options=POST_LOAD)
+    if post:
+        post.title = title
+        post.content = content
+        post.file_url = file_url
+        await db.flush()
+
+async def delete_post(db: AsyncSession, post_id: int):
+    post = await db.get(Post, post_id, options=POST_LOAD)
+    if post:
+        post.deleted_at = now_kst()
+        await db.flush()
+
+async def get_post(db: AsyncSession, post_id: int) -> Optional[dict]:
+    # hits is the persisted count; views buffered by app.storage.view_counter
+    # are added by the caller
+    post = await _active(db, Post, post_id, POST_LOAD)
+    if not post or post.author.deleted_at is not None:
+        return None
+    return to_post_dict(post)
+
+async def post_exists(db: AsyncSession, post_id: int) -> bool:
+    # Same visibility rule as get_post, without loading the row
+    return await db.scalar(
+        select(Post.id).join(User, Post.author_user_id == User.id)
+        .where(Post.id == post_id, Post.deleted_at.is_(None), User.deleted_at.is_(None))
+    ) is not None
+
+async def add_post_hits(db: AsyncSession, deltas: Dict[int, int]):
+    # One executemany UPDATE ... SET hits = hits + n for a batch of posts
+    if not deltas:
+        return
+    posts = Post.__table__
+    await db.execute(
+        update(posts).where(posts.c.id == bindparam("pid")).values(hits=posts.c.hits + bindparam("n")),
+        [{"pid": pid, "n": n} for pid, n in deltas.items()]
+    )
+
+async def add_post_unique_views(db: AsyncSession, deltas: Dict[int, int]):
+    # Same shape as add_post_hits, for a folded unique-viewer window
+    if not deltas:
+        return
+    posts = Post.__table__
+    await db.execute(
+        update(posts).where(posts.c.id == bindparam("pid")).values(unique_views=posts.c.unique_views + bindparam("n")),
+        [{"pid": pid, "n": n} for pid, n in deltas.items()]
+    )
+
+async def list_posts(db: AsyncSession, offset: int, limit: int,
+                     before: Optional[Tuple[datetime, int]] = None,
+                     fields: Optional[List[str]] = None,
+                     excerpt: Optional[int] = None) -> List[dict]:
+    # `before` is the (created_at, id) keyset position of the previous page's
+    # last post; it replaces the offset so deep pages cost the same as page 1.
+    # `fields` (POST_COLUMNS keys) and `excerpt` switch to a column projection:
+    # only those columns (plus postId/createdAt for the cursor) are selected,
+    # and an excerpt is cut by the database, so long content never leaves it.
+    projected = fields is not None or excerpt is not None
+    if projected:
+        if fields is None:
+            fields = [f for f in POST_COLUMNS if f != "content"]
+        names = ["postId", "createdAt"] + [f for f in fields if f not in ("postId", "createdAt")]
+        cols = [POST_COLUMNS[f].label(f) for f in names]
+        if excerpt is not None:
+            cols.append(func.substr(Post.content, 1, excerpt).label("excerpt"))
+        q = select(*cols)
+    else:
+        q = select(Post)
+    q = q.join(User, Post.author_user_id == User.id)\
+        .where(Post.deleted_at.is_(None), User.deleted_at.is_(None))
+    if before:
+        ts, pid = before
+        # The redundant created_at <= ts bound lets the index seek to the cursor
+        # instead of scanning from the newest post and filtering
+        q = q.where(Post.created_at <= ts, (Post.created_at < ts) | (Post.id < pid))
+    else:
+        q = q.offset(offset)
+    q = q.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit)
+    if not projected:
+        return [to_post_dict(p) for p in await db.scalars(q)]
+    return [
+        {k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()}
+        for row in (await db.execute(q)).mappings()
+    ]
+
+async def _add_like_count(db: AsyncSession, post_id: int, delta: int):
+    await db.execute(update(Post).where(Post.id == post_id).values(like_count=Post.like_count + delta))
+
+async def like_post(db: AsyncSession, post_id: int, user_id: int) -> int:
+    # Idempotent: the counter only moves when the (post, user) row is new
+    result = await db.execute(
+        insert(post_likes).values(post_id=post_id, user_id=user_id)
+        .prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+    )
+    if result.rowcount:
+        await _add_like_count(db, post_id, 1)
+    return await db.scalar(select(Post.like_count).where(Post.id == post_id)) or 0
+
+async def unlike_post(db: AsyncSession, post_id: int, user_id: int) -> int:
+    result = await db.execute(
+        delete(post_likes).where(post_likes.c.post_id == post_id, post_likes.c.user_id == user_id)
+    )
+    if result.rowcount:
+        await _add_like_count(db, post_id, -1)
+    return await db.scalar(select(Post.like_count).where(Post.id == post_id)) or 0
+
+async def liked_post_ids(db: AsyncSession, user_id: int, post_ids: List[int]) -> set:
+    # Which of a page of posts the user has liked, in one post_likes lookup
+    if not post_ids:
+        return set()
+    rows = await db.scalars(
+        select(post_likes.c.post_id)
+        .where(post_likes.c.user_id == user_id, post_likes.c.post_id.in_(post_ids))
+    )
+    return set(rows)
+
+async def reconcile_like_counts(db: AsyncSession, start_id: int, end_id: int) -> int:
+    # Recompute like_count from post_likes for posts in [start_id, end_id);
+    # returns how many rows had drifted
+    actual = select(func.count()).select_from(post_likes)\
+        .where(post_likes.c.post_id == Post.id).correlate(Post).scalar_subquery()
+    result = await db.execute(
+        update(Post)
+        .where(Post.id >= start_id, Post.id < end_id, Post.like_count != actual)
+        .values(like_count=actual)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+async def reconcile_comment_counts(db: AsyncSession, start_id: int, end_id: int) -> int:
+    # Recompute comment_count from live comments for posts in [start_id, end_id);
+    # returns how many rows had drifted
+    actual = select(func.count()).select_from(Comment)\
+        .where(Comment.post_id == Post.id, Comment.deleted_at.is_(None)).correlate(Post).scalar_subquery()
+    result = await db.execute(
+        update(Post)
+        .where(Post.id >= start_id, Post.id < end_id, Post.comment_count != actual)
+        .values(comment_count=actual)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+async def max_post_id(db: AsyncSession) -> int:
+    return await db.scalar(select(func.max(Post.id))) or 0
 
 
 # ---------- Comment functions ----------
-def create_comment(post_id: int, content: str, author_user_id: int) -> dict:
-    db = get_db_session()
-    try:
-        comment = Comment(
-            post_id=post_id,
-            content=content,
-            author_user_id=author_user_id
-        )
-        db.add(comment)
-        db.commit()
-        db.refresh(comment)
-        return to_comment_dict(comment)
-    finally:
-        db.close()
-
-def get_comment(comment_id: int) -> Optional[dict]:
-    db = get_db_session()
-    try:
-        comment = db.query(Comment).filter(Comment.id == comment_id, Comment.deleted_at.is_(None)).first()
-        return to_comment_dict(comment)
-    finally:
-        db.close()
-
-def update_comment(comment_id: int, content: str):
-    db = get_db_session()
-    try:
-        comment = db.query(Comment).filter(Comment.id == comment_id, Comment.deleted_at.is_(None)).first()
-        if comment:
-            comment.content = content
-            db.commit()
-    finally:
-        db.close()
-
-def delete_comment(comment_id: int):
-    db = get_db_session()
-    try:
-        comment = db.query(Comment).filter(Comment.id == comment_id).first()
-        if comment:
-            comment.deleted_at = now_kst()
-            db.commit()
-    finally:
-        db.close()
-
-def list_comments(post_id: int) -> List[dict]:
-    db = get_db_session()
-    try:
-        comments = db.query(Comment).join(User, Comment.author_user_id == User.id)\
-            .filter(Comment.post_id == post_id, Comment.deleted_at.is_(None), User.deleted_at.is_(None))\
-            .order_by(Comment.created_at.asc()).all()
-        return [to_comment_dict(c) for c in comments]
-    finally:
-        db.close()
+async def _add_comment_count(db: AsyncSession, post_id: int, delta: int):
+    await db.execute(update(Post).where(Post.id == post_id).values(comment_count=Post.comment_count + delta))
+
+async def create_comment(db: AsyncSession, post_id: int, content: str, author_user_id: int) -> dict:
+    comment = Comment(
+        post_id=post_id,
+        content=content,
+        author_user_id=author_user_id
+    )
+    db.add(comment)
+    await db.flush()
+    await _add_comment_count(db, post_id, 1)
+    # created_at/updated_at are server defaults
+    await db.refresh(comment)
+    return to_comment_dict(comment)
+
+async def get_comment(db: AsyncSession, comment_id: int) -> Optional[dict]:
+    return to_comment_dict(await _active(db, Comment, comment_id))
+
+async def update_comment(db: AsyncSession, comment_id: int, content: str):
+    comment = await _active(db, Comment, comment_id)
+    if comment:
+        comment.content = content
+        await db.flush()
+
+async def delete_comment(db: AsyncSession, comment_id: int):
+    # Conditional UPDATE: of two concurrent deletes only one matches the row,
+    # so the counter moves once
+    result = await db.execute(
+        update(Comment).where(Comment.id == comment_id, Comment.deleted_at.is_(None))
+        .values(deleted_at=now_kst()).execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        post_id = await db.scalar(select(Comment.post_id).where(Comment.id == comment_id))
+        await _add_comment_count(db, post_id, -1)
+
+async def list_comments(db: AsyncSession, post_id: int, limit: int,
+                        after: Optional[Tuple[datetime, int]] = None) -> List[dict]:
+    # Oldest first; `after` is the (created_at, id) keyset position of the
+    # previous page's last comment
+    q = select(Comment).join(User, Comment.author_user_id == User.id)\
+        .where(Comment.post_id == post_id, Comment.deleted_at.is_(None), User.deleted_at.is_(None))
+    if after:
+        ts, cid = after
+        # created_at >= ts is redundant but lets ix_comments_post_page seek to the cursor
+        q = q.where(Comment.created_at >= ts, (Comment.created_at > ts) | (Comment.id > cid))
+    comments = await db.scalars(q.order_by(Comment.created_at.asc(), Comment.id.asc()).limit(limit))
+    return [to_comment_dict(c) for c in comments]
 
 # ---------- File functions ----------
-def save_file(base64_str: str) -> str:
+async def save_file(db: AsyncSession, base64_str: str) -> str:
     # 1. Split header/data: "data:image/png;base64,....."
     if "," in base64_str:
         header, data_str = base64_str.split(",", 1)
@@ -368,156 +542,365 @@ def save_file(base64_str: str) -> str:
     # 2. Decode
     binary_data = base64.b64decode(data_str)
 
-    # 3. Save to DB
+    # 3. Store the bytes once per content; the files row only points at them.
+    # A blob written for a transaction that rolls back is simply unreferenced.
+    key = blob_key(binary_data)
+    await blob_store.put(key, binary_data, mime)
+    existing = await db.scalar(select(File.id).where(File.blob_key == key, File.mime_type == mime).limit(1))
+    if existing:
+        return existing
     fid = new_id()
-    db = get_db_session()
-    try:
-        f = File(id=fid, mime_type=mime, data=binary_data)
-        db.add(f)
-        db.commit()
-        return fid
-    finally:
-        db.close()
-
-def get_file_data(file_id: str):
-    db = get_db_session()
-    try:
-        f = db.query(File).filter(File.id == file_id).first()
-        if f:
-            return f.data, f.mime_type
+    f = File(id=fid, mime_type=mime, blob_key=key, size=len(binary_data))
+    db.add(f)
+    await db.flush()
+    return fid
+
+async def get_file_data(db: AsyncSession, file_id: str):
+    row = (await db.execute(select(File.mime_type, File.blob_key).where(File.id == file_id))).first()
+    if row is None:
         return None, None
-    finally:
-        db.close()
+    mime, key = row
+    if key is None:
+        # Not migrated yet
+        data = await db.scalar(select(File.data).where(File.id == file_id))
+    else:
+        data = await blob_store.get(key)
+    return (data, mime) if data is not None else (None, None)
+
+async def list_inline_files(db: AsyncSession, after_id: str, limit: int) -> List[Tuple[str, str, bytes]]:
+    # One migration batch: (id, mime, data) of rows still holding their bytes
+    rows = await db.execute(
+        select(File.id, File.mime_type, File.data)
+        .where(File.blob_key.is_(None), File.id > after_id)
+        .order_by(File.id).limit(limit)
+    )
+    return [tuple(r) for r in rows]
+
+async def set_file_blobs(db: AsyncSession, blobs: Dict[str, Tuple[str, int]]):
+    # file id → (blob key, size); the inline bytes are dropped in the same UPDATE
+    if not blobs:
+        return
+    files = File.__table__
+    await db.execute(
+        update(files).where(files.c.id == bindparam("fid"))
+        .values(blob_key=bindparam("key"), size=bindparam("n"), data=None),
+        [{"fid": fid, "key": key, "n": n} for fid, (key, n) in blobs.items()]
+    )
 
 # ---------- Chat functions ----------
-def get_conversations(user_id: int) -> List[dict]:
-    db = get_db_session()
-    try:
-        convs = db.query(Conversation).filter(
-            (Conversation.user1_id == user_id) | (Conversation.user2_id == user_id)
-        ).all()
-        
-        result = []
-        for c in convs:
-            other_user = c.user2 if c.user1_id == user_id else c.user1
-            if not other_user or other_user.deleted_at:
-                continue
-                
-            last_message = None
-            last_message_at = c.updated_at
-            unread_count = 0
-            
-            if c.messages:
-                last_msg = c.messages[-1]
-                last_message = last_msg.content
-                last_message_at = last_msg.created_at
-                
-                # Count unread
-                for m in c.messages:
-                    if m.sender_id != user_id and not m.is_read:
-                        unread_count += 1
-                        
-            result.append({
-                "id": c.id,
-                "other_user_id": other_user.id,
-                "other_user_nickname": other_user.nickname,
-                "other_user_profile": other_user.profile_image_url,
-                "last_message": last_message,
-                "last_message_at": last_message_at,
-                "unread_count": unread_count
-            })
-            
-        # Sort by last_message_at desc safely
-        def safe_date(d):
-            if isinstance(d, datetime): return d
-            if isinstance(d, str):
-                try: return datetime.fromisoformat(str(d).replace('Z', '+00:00'))
-                except ValueError: return datetime.min
-            return datetime.min
-            
-        result.sort(key=lambda x: safe_date(x["last_message_at"]), reverse=True)
-        return result
-    finally:
-        db.close()
-
-def get_or_create_conversation(user1_id: int, user2_id: int) -> int:
+def _inbox_window(q, limit: Optional[int], before: Optional[Tuple[datetime, int]]):
+    if before:
+        ts, cid = before
+        # last_message_at <= ts is redundant but lets the activity index seek to the cursor
+        q = q.where(
+            Conversation.last_message_at <= ts,
+            (Conversation.last_message_at < ts) | (Conversation.id < cid),
+        )
+    q = q.order_by(Conversation.last_message_at.desc(), Conversation.id.desc())
+    if limit:
+        q = q.limit(limit)
+    return q
+
+async def _inbox_page(db: AsyncSession, q, limit: Optional[int], before: Optional[Tuple[datetime, int]]):
+    return (await db.execute(_inbox_window(q, limit, before))).all()
+
+async def get_conversations(db: AsyncSession, user_id: int, limit: Optional[int] = None,
+                            before: Optional[Tuple[datetime, int]] = None) -> List[dict]:
+    # One query over the denormalized summary columns for direct conversations
+    # and one for group rooms, merged newest activity first.
+    # `before` is the (last_message_at, id) keyset position of the previous page.
+    # Direct conversations are a UNION ALL of the user1 and the user2 side, each
+    # read in order from its own ix_conversations_user{1,2}_activity index and
+    # cut at `limit`; only the merged (at most 2 × limit) rows are sorted.
+    sides = []
+    for mine, theirs in ((Conversation.user1_id, Conversation.user2_id),
+                         (Conversation.user2_id, Conversation.user1_id)):
+        side_user = aliased(User)
+        side = select(Conversation.id, side_user.id.label("other_id"))\
+            .join(side_user, side_user.id == theirs)\
+            .where(mine == user_id, side_user.deleted_at.is_(None))
+        sides.append(select(_inbox_window(side, limit, before).subquery()))
+    page = union_all(*sides).subquery()
+    other = aliased(User)
+    direct = select(Conversation, other)\
+        .join(page, page.c.id == Conversation.id)\
+        .join(other, other.id == page.c.other_id)
+
+    # Group unread counts compare message ids with the member's watermark
+    cp = ConversationParticipant
+    group_unread = select(func.count(Message.id)).where(
+        Message.conversation_id == Conversation.id,
+        Message.id > cp.last_read_id,
+        Message.sender_id != user_id
+    ).correlate(Conversation, cp).scalar_subquery()
+    groups = select(Conversation, cp, group_unread)\
+        .join(cp, cp.conversation_id == Conversation.id)\
+        .where(cp.user_id == user_id)
+
+    result = []
+    for c, other_user in await _inbox_page(db, direct, limit, before):
+        mine_is_user1 = c.user1_id == user_id
+        result.append({
+            "id": c.id,
+            "is_group": False,
+            "title": None,
+            "other_user_id": other_user.id,
+            "other_user_nickname": other_user.nickname,
+            "other_user_profile": other_user.profile_image_url,
+            "last_message": c.last_message_preview,
+            "last_message_at": c.last_message_at,
+            "unread_count": c.user1_unread_count if mine_is_user1 else c.user2_unread_count,
+            "muted": False,
+            "cursor": encode_cursor(c.last_message_at, c.id),
+        })
+    for c, p, unread in await _inbox_page(db, groups, limit, before):
+        result.append({
+            "id": c.id,
+            "is_group": True,
+            "title": c.title,
+            "other_user_id": None,
+            "other_user_nickname": None,
+            "other_user_profile": None,
+            "last_message": c.last_message_preview,
+            "last_message_at": c.last_message_at,
+            "unread_count": unread,
+            "muted": p.muted,
+            "cursor": encode_cursor(c.last_message_at, c.id),
+        })
+
+    result.sort(key=lambda x: (x["last_message_at"], x["id"]), reverse=True)
+    return result[:limit] if limit else result
+
+async def get_or_create_conversation(db: AsyncSession, user1_id: int, user2_id: int) -> int:
     # Ensure user1_id < user2_id for consistency
     u1, u2 = min(user1_id, user2_id), max(user1_id, user2_id)
-    db = get_db_session()
-    try:
-        conv = db.query(Conversation).filter(
-            Conversation.user1_id == u1,
-            Conversation.user2_id == u2
-        ).first()
+    conv = await db.scalar(select(Conversation).where(
+        Conversation.user1_id == u1,
+        Conversation.user2_id == u2
+    ))
+    
+    if not conv:
+        conv = Conversation(user1_id=u1, user2_id=u2)
+        db.add(conv)
+        await db.flush()
         
-        if not conv:
-            conv = Conversation(user1_id=u1, user2_id=u2)
-            db.add(conv)
-            db.commit()
-            db.refresh(conv)
-            
-        return conv.id
-    finally:
-        db.close()
-
-def get_messages(conversation_id: int, limit: int = 50) -> List[dict]:
-    db = get_db_session()
-    try:
-        messages = db.query(Message).filter(Message.conversation_id == conversation_id)\
-            .order_by(Message.created_at.desc()).limit(limit).all()
-            
-        result = []
-        for m in reversed(messages): # reverse to make it chronological
-            result.append({
-                "id": m.id,
-                "conversation_id": m.conversation_id,
-                "sender_id": m.sender_id,
-                "content": m.content,
-                "is_read": m.is_read,
-                "created_at": m.created_at.isoformat()
-            })
-        return result
-    finally:
-        db.close()
-
-def create_message(conversation_id: int, sender_id: int, content: str) -> dict:
-    db = get_db_session()
-    try:
-        msg = Message(
-            conversation_id=conversation_id,
-            sender_id=sender_id,
-            content=content
+    return conv.id
+
+async def get_user_conversation_members(db: AsyncSession, user_id: int) -> Dict[int, List[int]]:
+    # Only the id/participant columns: used to build the WebSocket routing index
+    rows = await db.execute(select(Conversation.id, Conversation.user1_id, Conversation.user2_id).where(
+        (Conversation.user1_id == user_id) | (Conversation.user2_id == user_id)
+    ))
+    return {cid: [u1, u2] for cid, u1, u2 in rows}
+
+async def get_user_group_ids(db: AsyncSession, user_id: int) -> List[int]:
+    rows = await db.scalars(select(ConversationParticipant.conversation_id)
+                            .where(ConversationParticipant.user_id == user_id))
+    return list(rows)
+
+async def get_conversation_members(db: AsyncSession, conversation_id: int) -> List[int]:
+    # The user1_id/user2_id pair, or every participant of a group room
+    row = (await db.execute(
+        select(Conversation.is_group, Conversation.user1_id, Conversation.user2_id)
+        .where(Conversation.id == conversation_id)
+    )).first()
+    if not row:
+        return []
+    if not row.is_group:
+        return [row.user1_id, row.user2_id]
+    rows = await db.scalars(select(ConversationParticipant.user_id)
+                            .where(ConversationParticipant.conversation_id == conversation_id))
+    return list(rows)
+
+async def is_group_conversation(db: AsyncSession, conversation_id: int) -> bool:
+    is_group = await db.scalar(select(Conversation.is_group).where(Conversation.id == conversation_id))
+    return bool(is_group)
+
+async def is_conversation_member(db: AsyncSession, conversation_id: int, user_id: int) -> bool:
+    # Primary-key point lookup instead of loading every conversation of the user;
+    # the participant join is also a primary-key lookup
+    cp = ConversationParticipant
+    row = await db.scalar(
+        select(Conversation.id)
+        .outerjoin(cp, (cp.conversation_id == Conversation.id) & (cp.user_id == user_id))
+        .where(
+            Conversation.id == conversation_id,
+            (Conversation.user1_id == user_id) | (Conversation.user2_id == user_id) | cp.user_id.isnot(None)
         )
-        db.add(msg)
-        
-        conv = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-        if conv:
-            conv.updated_at = now_kst()
-            
-        db.commit()
-        db.refresh(msg)
-        
-        return {
-            "id": msg.id,
-            "conversation_id": msg.conversation_id,
-            "sender_id": msg.sender_id,
-            "content": msg.content,
-            "is_read": msg.is_read,
-            "created_at": msg.created_at.isoformat()
-        }
-    finally:
-        db.close()
-
-def mark_messages_read(conversation_id: int, target_user_id: int):
-    # mark messages sent *to* target_user_id as read
-    db = get_db_session()
-    try:
-        db.query(Message).filter(
+    )
+    return row is not None
+
+# ---------- Group room functions ----------
+async def create_group_conversation(db: AsyncSession, owner_id: int, title: str, member_ids: List[int]) -> int:
+    conv = Conversation(is_group=True, title=title)
+    db.add(conv)
+    await db.flush()
+    db.add(ConversationParticipant(conversation_id=conv.id, user_id=owner_id, role="owner"))
+    db.add_all([
+        ConversationParticipant(conversation_id=conv.id, user_id=uid, role="member")
+        for uid in set(member_ids) if uid != owner_id
+    ])
+    await db.flush()
+    return conv.id
+
+async def get_participant(db: AsyncSession, conversation_id: int, user_id: int) -> Optional[dict]:
+    p = await db.get(ConversationParticipant, (conversation_id, user_id))
+    if not p:
+        return None
+    return {"conversation_id": p.conversation_id, "user_id": p.user_id, "role": p.role, "muted": p.muted}
+
+async def count_participants(db: AsyncSession, conversation_id: int) -> int:
+    return await db.scalar(select(func.count(ConversationParticipant.user_id))
+                           .where(ConversationParticipant.conversation_id == conversation_id))
+
+async def add_participants(db: AsyncSession, conversation_id: int, user_ids: List[int]) -> List[int]:
+    # Returns the user ids that were not members yet
+    existing = set(await db.scalars(select(ConversationParticipant.user_id).where(
+        ConversationParticipant.conversation_id == conversation_id,
+        ConversationParticipant.user_id.in_(user_ids)
+    )))
+    added = [uid for uid in dict.fromkeys(user_ids) if uid not in existing]
+    db.add_all([ConversationParticipant(conversation_id=conversation_id, user_id=uid) for uid in added])
+    await db.flush()
+    return added
+
+async def remove_participant(db: AsyncSession, conversation_id: int, user_id: int) -> bool:
+    result = await db.execute(delete(ConversationParticipant).where(
+        ConversationParticipant.conversation_id == conversation_id,
+        ConversationParticipant.user_id == user_id
+    ))
+    return result.rowcount > 0
+
+async def set_participant_muted(db: AsyncSession, conversation_id: int, user_id: int, muted: bool):
+    await db.execute(update(ConversationParticipant).where(
+        ConversationParticipant.conversation_id == conversation_id,
+        ConversationParticipant.user_id == user_id
+    ).values(muted=muted))
+
+async def get_messages(db: AsyncSession, conversation_id: int, limit: int = 50,
+                       before_id: Optional[int] = None, after_id: Optional[int] = None) -> List[dict]:
+    # Window of at most `limit` messages, always returned in chronological order:
+    #   after_id  → the oldest messages newer than after_id (reconnect delta)
+    #   before_id → the newest messages older than before_id (scroll back)
+    #   neither   → the newest messages
+    conv = await db.get(Conversation, conversation_id)
+    if not conv:
+        return []
+    q = select(Message).where(Message.conversation_id == conversation_id)
+    if after_id is not None:
+        messages = list(await db.scalars(q.where(Message.id > after_id).order_by(Message.id.asc()).limit(limit)))
+    else:
+        if before_id is not None:
+            q = q.where(Message.id < before_id)
+        messages = list(reversed((await db.scalars(q.order_by(Message.id.desc()).limit(limit))).all()))
+
+    return [to_message_dict(m, conv) for m in messages]
+
+async def create_message(db: AsyncSession, conversation_id: int, sender_id: int, content: str) -> Optional[dict]:
+    return (await create_messages(db, [(conversation_id, sender_id, content)]))[0]
+
+async def create_messages(db: AsyncSession, rows: List[Tuple[int, int, str]]) -> List[Optional[dict]]:
+    # Group commit: a batch of (conversation_id, sender_id, content) rows becomes
+    # one multi-row INSERT and one summary update per conversation; the caller
+    # commits the batch once.
+    # Returns a message dict per row (None if its conversation does not exist).
+    now = now_kst()
+    conv_ids = sorted({cid for cid, _, _ in rows})
+    # Lock the conversation rows (in id order, so concurrent batches cannot
+    # deadlock) so the summary columns follow message order
+    convs = {
+        c.id: c for c in await db.scalars(
+            select(Conversation).where(Conversation.id.in_(conv_ids))
+            .order_by(Conversation.id).with_for_update()
+        )
+    }
+
+    values = [
+        {"conversation_id": cid, "sender_id": sid, "content": content, "created_at": now}
+        for cid, sid, content in rows if cid in convs
+    ]
+    if values:
+        for v, mid in zip(values, await _insert_messages(db, values)):
+            v["id"] = mid
+
+    for v in values:
+        conv = convs[v["conversation_id"]]
+        conv.updated_at = now
+        conv.last_message_id = v["id"]
+        conv.last_message_preview = v["content"][:PREVIEW_LENGTH]
+        conv.last_message_at = now
+        # The other participant gets one more unread message (group rooms
+        # count unread from member watermarks instead)
+        if conv.is_group:
+            continue
+        if conv.user1_id == v["sender_id"]:
+            conv.user2_unread_count += 1
+        else:
+            conv.user1_unread_count += 1
+
+    await db.flush()
+
+    created = iter(values)
+    return [
+        to_message_dict(Message(**next(created))) if cid in convs else None
+        for cid, _, _ in rows
+    ]
+
+async def _insert_messages(db: AsyncSession, values: List[dict]) -> List[int]:
+    """Multi-row INSERT of messages; returns their ids in input order."""
+    dialect = db.bind.dialect
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = await db.execute(insert(Message).returning(Message.id, sort_by_parameter_order=True), values)
+        return list(result.scalars())
+    # MySQL has no RETURNING. A multi-row INSERT ... VALUES is a "simple insert":
+    # InnoDB reserves its auto-increment ids in one consecutive block and
+    # lastrowid reports the first one.
+    result = await db.execute(insert(Message).values(values))
+    first_id = result.lastrowid
+    return list(range(first_id, first_id + len(values)))
+
+async def mark_messages_read(db: AsyncSession, conversation_id: int, target_user_id: int,
+                             up_to_id: Optional[int] = None) -> Optional[int]:
+    # Advance target_user_id's read watermark (to the latest message by default).
+    # A single-row write; returns the new watermark, or None if it did not move.
+    conv = await db.get(Conversation, conversation_id)
+    if not conv or not conv.last_message_id:
+        return None
+    watermark = min(up_to_id or conv.last_message_id, conv.last_message_id)
+
+    if conv.is_group:
+        # Group rooms keep the watermark on the member's participant row
+        p = await db.get(ConversationParticipant, (conversation_id, target_user_id), with_for_update=True)
+        if not p or watermark <= p.last_read_id:
+            return None
+        p.last_read_id = watermark
+        await db.flush()
+        return watermark
+
+    # Direct conversation: lock the row so the counter follows create_messages
+    await db.refresh(conv, with_for_update=True)
+    watermark = min(up_to_id or conv.last_message_id, conv.last_message_id)
+    is_user1 = conv.user1_id == target_user_id
+    current = conv.user1_last_read_id if is_user1 else conv.user2_last_read_id
+    unread_now = conv.user1_unread_count if is_user1 else conv.user2_unread_count
+    # Nothing from the other side is unread: skip the write and the receipt
+    if watermark <= current or unread_now == 0:
+        return None
+
+    unread = 0
+    if watermark < conv.last_message_id:
+        # Partial read: recount what is left past the watermark
+        unread = await db.scalar(select(func.count(Message.id)).where(
             Message.conversation_id == conversation_id,
-            Message.sender_id != target_user_id,
-            Message.is_read == False
-        ).update({"is_read": True})
-        db.commit()
-    finally:
-        db.close()
+            Message.id > watermark,
+            Message.sender_id != target_user_id
+        ))
 
+    if is_user1:
+        conv.user1_last_read_id = watermark
+        conv.user1_unread_count = unread
+    else:
+        conv.user2_last_read_id = watermark
+        conv.user2_unread_count = unread
+    await db.flush()
+    return watermark
@@ -0,0 +1,108 @@
+import os
+import asyncio
+from typing import List, Optional, Tuple
+from app.storage import db
+
+# Messages arriving within this window (seconds) share one INSERT and one commit
+GROUP_COMMIT_WINDOW = float(os.getenv("CHAT_GROUP_COMMIT_WINDOW", "0.005"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("CHAT_GROUP_COMMIT_MAX_BATCH", "200"))
+
+
+async def _write_batch(rows: List[Tuple[int, int, str]]) -> List[Optional[dict]]:
+    async with db.get_db_session() as session:
+        results = await db.create_messages(session, rows)
+        await session.commit()
+        return results
+
+
+class MessageWriter:
+    """
+    Group-commit ingest for chat messages.
+    Every socket submits its message and awaits the result; one background
+    task collects what arrives within GROUP_COMMIT_WINDOW and writes the whole
+    batch with one INSERT and one commit on the async engine.
+    A sender's submit() only returns once its batch is committed. If the
+    batch fails, each row is retried on its own, so only the sender of the
+    offending row sees the error.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.messages = 0
+        self.failed_batches = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Flush everything already submitted, then stop (lifespan shutdown)."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, conversation_id: int, sender_id: int, content: str) -> Optional[dict]:
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put(((conversation_id, sender_id, content), fut))
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + GROUP_COMMIT_WINDOW
+            while len(batch) < GROUP_COMMIT_MAX_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[Tuple[tuple, asyncio.Future]]):
+        rows = [row for row, _ in batch]
+        try:
+            results = await _write_batch(rows)
+        except Exception as e:
+            self.failed_batches += 1
+            if len(batch) > 1:
+                # Isolate the bad row: everyone else still gets their message stored
+                for item in batch:
+                    await self._flush([item])
+                return
+            _, fut = batch[0]
+            if not fut.done():
+                fut.set_exception(e)
+            return
+        self.batches += 1
+        self.messages += len(rows)
+        for (_, fut), msg in zip(batch, results):
+            if not fut.done():
+                fut.set_result(msg)
+
+    def metrics(self) -> dict:
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "failedBatches": self.failed_batches,
+            "pending": self._queue.qsize(),
+        }
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,99 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.storage.sessions import session_store
+from app.utils.invalidation import bus
+
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "60"))  # seconds
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+
+
+class SessionCache:
+    """
+    In-process TTL/LRU cache of sessionId → user snapshot for request auth.
+    A hit skips the sessions/users query entirely. Entries are dropped by the
+    invalidation bus when the session is deleted or the user is edited or
+    deleted (on every pod), and expire after SESSION_CACHE_TTL regardless.
+    Only found users are cached, so a new login is never shadowed.
+    """
+
+    def __init__(self, ttl: float = SESSION_CACHE_TTL, max_size: int = SESSION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        # sessionId → (expires_at, user dict), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        # userId → sessionIds cached for that user
+        self._by_user: Dict[int, Set[str]] = {}
+        # Bumped by every invalidation; a lookup that raced one is not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    async def session_user(self, session: AsyncSession, session_id: str) -> Optional[dict]:
+        started = time.perf_counter()
+        entry = self._entries.get(session_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            self.hit_seconds += time.perf_counter() - started
+            # Callers may modify the dict (users_controller does)
+            return dict(entry[1])
+
+        generation = self._generation
+        u = await session_store.user(session, session_id)
+        if u is not None and generation == self._generation:
+            self._put(session_id, u)
+        self.misses += 1
+        self.miss_seconds += time.perf_counter() - started
+        return u
+
+    def _put(self, session_id: str, u: dict):
+        self._drop(session_id)
+        self._entries[session_id] = (time.monotonic() + self.ttl, dict(u))
+        self._by_user.setdefault(u["userId"], set()).add(session_id)
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return
+        user_id = entry[1]["userId"]
+        sids = self._by_user.get(user_id)
+        if sids is not None:
+            sids.discard(session_id)
+            if not sids:
+                del self._by_user[user_id]
+
+    def invalidate_session(self, session_id: str):
+        self.invalidations += 1
+        self._generation += 1
+        self._drop(session_id)
+
+    def invalidate_user(self, user_id: str):
+        self.invalidations += 1
+        self._generation += 1
+        for sid in list(self._by_user.get(int(user_id), ())):
+            self._drop(sid)
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avgHitMs": round(self.hit_seconds * 1000 / self.hits, 3) if self.hits else 0.0,
+            "avgMissMs": round(self.miss_seconds * 1000 / self.misses, 3) if self.misses else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+session_cache = SessionCache()
+bus.register("session", session_cache.invalidate_session)
+bus.register("user", session_cache.invalidate_user)
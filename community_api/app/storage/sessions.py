@@ -0,0 +1,93 @@
+import os
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.storage import db
+from app.utils.invalidation import bus
+from app.utils.redis_client import get_redis
+
+# "db": the sessions table (expires_at + app.jobs.sweep_sessions).
+# "redis": one key per session with a TTL; rows still in the sessions table
+# are moved over the first time they are used.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "db")
+# Idle lifetime: every use pushes the expiry out again
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))  # seconds
+
+SESSION_KEY_PREFIX = "session:"  # session:<sid> → user id
+USER_SESSIONS_PREFIX = "user:sessions:"  # user:sessions:<user_id> → set of sids
+
+
+class DBSessionStore:
+    async def create(self, session: AsyncSession, user_id: int) -> str:
+        return await db.create_session(session, user_id, SESSION_TTL)
+
+    async def user(self, session: AsyncSession, session_id: str) -> Optional[dict]:
+        u = await db.session_user(session, session_id, SESSION_TTL)
+        # Lookups run before the endpoint's own work, so this commits only the
+        # new expiry
+        if session.info.pop(db.SESSION_SLID_KEY, False):
+            await session.commit()
+        return u
+
+    async def delete(self, session: AsyncSession, session_id: str):
+        await db.delete_session(session, session_id)
+
+    async def delete_user(self, session: AsyncSession, user_id: int):
+        await db.delete_user_sessions(session, user_id)
+
+
+class RedisSessionStore:
+    """
+    Sessions as Redis keys with a sliding TTL (GETEX refreshes it on every
+    lookup), plus a per-user set of session ids for "log out everywhere".
+    A session id found only in the sessions table is moved here on first use,
+    so switching backends does not log anyone out.
+    """
+
+    async def create(self, session: AsyncSession, user_id: int) -> str:
+        sid = db.new_id()
+        await self._store(sid, user_id)
+        return sid
+
+    async def _store(self, session_id: str, user_id: int):
+        index = f"{USER_SESSIONS_PREFIX}{user_id}"
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.set(f"{SESSION_KEY_PREFIX}{session_id}", user_id, ex=SESSION_TTL)
+        pipe.sadd(index, session_id)
+        pipe.expire(index, SESSION_TTL)
+        await pipe.execute()
+
+    async def user(self, session: AsyncSession, session_id: str) -> Optional[dict]:
+        redis = get_redis()
+        user_id = await redis.getex(f"{SESSION_KEY_PREFIX}{session_id}", ex=SESSION_TTL)
+        if user_id is not None:
+            user_id = int(user_id)
+            # Keep the index alive as long as its newest session
+            await redis.expire(f"{USER_SESSIONS_PREFIX}{user_id}", SESSION_TTL)
+        else:
+            # Lazy migration from the sessions table
+            user_id = await db.take_session_user_id(session, session_id)
+            if user_id is None:
+                return None
+            await self._store(session_id, user_id)
+            await session.commit()
+        return await db.get_user(session, user_id)
+
+    async def delete(self, session: AsyncSession, session_id: str):
+        redis = get_redis()
+        user_id = await redis.getdel(f"{SESSION_KEY_PREFIX}{session_id}")
+        if user_id is not None:
+            await redis.srem(f"{USER_SESSIONS_PREFIX}{user_id}", session_id)
+            bus.defer(session, "session", session_id)
+        else:
+            await db.delete_session(session, session_id)
+
+    async def delete_user(self, session: AsyncSession, user_id: int):
+        redis = get_redis()
+        index = f"{USER_SESSIONS_PREFIX}{user_id}"
+        sids = await redis.smembers(index)
+        await redis.delete(index, *[f"{SESSION_KEY_PREFIX}{sid}" for sid in sids])
+        # Rows not migrated yet
+        await db.delete_user_sessions(session, user_id)
+
+
+session_store = RedisSessionStore() if SESSION_BACKEND == "redis" else DBSessionStore()
@@ -0,0 +1,137 @@
+import os
+import asyncio
+import unicodedata
+from typing import List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.storage import db
+from app.utils.bloom import BloomFilter
+from app.utils.invalidation import bus
+
+USER_BLOOM_CAPACITY = int(os.getenv("USER_BLOOM_CAPACITY", "100000"))
+USER_BLOOM_ERROR_RATE = float(os.getenv("USER_BLOOM_ERROR_RATE", "0.01"))
+# Rebuilds drop soft-deleted and renamed-away values (Bloom filters cannot delete)
+USER_BLOOM_REBUILD_INTERVAL = float(os.getenv("USER_BLOOM_REBUILD_INTERVAL", "3600"))
+
+
+def _norm(value: str) -> str:
+    # Match MySQL's case- and accent-insensitive collation: anything the
+    # database would call equal must hit the same bits
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().rstrip()
+
+
+class UserNameIndex:
+    """
+    Per-pod Bloom filters over active emails and nicknames.
+    A definite miss answers "not taken" without touching the database; only
+    possible hits fall through to the users query. New emails and nicknames
+    are added after their commit on this pod and, through the invalidation
+    bus, on every other pod. Until the first build finishes every lookup
+    goes to the database.
+    """
+
+    def __init__(self):
+        self._emails: Optional[BloomFilter] = None
+        self._nicknames: Optional[BloomFilter] = None
+        # Additions seen while a rebuild is streaming the users table
+        self._adds_during_build: Optional[List[Tuple[str, str]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.definite_misses = 0
+        self.possible_hits = 0
+        self.false_positives = 0
+
+    async def build(self):
+        self._adds_during_build = []
+        try:
+            async with db.get_db_session() as session:
+                capacity = max(USER_BLOOM_CAPACITY, 2 * await db.count_active_users(session))
+                emails = BloomFilter(capacity, USER_BLOOM_ERROR_RATE)
+                nicknames = BloomFilter(capacity, USER_BLOOM_ERROR_RATE)
+                async for email, nickname in db.stream_active_user_names(session):
+                    emails.add(_norm(email))
+                    nicknames.add(_norm(nickname))
+            for kind, value in self._adds_during_build:
+                (emails if kind == "email" else nicknames).add(value)
+            self._emails, self._nicknames = emails, nicknames
+        finally:
+            self._adds_during_build = None
+
+    def _add(self, kind: str, value: str):
+        value = _norm(value)
+        target = self._emails if kind == "email" else self._nicknames
+        if target is not None:
+            target.add(value)
+        if self._adds_during_build is not None:
+            self._adds_during_build.append((kind, value))
+
+    def add_email(self, email: str):
+        self._add("email", email)
+
+    def add_nickname(self, nickname: str):
+        self._add("nickname", nickname)
+
+    async def _find(self, bloom: Optional[BloomFilter], value: str, lookup) -> Optional[dict]:
+        if bloom is not None and _norm(value) not in bloom:
+            self.definite_misses += 1
+            return None
+        u = await lookup()
+        if bloom is not None:
+            self.possible_hits += 1
+            if u is None:
+                self.false_positives += 1
+        return u
+
+    async def find_by_email(self, session: AsyncSession, email: str) -> Optional[dict]:
+        return await self._find(self._emails, email, lambda: db.get_user_by_email(session, email))
+
+    async def find_by_nickname(self, session: AsyncSession, nickname: str) -> Optional[dict]:
+        return await self._find(self._nicknames, nickname, lambda: db.get_user_by_nickname(session, nickname))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.build()
+            except Exception:
+                # Keep the previous filters (or the database fallback)
+                pass
+            await asyncio.sleep(USER_BLOOM_REBUILD_INTERVAL)
+
+    def metrics(self) -> dict:
+        checks = self.definite_misses + self.possible_hits
+        filters = {}
+        for name, bloom in (("emails", self._emails), ("nicknames", self._nicknames)):
+            if bloom is not None:
+                filters[name] = {
+                    "items": bloom.count,
+                    "capacity": bloom.capacity,
+                    "hashes": bloom.num_hashes,
+                    "memoryBytes": bloom.memory_bytes,
+                    "estimatedFpRate": round(bloom.estimated_error_rate(), 6),
+                }
+        return {
+            "ready": self._emails is not None,
+            "filters": filters,
+            "definiteMisses": self.definite_misses,
+            "possibleHits": self.possible_hits,
+            "falsePositives": self.false_positives,
+            # Share of lookups the database had to answer "not taken"
+            "observedFpRate": round(self.false_positives / checks, 6) if checks else 0.0,
+        }
+
+
+user_names = UserNameIndex()
+bus.register("user_email", user_names.add_email)
+bus.register("user_nickname", user_names.add_nickname)
@@ -0,0 +1,223 @@
+import os
+import time
+import uuid
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from redis.exceptions import ResponseError
+from app.storage import db
+from app.utils.redis_client import get_redis
+
+# Redis hash: post_id → views not yet written to posts.hits
+PENDING_KEY = "posts:hits:pending"
+# A flush renames the pending hash to a key of its own before reading it:
+# posts:hits:flushing:<uuid>
+FLUSHING_PREFIX = "posts:hits:flushing:"
+# Sorted set of the flushing keys in flight, scored by the time the flush started
+FLUSHING_KEY = "posts:hits:flushing"
+HITS_FLUSH_INTERVAL = float(os.getenv("POST_HITS_FLUSH_INTERVAL", "5"))
+# A flushing key older than this was left by a pod that died mid-flush
+HITS_ORPHAN_AGE = float(os.getenv("POST_HITS_ORPHAN_AGE", "60"))  # seconds
+
+# "hits": every detail view counts. "unique": a viewer counts once per window,
+# tracked with one HyperLogLog per post per window (at most ~12 KB each,
+# however many viewers the post gets)
+POST_VIEW_MODE = os.getenv("POST_VIEW_MODE", "hits")
+UNIQUE_VIEW_WINDOW = int(os.getenv("POST_UNIQUE_VIEW_WINDOW", "86400"))  # seconds
+UNIQUE_PREFIX = "posts:uv:"  # posts:uv:<window>:<post_id> (HLL), posts:uv:<window>:dirty (set)
+
+
+def _window(offset: int = 0) -> int:
+    return int(time.time()) // UNIQUE_VIEW_WINDOW + offset
+
+
+def _hll_key(window: int, post_id: int) -> str:
+    return f"{UNIQUE_PREFIX}{window}:{post_id}"
+
+
+def _flushing_key() -> str:
+    return f"{FLUSHING_PREFIX}{uuid.uuid4()}"
+
+
+class ViewCounter:
+    """
+    Write-behind counter for post views.
+    A detail view is one HINCRBY in Redis instead of a row-locking UPDATE;
+    a background task periodically moves the buffered deltas into posts.hits
+    with one batched UPDATE ... SET hits = hits + n. The buffer lives in Redis,
+    so it is shared by every pod and survives a pod restart; the lifespan
+    hook flushes once more on shutdown. Deltas a pod took for flushing but
+    never wrote (it died in between) are picked up by the next flush on any
+    pod once they are HITS_ORPHAN_AGE old.
+
+    In "unique" mode a view only counts when the viewer is new to the post's
+    HyperLogLog for the current window. Closed windows are folded into
+    posts.unique_views by the same background task.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_views = 0
+        self.recovered_flushes = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def record_view(self, post_id: int, viewer: str) -> Tuple[int, int]:
+        """
+        Count one view by `viewer` (session id or anonymous fingerprint).
+        Returns (pending hits, unique viewers not yet folded) for the post.
+        """
+        redis = get_redis()
+        if POST_VIEW_MODE != "unique":
+            return await redis.hincrby(PENDING_KEY, post_id, 1), 0
+
+        window = _window()
+        pipe = redis.pipeline(transaction=False)
+        pipe.pfadd(_hll_key(window, post_id), viewer)
+        pipe.expire(_hll_key(window, post_id), UNIQUE_VIEW_WINDOW * 3)
+        pipe.sadd(f"{UNIQUE_PREFIX}{window}:dirty", post_id)
+        pipe.expire(f"{UNIQUE_PREFIX}{window}:dirty", UNIQUE_VIEW_WINDOW * 3)
+        pipe.hget(PENDING_KEY, post_id)
+        # Previous window: still counted here until it is folded
+        pipe.pfcount(_hll_key(window, post_id), _hll_key(window - 1, post_id))
+        is_new, _, _, _, pending, unique = await pipe.execute()
+        pending = int(pending or 0)
+        if is_new:
+            pending = await redis.hincrby(PENDING_KEY, post_id, 1)
+        return pending, unique
+
+    async def pending(self, post_ids: List[int]) -> Dict[int, Tuple[int, int]]:
+        """(pending hits, unfolded unique viewers) per post, one round trip."""
+        if not post_ids:
+            return {}
+        window = _window()
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hmget(PENDING_KEY, post_ids)
+        if POST_VIEW_MODE == "unique":
+            for pid in post_ids:
+                pipe.pfcount(_hll_key(window, pid), _hll_key(window - 1, pid))
+        hits, *unique = await pipe.execute()
+        return {
+            pid: (int(h or 0), unique[i] if unique else 0)
+            for i, (pid, h) in enumerate(zip(post_ids, hits))
+        }
+
+    async def fold_unique_views(self, window: int) -> int:
+        """Add a closed window's HyperLogLog counts to posts.unique_views."""
+        redis = get_redis()
+        # One pod folds each window
+        if not await redis.set(f"{UNIQUE_PREFIX}{window}:folded", 1, nx=True, ex=UNIQUE_VIEW_WINDOW * 3):
+            return 0
+        dirty_key = f"{UNIQUE_PREFIX}{window}:dirty"
+        post_ids = [int(pid) for pid in await redis.smembers(dirty_key)]
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for pid in post_ids:
+                pipe.pfcount(_hll_key(window, pid))
+            counts = dict(zip(post_ids, await pipe.execute())) if post_ids else {}
+            async with db.get_db_session() as session:
+                await db.add_post_unique_views(session, counts)
+                await session.commit()
+        except Exception:
+            await redis.delete(f"{UNIQUE_PREFIX}{window}:folded")
+            raise
+        await redis.delete(dirty_key, *[_hll_key(window, pid) for pid in post_ids])
+        return len(post_ids)
+
+    async def flush(self) -> int:
+        flushed = await self.recover_orphans()
+        flushing_key = await self._claim(PENDING_KEY)
+        if flushing_key is None:
+            # Nothing pending
+            return flushed
+        return flushed + await self._write(flushing_key)
+
+    async def recover_orphans(self) -> int:
+        """Write the deltas of flushing keys abandoned by a dead pod."""
+        redis = get_redis()
+        orphans = await redis.zrangebyscore(FLUSHING_KEY, "-inf", time.time() - HITS_ORPHAN_AGE)
+        flushed = 0
+        for key in orphans:
+            # Claim it under a fresh name; a pod that loses the race gets "no such key"
+            claimed = await self._claim(key)
+            await redis.zrem(FLUSHING_KEY, key)
+            if claimed is None:
+                continue
+            flushed += await self._write(claimed)
+            self.recovered_flushes += 1
+        return flushed
+
+    async def _claim(self, key: str) -> Optional[str]:
+        """
+        RENAME `key` to a fresh flushing key and return it (None if `key` does
+        not exist). The new key is registered in FLUSHING_KEY first, so a pod
+        dying at any point leaves nothing untracked; RENAME is atomic, so views
+        counted from here on go to a fresh hash.
+        """
+        redis = get_redis()
+        flushing_key = _flushing_key()
+        await redis.zadd(FLUSHING_KEY, {flushing_key: time.time()})
+        try:
+            await redis.rename(key, flushing_key)
+        except ResponseError:
+            # No such key
+            await redis.zrem(FLUSHING_KEY, flushing_key)
+            return None
+        return flushing_key
+
+    async def _write(self, flushing_key: str) -> int:
+        """Add a flushing hash's deltas to posts.hits, then drop the hash."""
+        redis = get_redis()
+        deltas = {int(pid): int(n) for pid, n in (await redis.hgetall(flushing_key)).items()}
+        try:
+            async with db.get_db_session() as session:
+                await db.add_post_hits(session, deltas)
+                await session.commit()
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            pipe = redis.pipeline(transaction=False)
+            for pid, n in deltas.items():
+                pipe.hincrby(PENDING_KEY, pid, n)
+            pipe.delete(flushing_key)
+            pipe.zrem(FLUSHING_KEY, flushing_key)
+            await pipe.execute()
+            raise
+        pipe = redis.pipeline(transaction=False)
+        pipe.delete(flushing_key)
+        pipe.zrem(FLUSHING_KEY, flushing_key)
+        await pipe.execute()
+        self.flushes += 1
+        self.flushed_views += sum(deltas.values())
+        return len(deltas)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(HITS_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+                if POST_VIEW_MODE == "unique":
+                    await self.fold_unique_views(_window(-1))
+            except Exception:
+                pass
+
+    def metrics(self) -> dict:
+        return {
+            "flushes": self.flushes,
+            "flushedViews": self.flushed_views,
+            "recoveredFlushes": self.recovered_flushes,
+        }
+
+
+view_counter = ViewCounter()
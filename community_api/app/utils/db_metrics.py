@@ -0,0 +1,58 @@
+from contextvars import ContextVar
+from typing import Dict, Optional
+from sqlalchemy import event
+from app.database import engine
+
+# Per-request counters: set by the HTTP middleware, visible to the endpoint task
+# through the copied context
+_current: ContextVar[Optional[Dict[str, int]]] = ContextVar("db_request_stats", default=None)
+
+# "<METHOD> <route path>" → accumulated counters
+endpoint_stats: Dict[str, Dict[str, int]] = {}
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+    stats = _current.get()
+    if stats is not None:
+        stats["checkouts"] += 1
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _on_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is not None:
+        stats["roundTrips"] += 1
+
+
+@event.listens_for(engine.sync_engine, "commit")
+def _on_commit(conn):
+    stats = _current.get()
+    if stats is not None:
+        stats["roundTrips"] += 1
+
+
+def begin_request():
+    stats = {"checkouts": 0, "roundTrips": 0}
+    return _current.set(stats), stats
+
+
+def end_request(token, key: Optional[str], stats: Dict[str, int]):
+    _current.reset(token)
+    if key is None:
+        return
+    total = endpoint_stats.setdefault(key, {"requests": 0, "checkouts": 0, "roundTrips": 0})
+    total["requests"] += 1
+    total["checkouts"] += stats["checkouts"]
+    total["roundTrips"] += stats["roundTrips"]
+
+
+def metrics() -> dict:
+    return {
+        key: {
+            **total,
+            "checkoutsPerRequest": round(total["checkouts"] / total["requests"], 2),
+            "roundTripsPerRequest": round(total["roundTrips"] / total["requests"], 2),
+        }
+        for key, total in endpoint_stats.items()
+    }
@@ -0,0 +1,133 @@
+import json
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.utils.redis_client import get_redis
+
+# Every pod publishes and subscribes here; a message names a cache entry kind
+# ("session", "user", ...) and the key that changed
+CHANNEL = "cache:invalidate"
+
+# Session.info key holding invalidations recorded before the commit
+PENDING_INFO_KEY = "pending_invalidations"
+
+# Backoff between attempts to re-subscribe after the Redis connection fails (seconds)
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+
+class InvalidationBus:
+    """
+    Cross-pod invalidation for in-process caches.
+    Storage functions record what they changed with `defer(session, kind, key)`.
+    Nothing is dropped before the transaction commits, so no pod can re-cache the
+    old row in between; after the commit the local handlers run immediately and
+    the change is published for the other pods. A rollback discards the list.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+        self._reconnect_delay = RECONNECT_MIN_DELAY
+
+    def register(self, kind: str, handler: Callable[[str], None]):
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def defer(self, session, kind: str, key) -> None:
+        session.info.setdefault(PENDING_INFO_KEY, []).append((kind, str(key)))
+
+    def _apply(self, kind: str, key: str):
+        for handler in self._handlers.get(kind, ()):
+            handler(key)
+
+    def _after_commit(self, items: List[Tuple[str, str]]):
+        for kind, key in items:
+            self._apply(kind, key)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.create_task(self.publish(items))
+
+    async def publish(self, items: List[Tuple[str, str]]):
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for kind, key in items:
+                pipe.publish(CHANNEL, json.dumps({"kind": kind, "key": key}))
+            await pipe.execute()
+            self.published += len(items)
+        except Exception:
+            # Other pods fall back to their cache TTL
+            pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # Background task: apply invalidations published by any pod (this one
+        # included; handlers are idempotent). If Redis drops the subscription,
+        # re-subscribe with exponential backoff; what was published meanwhile
+        # is lost and those entries fall back to their cache TTL.
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.reconnects += 1
+                await asyncio.sleep(self._reconnect_delay)
+                self._reconnect_delay = min(self._reconnect_delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _listen(self):
+        pubsub = get_redis().pubsub()
+        try:
+            await pubsub.subscribe(CHANNEL)
+            self._reconnect_delay = RECONNECT_MIN_DELAY
+            while True:
+                raw = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if raw is None or raw["type"] != "message":
+                    continue
+                try:
+                    msg = json.loads(raw["data"])
+                    self.received += 1
+                    self._apply(msg["kind"], msg["key"])
+                except Exception:
+                    pass
+        finally:
+            await pubsub.aclose()
+
+    def metrics(self) -> dict:
+        return {
+            "published": self.published,
+            "received": self.received,
+            "reconnects": self.reconnects,
+        }
+
+
+bus = InvalidationBus()
+
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session):
+    items = session.info.pop(PENDING_INFO_KEY, None)
+    if items:
+        bus._after_commit(items)
+
+
+@event.listens_for(Session, "after_rollback")
+def _on_rollback(session):
+    session.info.pop(PENDING_INFO_KEY, None)
@@ -0,0 +1,77 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from app.utils import security
+from app.utils.responses import raise_http_error
+
+# hashlib.scrypt releases the GIL, so threads use every core
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Hash/verify calls allowed to wait for a worker before new ones get 503
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification on a bounded thread pool so the
+    KDF never blocks the event loop (or the shared default executor).
+    When the queue is full, new requests fail fast with 503 SERVER_BUSY
+    instead of piling up behind a login burst.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+
+    async def _run(self, fn, *args):
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise_http_error(503, "SERVER_BUSY")
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._timed, fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.completed += 1
+            self.busy_seconds += time.perf_counter() - started
+
+    async def hash(self, pw: str) -> str:
+        return await self._run(security.hash_pw, pw)
+
+    async def verify(self, pw: str, stored: str) -> bool:
+        return await self._run(security.verify_pw, pw, stored)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "inFlight": self.in_flight,
+            "queued": max(0, self.in_flight - self.workers),
+            "maxInFlight": self.max_in_flight,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "avgMs": round(self.busy_seconds * 1000 / self.completed, 2) if self.completed else 0.0,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -2,6 +2,10 @@ import os
 import redis.asyncio as aioredis
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# Connections per pod. When all are busy a command waits up to REDIS_POOL_TIMEOUT
+# for one to come back instead of failing with MaxConnectionsError
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "100"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))  # seconds
 
 _redis: aioredis.Redis | None = None
 
@@ -10,7 +14,10 @@ def get_redis() -> aioredis.Redis:
     """Return the shared async Redis client."""
     global _redis
     if _redis is None:
-        _redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+        pool = aioredis.BlockingConnectionPool.from_url(
+            REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT, decode_responses=True
+        )
+        _redis = aioredis.Redis.from_pool(pool)
     return _redis
 
 
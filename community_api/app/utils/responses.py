@@ -21,6 +21,13 @@ ERRORS = {
     "TITLE_TOO_LONG": (400, "제목은 최대 26자까지 작성 가능합니다."),
     "CONTENT_REQUIRED": (400, "내용을 입력해주세요."),
     "COMMENT_REQUIRED": (400, "댓글을 입력해주세요."),
+    "INVALID_CURSOR": (400, "잘못된 페이지 커서입니다."),
+    "INVALID_FIELDS": (400, "요청할 수 없는 필드입니다."),
+    "GROUP_TITLE_TOO_LONG": (400, "채팅방 이름은 최대 100자까지 작성 가능합니다."),
+    "MEMBER_IDS_REQUIRED": (400, "초대할 사용자를 선택해주세요."),
+    "GROUP_TOO_LARGE": (400, "채팅방 최대 인원을 초과했습니다."),
+    "NOT_A_GROUP": (400, "그룹 채팅방이 아닙니다."),
+    "SERVER_BUSY": (503, "잠시 후 다시 시도해주세요."),
     "BAD_REQUEST": (400, "Bad request"),
 }
 
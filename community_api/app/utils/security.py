@@ -1,14 +1,51 @@
+import base64
 import hashlib
+import hmac
+import os
 import re
 
 EMAIL_RE = re.compile(r"^[^\s@]+@[^\s@]+\.[^\s@]+$")
 PW_RE = re.compile(r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[^\w\s]).{8,20}$")
 
+# scrypt cost (memory = 128 * n * r bytes, 16 MB by default). Hashes record
+# their own parameters, so raising these only affects new and re-hashed ones.
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+SCRYPT_PREFIX = "scrypt"
+
 def valid_email(email: str) -> bool:
     return bool(email and EMAIL_RE.match(email))
 
 def valid_password(pw: str) -> bool:
     return bool(pw and PW_RE.match(pw))
 
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+def _scrypt(pw: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(pw.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
 def hash_pw(pw: str) -> str:
-    return hashlib.sha256(pw.encode("utf-8")).hexdigest()
+    """CPU- and memory-heavy: call through app.utils.password_hasher, not on the event loop."""
+    salt = os.urandom(16)
+    digest = _scrypt(pw, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{SCRYPT_PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+def verify_pw(pw: str, stored: str) -> bool:
+    """Checks a password against a versioned scrypt hash or a legacy SHA-256 hex digest."""
+    if not stored:
+        return False
+    if stored.startswith(SCRYPT_PREFIX + "$"):
+        try:
+            _, n, r, p, salt, digest = stored.split("$")
+            actual = _scrypt(pw, base64.b64decode(salt), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, base64.b64decode(digest))
+    # Legacy: unsalted SHA-256
+    return hmac.compare_digest(hashlib.sha256(pw.encode("utf-8")).hexdigest(), stored)
+
+def needs_rehash(stored: str) -> bool:
+    """True for legacy hashes and scrypt hashes with outdated parameters."""
+    return not stored.startswith(f"{SCRYPT_PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
@@ -0,0 +1,250 @@
+"""
+In-process chat benchmark: fake WebSockets run through the real chat
+handler (membership check, group commit, Redis Pub/Sub fan-out, per-socket
+send queues) and the script reports sends/s and the delivery latency every
+receiving socket saw, from the frame reaching the handler to the message
+leaving its socket's queue (p50, p99).
+
+Scenarios:
+  rooms   --rooms group rooms of --room-size members each, every member
+          connected; one member per room sends. Each message is delivered
+          to every member, the sender included.
+  direct  --conversations direct conversations, both sides connected; one
+          side of each sends.
+  inbox   one user with --conversations direct conversations sends to
+          them in turn, every peer connected: send cost should not grow
+          with the sender's conversation count.
+
+--idle-sockets connects that many more users who take part in nothing, to
+check that delivery cost does not grow with unrelated sockets on the pod.
+
+Senders send --rate messages per second each, or with --rate 0 as fast as
+acks come back (the next frame goes out once the previous one is saved).
+--commit per-message swaps the group-commit writer for one session, INSERT
+and commit per message, the way messages were written before it.
+
+Same SQLite (aiosqlite) and fakeredis setup as http_bench.py, so numbers
+are for comparing revisions on the same machine, not absolute capacity:
+
+    python bench/chat_bench.py --rooms 2 --room-size 500 --rate 20 --seconds 10
+    python bench/chat_bench.py --scenario direct --conversations 200 --rate 0 --commit group
+    python bench/chat_bench.py --scenario direct --conversations 200 --rate 0 --commit per-message
+    python bench/chat_bench.py --scenario direct --conversations 20 --rate 10 --idle-sockets 5000
+    python bench/chat_bench.py --scenario inbox --conversations 500 --rate 0
+
+Requires the dev dependencies (requirements-dev.txt).
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import tempfile
+import time
+
+from http_bench import _create_schema, _setup
+
+
+class FakeWebSocket:
+    """Just enough of a WebSocket for the chat handler; frames in through `inbox`."""
+
+    def __init__(self, latencies: list, errors: list):
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        # Acks and errors for this socket's own frames
+        self.replies: asyncio.Queue = asyncio.Queue()
+        self.latencies = latencies
+        self.errors = errors
+        # Set once the handler reads its first frame, i.e. connect() is done
+        self.ready = asyncio.Event()
+
+    async def receive_json(self):
+        self.ready.set()
+        frame = await self.inbox.get()
+        if frame is None:
+            from starlette.websockets import WebSocketDisconnect
+            raise WebSocketDisconnect()
+        return frame
+
+    async def send_json(self, message: dict):
+        # Chat messages carry their send time as content
+        if "content" in message:
+            self.latencies.append(time.perf_counter() - float(message["content"]))
+        elif "error" in message:
+            self.errors.append(message["error"])
+            self.replies.put_nowait(message)
+        elif message.get("type") == "ack":
+            self.replies.put_nowait(message)
+
+    async def close(self, code: int = 1000):
+        self.inbox.put_nowait(None)
+
+
+class PerMessageWriter:
+    """The path before group commit: a session, INSERT and commit per message."""
+
+    async def submit(self, conversation_id: int, sender_id: int, content: str):
+        from app.storage import db
+        async with db.get_db_session() as session:
+            msg = await db.create_message(session, conversation_id, sender_id, content)
+            await session.commit()
+            return msg
+
+
+def _percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def _seed_users(count: int) -> list:
+    from app.storage import db
+    async with db.get_db_session() as session:
+        users = [await db.create_user(session, f"chat{i}@example.com", "x", f"chat{i}", None) for i in range(count)]
+        await session.commit()
+    return [u["userId"] for u in users]
+
+
+async def _seed_rooms(user_ids: list, rooms: int, room_size: int) -> list:
+    from app.storage import db
+    async with db.get_db_session() as session:
+        members = [user_ids[i * room_size:(i + 1) * room_size] for i in range(rooms)]
+        conversation_ids = [
+            await db.create_group_conversation(session, m[0], f"room {i}", m[1:]) for i, m in enumerate(members)
+        ]
+        await session.commit()
+    return list(zip(conversation_ids, members))
+
+
+async def _seed_direct(pairs: list) -> list:
+    from app.storage import db
+    async with db.get_db_session() as session:
+        conversation_ids = [await db.get_or_create_conversation(session, a, b) for a, b in pairs]
+        await session.commit()
+    return [(cid, list(pair)) for cid, pair in zip(conversation_ids, pairs)]
+
+
+async def _connect(user_ids: list, latencies: list, errors: list) -> tuple:
+    """Open a socket per user; returns once every socket is routed and subscribed."""
+    from app.controllers import chat_controller
+    manager = chat_controller.manager
+    sockets = {uid: FakeWebSocket(latencies, errors) for uid in user_ids}
+    tasks = [asyncio.create_task(chat_controller.handle_chat_websocket(ws, uid)) for uid, ws in sockets.items()]
+    await asyncio.gather(*[ws.ready.wait() for ws in sockets.values()])
+    await asyncio.gather(*[manager.wait_subscribed(c) for c in list(manager._channel_refs)])
+    return sockets, tasks
+
+
+async def _disconnect(sockets: dict, tasks: list):
+    for ws in sockets.values():
+        ws.inbox.put_nowait(None)
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _sender(ws: FakeWebSocket, conversation_ids: list, rate: float, deadline: float, sent: list):
+    next_at = time.perf_counter()
+    for i in itertools.count():
+        if next_at >= deadline:
+            return
+        conversation_id = conversation_ids[i % len(conversation_ids)]
+        ws.inbox.put_nowait({
+            "conversation_id": conversation_id,
+            "content": repr(time.perf_counter()),
+            "client_msg_id": len(sent),
+        })
+        if rate:
+            sent.append(conversation_id)
+            next_at += 1 / rate
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        else:
+            # Only saved messages are delivered
+            if "error" not in await ws.replies.get():
+                sent.append(conversation_id)
+            next_at = time.perf_counter()
+
+
+async def _wait_delivered(latencies: list, expected: int, timeout: float = 10.0):
+    deadline = time.perf_counter() + timeout
+    while len(latencies) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def _seed(args) -> tuple:
+    """(user ids, [(conversation id, members)]); the first member of each conversation sends."""
+    if args.scenario == "rooms":
+        user_ids = await _seed_users(args.rooms * args.room_size)
+        return user_ids, await _seed_rooms(user_ids, args.rooms, args.room_size)
+    if args.scenario == "inbox":
+        user_ids = await _seed_users(args.conversations + 1)
+        return user_ids, await _seed_direct([(user_ids[0], peer) for peer in user_ids[1:]])
+    user_ids = await _seed_users(args.conversations * 2)
+    return user_ids, await _seed_direct(list(zip(user_ids[::2], user_ids[1::2])))
+
+
+async def _seed_idle(count: int, start: int) -> list:
+    from app.storage import db
+    async with db.get_db_session() as session:
+        users = [
+            await db.create_user(session, f"idle{i}@example.com", "x", f"idle{i}", None)
+            for i in range(start, start + count)
+        ]
+        await session.commit()
+    return [u["userId"] for u in users]
+
+
+async def run(args):
+    await _create_schema()
+    from app.main import app
+    from app.controllers import chat_controller
+
+    if args.commit == "per-message":
+        chat_controller.message_writer = PerMessageWriter()
+    async with app.router.lifespan_context(app):
+        user_ids, conversations = await _seed(args)
+        user_ids += await _seed_idle(args.idle_sockets, len(user_ids))
+        latencies, errors, sent = [], [], []
+        sockets, tasks = await _connect(user_ids, latencies, errors)
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        deadline = started + args.seconds
+        senders = {}
+        for conversation_id, members in conversations:
+            senders.setdefault(members[0], []).append(conversation_id)
+        await asyncio.gather(*[
+            _sender(sockets[sender], conversation_ids, args.rate, deadline, sent)
+            for sender, conversation_ids in senders.items()
+        ])
+        elapsed = time.perf_counter() - started
+        members = {cid: len(m) for cid, m in conversations}
+        expected = sum(members[cid] for cid in sent)
+        await _wait_delivered(latencies, expected)
+        cpu = time.process_time() - cpu_started
+        await _disconnect(sockets, tasks)
+
+    print(f"scenario={args.scenario} conversations={len(conversations)} sockets={len(user_ids)} "
+          f"idle={args.idle_sockets} commit={args.commit} seconds={elapsed:.1f}")
+    print(f"sent={len(sent)} sends/s={len(sent) / elapsed:.1f} errors={len(errors)} "
+          f"delivered={len(latencies)}/{expected}")
+    print(f"delivery p50={statistics.median(latencies or [0]) * 1000:.1f}ms "
+          f"p99={_percentile(latencies, 0.99) * 1000:.1f}ms "
+          f"cpu/delivery={cpu / max(1, len(latencies)) * 1e6:.0f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["rooms", "direct", "inbox"], default="rooms")
+    parser.add_argument("--rooms", type=int, default=2)
+    parser.add_argument("--room-size", type=int, default=500)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--idle-sockets", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=20, help="messages per second per sender; 0: send on ack")
+    parser.add_argument("--commit", choices=["group", "per-message"], default="group")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _setup(args.app_dir, os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+In-process feed depth benchmark: GET /v1/posts at page 1 and at deep pages,
+reached by offset and by keyset cursor, and the script reports p50 and p99
+per page. Offset pages get slower the deeper they are; cursor pages should
+cost the same as page 1.
+
+Same SQLite and fakeredis setup as http_bench.py; the posts are bulk
+inserted, so a six-figure feed seeds in seconds:
+
+    python bench/feed_bench.py --posts 100000 --pages 1,100,10000
+    # offset only, on a checkout from before cursors:
+    python bench/feed_bench.py --app-dir /tmp/before/community_api
+
+Requires the dev dependencies (requirements-dev.txt).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from http_bench import _create_schema, _setup
+
+SEED_CHUNK = 10000
+
+
+def _seed(db_path: str, posts: int) -> int:
+    """Bulk insert one author and `posts` posts, newest last; returns the author id."""
+    from sqlalchemy import create_engine
+    from app.models.orm import Post, User
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        author_id = conn.execute(User.__table__.insert().values(
+            email="feed@example.com", password_hash="x", nickname="feed",
+        )).inserted_primary_key[0]
+        for first in range(0, posts, SEED_CHUNK):
+            conn.execute(Post.__table__.insert(), [
+                {
+                    "title": f"post {i}",
+                    "content": "x" * 500,
+                    "author_user_id": author_id,
+                    "created_at": start + timedelta(seconds=i),
+                }
+                for i in range(first, min(first + SEED_CHUNK, posts))
+            ])
+    engine.dispose()
+    return author_id
+
+
+def _cursor_before(db_path: str, position: int):
+    """Cursor of the post at `position` in feed order (what page N-1 returned last)."""
+    try:
+        from app.utils.cursor import encode_cursor
+    except ImportError:
+        return None  # tree without keyset pagination
+    from sqlalchemy import create_engine, select
+    from app.models.orm import Post
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        created_at, post_id = conn.execute(
+            select(Post.created_at, Post.id)
+            .order_by(Post.created_at.desc(), Post.id.desc()).offset(position).limit(1)
+        ).one()
+    engine.dispose()
+    return encode_cursor(created_at, post_id)
+
+
+async def _measure(client, path: str, requests: int) -> list:
+    await client.get(path)  # warm-up: first-request setup is not part of the page cost
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        res = await client.get(path)
+        latencies.append(time.perf_counter() - started)
+        assert res.status_code == 200, res.text
+    return latencies
+
+
+async def run(args, db_path: str):
+    import httpx
+    from app.main import app  # imports the models, so the schema has every table
+    await _create_schema()
+    _seed(db_path, args.posts)
+
+    pages = [int(p) for p in args.pages.split(",")]
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"posts={args.posts} limit={args.limit} requests={args.requests} per page and mode")
+            for page in pages:
+                offset = (page - 1) * args.limit
+                if offset >= args.posts:
+                    print(f"page={page}: past the end of the feed")
+                    continue
+                paths = {"offset": f"/v1/posts?limit={args.limit}&offset={offset}"}
+                cursor = _cursor_before(db_path, offset - 1) if page > 1 else None
+                if cursor:
+                    paths["cursor"] = f"/v1/posts?limit={args.limit}&cursor={cursor}"
+                for mode, path in paths.items():
+                    latencies = sorted(await _measure(client, path, args.requests))
+                    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                    print(f"page={page} mode={mode} "
+                          f"p50={statistics.median(latencies) * 1000:.1f}ms p99={p99 * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--pages", default="1,100,10000")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        _setup(args.app_dir, db_path)
+        asyncio.run(run(args, db_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+In-process HTTP benchmark: N concurrent clients hammer the post feed and
+post detail endpoints (authenticated, so every request also resolves a
+session) and the script reports req/s, p50 and p99.
+
+Runs against SQLite (aiosqlite for the async tree) and fakeredis, so it needs
+no MySQL or Redis; numbers are for comparing revisions on the same machine,
+not absolute capacity:
+
+    python bench/http_bench.py --clients 1000 --seconds 20
+    # the same scenario on an older checkout, e.g. the sync storage layer:
+    git worktree add /tmp/before <commit>
+    python bench/http_bench.py --app-dir /tmp/before/community_api
+
+Requires the dev dependencies (requirements-dev.txt).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def _setup(app_dir: str, db_path: str):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, app_dir)
+
+    import fakeredis
+    import app.utils.redis_client as redis_client
+
+    server = fakeredis.FakeServer()
+
+    def fake_redis():
+        if redis_client._redis is None:
+            # Same pool limits as the real client (trees without them get redis-py's default pool)
+            pool = {}
+            if hasattr(redis_client, "REDIS_MAX_CONNECTIONS"):
+                from redis.asyncio import BlockingConnectionPool
+                pool = {
+                    "connection_pool_class": BlockingConnectionPool,
+                    "max_connections": redis_client.REDIS_MAX_CONNECTIONS,
+                    "timeout": redis_client.REDIS_POOL_TIMEOUT,
+                }
+            redis_client._redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True, **pool)
+        return redis_client._redis
+
+    redis_client.get_redis = fake_redis
+
+    # Trees from before files.data had a SQLite variant declare a bare LONGBLOB
+    from sqlalchemy.dialects.mysql import LONGBLOB
+    from sqlalchemy.ext.compiler import compiles
+
+    @compiles(LONGBLOB, "sqlite")
+    def _longblob_on_sqlite(element, compiler, **kw):
+        return "BLOB"
+
+
+async def _create_schema():
+    from app.database import Base, engine
+    if hasattr(engine, "sync_engine"):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    else:
+        Base.metadata.create_all(bind=engine)
+
+
+async def _seed(client, posts: int) -> dict:
+    pw = "Abcdef1!"
+    await client.post("/v1/auth/signup", json={
+        "email": "bench@example.com", "password": pw, "passwordConfirm": pw, "nickname": "bench",
+    })
+    res = await client.post("/v1/auth/login", json={"email": "bench@example.com", "password": pw})
+    cookies = {"sessionId": res.cookies.get("sessionId")}
+    client.cookies.clear()
+    for i in range(posts):
+        await client.post("/v1/posts", json={"title": f"post {i}", "content": "x" * 500}, cookies=cookies)
+    return cookies
+
+
+async def _client_loop(client, cookies, deadline: float, posts: int, latencies: list, errors: list, n: int):
+    i = n
+    while time.perf_counter() < deadline:
+        path = "/v1/posts?limit=10" if i % 2 else f"/v1/posts/{i % posts + 1}"
+        started = time.perf_counter()
+        try:
+            res = await client.get(path, cookies=cookies)
+            if res.status_code != 200:
+                errors.append(res.status_code)
+        except Exception as e:  # connection-level failures count as errors
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+        i += 1
+
+
+async def run(args):
+    import httpx
+    await _create_schema()
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            cookies = await _seed(client, args.posts)
+            latencies, errors = [], []
+            started = time.perf_counter()
+            deadline = started + args.seconds
+            await asyncio.gather(*[
+                _client_loop(client, cookies, deadline, args.posts, latencies, errors, n)
+                for n in range(args.clients)
+            ])
+            elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"clients={args.clients} seconds={elapsed:.1f} requests={len(latencies)} errors={len(errors)}")
+    print(f"req/s={len(latencies) / elapsed:.1f} "
+          f"p50={statistics.median(latencies) * 1000:.1f}ms p99={p99 * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _setup(args.app_dir, os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
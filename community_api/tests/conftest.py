@@ -0,0 +1,47 @@
+"""
+Tests run the app in-process against SQLite (aiosqlite) and fakeredis, so
+they need no MySQL or Redis (see requirements-dev.txt). The environment is
+set before anything from app is imported.
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="community-api-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'test.db')}")
+os.environ.setdefault("CHAT_DELIVERY_MODE", "streams")
+os.environ.setdefault("BLOB_BACKEND", "local")
+os.environ.setdefault("BLOB_LOCAL_ROOT", os.path.join(_tmp, "blobs"))
+
+import fakeredis  # noqa: E402
+import pytest  # noqa: E402
+import app.utils.redis_client as redis_client  # noqa: E402
+
+# One fake server for the whole run: it outlives app restarts like a real Redis
+_redis_server = fakeredis.FakeServer()
+
+
+def _fake_redis():
+    if redis_client._redis is None:
+        redis_client._redis = fakeredis.FakeAsyncRedis(server=_redis_server, decode_responses=True)
+    return redis_client._redis
+
+
+redis_client.get_redis = _fake_redis
+
+PASSWORD = "Abcdef1!"
+
+
+@pytest.fixture
+def signup():
+    """signup(client, name) → (user_id, session_id) for a fresh user."""
+    def _signup(client, name: str):
+        email = f"{name}@example.com"
+        res = client.post("/v1/auth/signup", json={
+            "email": email, "password": PASSWORD, "passwordConfirm": PASSWORD, "nickname": name,
+        })
+        assert res.status_code == 201, res.text
+        res = client.post("/v1/auth/login", json={"email": email, "password": PASSWORD})
+        assert res.status_code == 200, res.text
+        client.cookies.clear()
+        return res.json()["data"]["user"]["userId"], res.cookies.get("sessionId")
+    return _signup
@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def test_participant_endpoints_validate_their_bodies(signup):
+    with TestClient(app) as client:
+        owner, owner_sid = signup(client, "gp_owner")
+        friend, _ = signup(client, "gp_friend")
+        res = client.post("/v1/chat/groups", json={"title": "room", "member_ids": []}, cookies={"sessionId": owner_sid})
+        assert res.status_code == 201, res.text
+        conversation_id = res.json()["data"]["conversation_id"]
+        participants = f"/v1/chat/conversations/{conversation_id}/participants"
+
+        for body in [{}, {"member_ids": "abc"}, {"member_ids": [["x"]]}]:
+            assert client.post(participants, json=body, cookies={"sessionId": owner_sid}).status_code == 422
+        res = client.post(participants, json={"member_ids": []}, cookies={"sessionId": owner_sid})
+        assert res.status_code == 400
+        res = client.post(participants, json={"member_ids": [friend, friend]}, cookies={"sessionId": owner_sid})
+        assert res.status_code == 200, res.text
+        assert res.json()["data"]["added"] == [friend]
+
+        for body in [{}, {"muted": "loud"}]:
+            assert client.patch(f"{participants}/me", json=body, cookies={"sessionId": owner_sid}).status_code == 422
+        res = client.patch(f"{participants}/me", json={"muted": True}, cookies={"sessionId": owner_sid})
+        assert res.status_code == 200, res.text
+        assert res.json()["data"] == {"muted": True}
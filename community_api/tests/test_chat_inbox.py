@@ -0,0 +1,40 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def _open(client, session_id, other_user_id):
+    res = client.post("/v1/chat/conversations", json={"other_user_id": other_user_id},
+                      cookies={"sessionId": session_id})
+    assert res.status_code in (200, 201), res.text
+    return res.json()["data"]["conversation_id"]
+
+
+def test_inbox_pages_through_both_sides_newest_first(signup):
+    with TestClient(app) as client:
+        first, first_sid = signup(client, "ib_first")
+        me, me_sid = signup(client, "ib_me")
+        later, later_sid = signup(client, "ib_later")
+        last, _ = signup(client, "ib_last")
+        gone, gone_sid = signup(client, "ib_gone")
+        # user1 is the lower user id: I am user2 with `first` and user1 with the others
+        opened = [
+            _open(client, first_sid, me),
+            _open(client, me_sid, later),
+            _open(client, me_sid, last),
+        ]
+        _open(client, gone_sid, me)
+        res = client.delete("/v1/users/me", cookies={"sessionId": gone_sid})
+        assert res.status_code == 200, res.text
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 1, **({"cursor": cursor} if cursor else {})}
+            page = client.get("/v1/chat/conversations", params=params, cookies={"sessionId": me_sid}).json()["data"]
+            if not page:
+                break
+            seen += [(c["id"], c["other_user_id"]) for c in page]
+            cursor = page[-1]["cursor"]
+
+        # Newest activity first; a deleted account's conversation is left out
+        assert seen == [(opened[2], last), (opened[1], later), (opened[0], first)]
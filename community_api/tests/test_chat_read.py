@@ -0,0 +1,55 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def test_invalid_read_watermark_gets_an_error_frame(signup):
+    with TestClient(app) as client:
+        alice, alice_sid = signup(client, "rd_alice")
+        bob, bob_sid = signup(client, "rd_bob")
+        res = client.post("/v1/chat/conversations", json={"other_user_id": bob}, cookies={"sessionId": alice_sid})
+        conversation_id = res.json()["data"]["conversation_id"]
+        with client.websocket_connect("/v1/chat/ws", cookies={"sessionId": alice_sid}) as alice_ws:
+            time.sleep(0.2)
+            for last_read_id in ["abc", 0, -3, 1.5, True, [1]]:
+                alice_ws.send_json({"type": "read", "conversation_id": conversation_id, "last_read_id": last_read_id})
+                assert alice_ws.receive_json() == {"error": "Invalid last_read_id"}
+
+            # The socket is still usable afterwards
+            alice_ws.send_json({"conversation_id": conversation_id, "content": "still here", "client_msg_id": "c1"})
+            while alice_ws.receive_json().get("client_msg_id") != "c1":
+                pass
+
+
+def test_catch_up_page_only_reads_what_it_returns(signup):
+    with TestClient(app) as client:
+        alice, alice_sid = signup(client, "cu_alice")
+        bob, bob_sid = signup(client, "cu_bob")
+        res = client.post("/v1/chat/conversations", json={"other_user_id": alice}, cookies={"sessionId": bob_sid})
+        conversation_id = res.json()["data"]["conversation_id"]
+        with client.websocket_connect("/v1/chat/ws", cookies={"sessionId": bob_sid}) as bob_ws:
+            time.sleep(0.2)
+            for i in range(5):
+                bob_ws.send_json({"conversation_id": conversation_id, "content": f"m{i}", "client_msg_id": f"m{i}"})
+                while bob_ws.receive_json().get("client_msg_id") != f"m{i}":
+                    pass
+
+        def unread():
+            res = client.get("/v1/chat/conversations", cookies={"sessionId": alice_sid})
+            [conv] = [c for c in res.json()["data"] if c["id"] == conversation_id]
+            return conv["unread_count"]
+
+        res = client.get(f"/v1/chat/conversations/{conversation_id}/messages",
+                         params={"after_id": 0, "limit": 2}, cookies={"sessionId": alice_sid})
+        page = res.json()["data"]
+        assert [m["content"] for m in page] == ["m0", "m1"]
+        assert all(m["is_read"] for m in page)
+        assert unread() == 3
+
+        # An empty catch-up page reads nothing
+        res = client.get(f"/v1/chat/conversations/{conversation_id}/messages",
+                         params={"after_id": 10 ** 9}, cookies={"sessionId": alice_sid})
+        assert res.json()["data"] == []
+        assert unread() == 3
@@ -0,0 +1,50 @@
+import time
+
+from fastapi.testclient import TestClient
+from redis.asyncio.client import PubSub
+from redis.exceptions import ConnectionError
+
+import app.controllers.chat_controller as chat_controller
+from app.main import app
+
+
+def test_subscriber_resubscribes_after_losing_redis(monkeypatch, signup):
+    monkeypatch.setattr(chat_controller, "RECONNECT_MIN_DELAY", 0.01)
+    monkeypatch.setattr(chat_controller.manager, "_reconnect_delay", 0.01)
+    manager = chat_controller.manager
+    get_message = PubSub.get_message
+    failures = {"left": 0}
+
+    async def flaky_get_message(self, *args, **kwargs):
+        # Only the chat subscriber fails; the invalidation bus is left alone
+        on_chat = any(str(c).startswith(chat_controller.CHANNEL_PREFIX) for c in self.channels)
+        if on_chat and failures["left"]:
+            failures["left"] -= 1
+            raise ConnectionError("connection reset by peer")
+        return await get_message(self, *args, **kwargs)
+
+    monkeypatch.setattr(PubSub, "get_message", flaky_get_message)
+
+    with TestClient(app) as client:
+        alice, alice_sid = signup(client, "sb_alice")
+        bob, bob_sid = signup(client, "sb_bob")
+        res = client.post("/v1/chat/conversations", json={"other_user_id": bob}, cookies={"sessionId": alice_sid})
+        conversation_id = res.json()["data"]["conversation_id"]
+        with client.websocket_connect("/v1/chat/ws", cookies={"sessionId": alice_sid}) as alice_ws, \
+                client.websocket_connect("/v1/chat/ws", cookies={"sessionId": bob_sid}) as bob_ws:
+            time.sleep(0.2)
+            reconnects = manager.reconnects
+            failures["left"] = 2
+            deadline = time.monotonic() + 5
+            while failures["left"] or chat_controller.CHANNEL_PREFIX + str(bob) not in manager._subscribed:
+                assert time.monotonic() < deadline, "never resubscribed"
+                time.sleep(0.02)
+
+            # Both sockets' channels came back on the new connection
+            alice_ws.send_json({"conversation_id": conversation_id, "content": "after", "client_msg_id": "a1"})
+            while True:
+                seen = bob_ws.receive_json()
+                if seen.get("content") == "after":
+                    break
+
+    assert manager.reconnects - reconnects == 2
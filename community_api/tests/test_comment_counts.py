@@ -0,0 +1,79 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from app.jobs import reconcile_comment_counts
+from app.main import app
+from app.models.orm import Post
+from app.storage import db
+
+
+def _post(client, sid, title):
+    res = client.post("/v1/posts", json={"title": title, "content": "body"}, cookies={"sessionId": sid})
+    assert res.status_code == 201, res.text
+    return res.json()["data"]["postId"]
+
+
+def _comment(client, sid, post_id):
+    res = client.post(f"/v1/posts/{post_id}/comments", json={"content": "hi"}, cookies={"sessionId": sid})
+    assert res.status_code == 201, res.text
+    return res.json()["data"]
+
+
+def _comment_count(client, sid, post_id):
+    return client.get(f"/v1/posts/{post_id}", cookies={"sessionId": sid}).json()["data"]["commentCount"]
+
+
+def test_deleting_an_account_takes_its_comments_off_the_counts(signup):
+    with TestClient(app) as client:
+        _, author = signup(client, "cc_author")
+        _, leaver = signup(client, "cc_leaver")
+        first, second = _post(client, author, "first"), _post(client, author, "second")
+        _comment(client, leaver, first)
+        removed = _comment(client, leaver, first)
+        _comment(client, leaver, second)
+        _comment(client, author, first)
+        res = client.delete(f"/v1/posts/{first}/comments/{removed['commentId']}", cookies={"sessionId": leaver})
+        assert res.status_code == 200, res.text
+
+        res = client.delete("/v1/users/me", cookies={"sessionId": leaver})
+        assert res.status_code == 200, res.text
+
+        assert _comment_count(client, author, first) == 1
+        assert _comment_count(client, author, second) == 0
+
+
+def test_reconcile_repairs_drifted_comment_counts(signup):
+    with TestClient(app) as client:
+        _, author = signup(client, "rc_author")
+        post_id = _post(client, author, "drift")
+        _comment(client, author, post_id)
+
+        async def _drift():
+            async with db.get_db_session() as session:
+                await session.execute(update(Post).where(Post.id == post_id).values(comment_count=9))
+                await session.commit()
+
+        client.portal.call(_drift)
+        assert client.portal.call(reconcile_comment_counts.reconcile) >= 1
+        assert _comment_count(client, author, post_id) == 1
+
+
+def test_concurrent_deletes_decrement_once(signup):
+    with TestClient(app) as client:
+        _, author = signup(client, "cd_author")
+        post_id = _post(client, author, "race")
+        _comment(client, author, post_id)
+        removed = _comment(client, author, post_id)
+
+        async def _delete():
+            async with db.get_db_session() as session:
+                await db.delete_comment(session, removed["commentId"])
+                await session.commit()
+
+        async def _delete_twice():
+            await asyncio.gather(_delete(), _delete())
+
+        client.portal.call(_delete_twice)
+        assert _comment_count(client, author, post_id) == 1
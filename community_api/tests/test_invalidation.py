@@ -0,0 +1,46 @@
+import time
+
+from fastapi.testclient import TestClient
+from redis.asyncio.client import PubSub
+from redis.exceptions import ConnectionError
+
+import app.utils.invalidation as invalidation
+from app.main import app
+from app.utils.invalidation import bus
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_bus_resubscribes_after_losing_redis(monkeypatch):
+    monkeypatch.setattr(invalidation, "RECONNECT_MIN_DELAY", 0.01)
+    failures = {"left": 2}
+    get_message = PubSub.get_message
+
+    async def flaky_get_message(self, *args, **kwargs):
+        # Only the bus's subscription fails; the chat subscriber is left alone
+        on_bus = any(c in (invalidation.CHANNEL, invalidation.CHANNEL.encode()) for c in self.channels)
+        if on_bus and failures["left"]:
+            failures["left"] -= 1
+            raise ConnectionError("connection reset by peer")
+        return await get_message(self, *args, **kwargs)
+
+    monkeypatch.setattr(PubSub, "get_message", flaky_get_message)
+    seen = []
+    monkeypatch.setitem(bus._handlers, "probe", [seen.append])
+    reconnects = bus.reconnects
+
+    with TestClient(app) as client:
+        _wait_for(lambda: failures["left"] == 0)
+        # Published by "another pod": only the re-subscribed listener can apply it
+        deadline = time.monotonic() + 5
+        while "k1" not in seen:
+            assert time.monotonic() < deadline, "invalidation never arrived"
+            client.portal.call(bus.publish, [("probe", "k1")])
+            time.sleep(0.1)
+
+    assert bus.reconnects - reconnects == 2
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.storage.message_writer as message_writer_module
+from app.main import app
+from app.storage.message_writer import message_writer
+
+
+def _open_conversation(client, session_id, other_user_id):
+    res = client.post("/v1/chat/conversations", json={"other_user_id": other_user_id},
+                      cookies={"sessionId": session_id})
+    return res.json()["data"]["conversation_id"]
+
+
+def test_a_bad_row_only_fails_its_own_sender(monkeypatch, signup):
+    # A wide window so both messages land in one batch
+    monkeypatch.setattr(message_writer_module, "GROUP_COMMIT_WINDOW", 0.3)
+    with TestClient(app) as client:
+        alice, alice_sid = signup(client, "mw_alice")
+        bob, _ = signup(client, "mw_bob")
+        carol, carol_sid = signup(client, "mw_carol")
+        first = _open_conversation(client, alice_sid, bob)
+        second = _open_conversation(client, carol_sid, bob)
+
+        async def _send_both():
+            return await asyncio.gather(
+                message_writer.submit(first, alice, "innocent"),
+                message_writer.submit(second, carol, 12345),
+                return_exceptions=True,
+            )
+
+        good, bad = client.portal.call(_send_both)
+        assert good["content"] == "innocent"
+        assert isinstance(bad, TypeError)
+
+        res = client.get(f"/v1/chat/conversations/{first}/messages", cookies={"sessionId": alice_sid})
+        assert [m["content"] for m in res.json()["data"]] == ["innocent"]
+
+
+@pytest.mark.parametrize("name, frame, error", [
+    ("mf_int", {"content": 12345}, "Invalid content"),
+    ("mf_list", {"content": ["x"]}, "Invalid content"),
+    ("mf_str", {"conversation_id": "1", "content": "hi"}, "Invalid conversation_id"),
+    ("mf_bool", {"conversation_id": True, "content": "hi"}, "Invalid conversation_id"),
+])
+def test_malformed_frames_get_an_error_and_keep_the_socket(signup, name, frame, error):
+    with TestClient(app) as client:
+        alice, alice_sid = signup(client, name)
+        bob, _ = signup(client, f"{name}_b")
+        conversation_id = _open_conversation(client, alice_sid, bob)
+        with client.websocket_connect("/v1/chat/ws", cookies={"sessionId": alice_sid}) as ws:
+            time.sleep(0.2)
+            ws.send_json({"conversation_id": conversation_id, **frame})
+            assert ws.receive_json() == {"error": error}
+
+            ws.send_json({"conversation_id": conversation_id, "content": "fine", "client_msg_id": "ok"})
+            while ws.receive_json().get("client_msg_id") != "ok":
+                pass
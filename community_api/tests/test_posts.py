@@ -0,0 +1,43 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def test_feed_pages_follow_the_cursor_and_an_empty_page_has_none(signup):
+    with TestClient(app) as client:
+        _, sid = signup(client, "feed_user")
+        for i in range(3):
+            res = client.post("/v1/posts", json={"title": f"feed {i}", "content": "body"}, cookies={"sessionId": sid})
+            assert res.status_code == 201, res.text
+
+        res = client.get("/v1/posts", params={"limit": 0})
+        assert res.status_code == 200, res.text
+        assert res.json()["data"] == {"items": [], "nextCursor": None}
+
+        first = client.get("/v1/posts", params={"limit": 2}).json()["data"]
+        assert len(first["items"]) == 2 and first["nextCursor"]
+        rest = client.get("/v1/posts", params={"limit": 2, "cursor": first["nextCursor"]}).json()["data"]
+        seen = {p["postId"] for p in first["items"]} & {p["postId"] for p in rest["items"]}
+        assert not seen
+
+
+def test_comment_pages_follow_the_cursor_oldest_first(signup):
+    with TestClient(app) as client:
+        _, sid = signup(client, "cpage_user")
+        res = client.post("/v1/posts", json={"title": "comments", "content": "body"}, cookies={"sessionId": sid})
+        post_id = res.json()["data"]["postId"]
+        created = []
+        for i in range(5):
+            res = client.post(f"/v1/posts/{post_id}/comments", json={"content": f"c{i}"}, cookies={"sessionId": sid})
+            assert res.status_code == 201, res.text
+            created.append(res.json()["data"]["commentId"])
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = client.get(f"/v1/posts/{post_id}/comments", params=params).json()["data"]
+            seen += [c["commentId"] for c in page["items"]]
+            cursor = page["nextCursor"]
+            if not cursor:
+                break
+        assert seen == created
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from fastapi.testclient import TestClient
+
+from app.jobs import sweep_sessions
+from app.main import app
+from app.models.orm import Session as DBSession
+from app.storage import db
+from app.storage.db import now_kst
+from app.storage.sessions import SESSION_TTL
+
+
+async def _add_legacy_session(session_id: str, user_id: int):
+    # A row from before expires_at existed, created well over a TTL ago
+    async with db.get_db_session() as session:
+        session.add(DBSession(session_id=session_id, user_id=user_id,
+                              created_at=now_kst() - timedelta(seconds=SESSION_TTL * 4), expires_at=None))
+        await session.commit()
+
+
+async def _take(session_id: str):
+    async with db.get_db_session() as session:
+        user_id = await db.take_session_user_id(session, session_id)
+        await session.commit()
+        return user_id
+
+
+async def _expires_at(session_id: str):
+    async with db.get_db_session() as session:
+        row = await session.get(DBSession, session_id)
+        return row and row.expires_at
+
+
+def test_legacy_sessions_without_expiry_stay_logged_in(signup):
+    with TestClient(app) as client:
+        user_id, _ = signup(client, "legacy")
+        client.portal.call(_add_legacy_session, "legacy-moved", user_id)
+        client.portal.call(_add_legacy_session, "legacy-swept", user_id)
+
+        # Moving to another backend keeps the session
+        assert client.portal.call(_take, "legacy-moved") == user_id
+
+        # The sweeper gives it a full TTL instead of deleting it
+        client.portal.call(sweep_sessions.sweep)
+        expires_at = client.portal.call(_expires_at, "legacy-swept")
+        assert expires_at is not None
+        assert expires_at > now_kst() + timedelta(seconds=SESSION_TTL / 2)
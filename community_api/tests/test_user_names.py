@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+
+from app.controllers import users_controller
+from app.main import app
+from app.models.orm import User
+from app.storage import db
+from tests.conftest import PASSWORD
+
+
+async def _insert_user_behind_the_filters(email: str, nickname: str):
+    # As if created on another pod whose invalidation never arrived
+    async with db.get_db_session() as session:
+        session.add(User(email=email, password_hash="x", nickname=nickname))
+        await session.commit()
+
+
+def test_signup_and_rename_conflict_with_a_stale_filter(monkeypatch, signup):
+    with TestClient(app) as client:
+        _, sid = signup(client, "un_first")
+        client.portal.call(_insert_user_behind_the_filters, "un_taken@example.com", "un_taken")
+
+        res = client.post("/v1/auth/signup", json={
+            "email": "un_taken@example.com", "password": PASSWORD, "passwordConfirm": PASSWORD, "nickname": "un_other",
+        })
+        assert res.status_code == 409
+        assert res.json()["code"] == "EMAIL_ALREADY_EXISTS"
+
+        res = client.patch("/v1/users/me", json={"nickname": "un_taken"}, cookies={"sessionId": sid})
+        assert res.status_code == 409
+        assert res.json()["code"] == "NICKNAME_ALREADY_EXISTS"
+
+        # Taken between the check and the write: the unique index still answers 409
+        async def not_found(session, nickname):
+            return None
+
+        monkeypatch.setattr(users_controller.db, "get_user_by_nickname", not_found)
+        res = client.patch("/v1/users/me", json={"nickname": "un_taken"}, cookies={"sessionId": sid})
+        assert res.status_code == 409
+        assert res.json()["code"] == "NICKNAME_ALREADY_EXISTS"
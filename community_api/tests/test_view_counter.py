@@ -0,0 +1,51 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models.orm import Post
+from app.storage import db
+from app.storage.view_counter import FLUSHING_KEY, FLUSHING_PREFIX, HITS_ORPHAN_AGE, view_counter
+from app.utils.redis_client import get_redis
+
+
+async def _hits(post_id: int) -> int:
+    async with db.get_db_session() as session:
+        return (await session.get(Post, post_id)).hits
+
+
+def test_flush_recovers_deltas_left_by_a_dead_pod(signup):
+    with TestClient(app) as client:
+        _, sid = signup(client, "vc_author")
+        res = client.post("/v1/posts", json={"title": "views", "content": "body"}, cookies={"sessionId": sid})
+        assert res.status_code == 201, res.text
+        post_id = res.json()["data"]["postId"]
+        before = client.portal.call(_hits, post_id)
+
+        # A pod renamed the pending hash, then died before committing it
+        orphan = f"{FLUSHING_PREFIX}dead-pod"
+        # Another pod is flushing right now: its key must be left alone
+        in_flight = f"{FLUSHING_PREFIX}live-pod"
+        # A pod died between registering its key and the RENAME
+        never_renamed = f"{FLUSHING_PREFIX}no-rename"
+
+        async def _leave_keys():
+            redis = get_redis()
+            await redis.hset(orphan, post_id, 5)
+            await redis.hset(in_flight, post_id, 7)
+            await redis.zadd(FLUSHING_KEY, {
+                orphan: time.time() - HITS_ORPHAN_AGE - 1,
+                never_renamed: time.time() - HITS_ORPHAN_AGE - 1,
+                in_flight: time.time(),
+            })
+
+        client.portal.call(_leave_keys)
+        client.portal.call(view_counter.flush)
+
+        assert client.portal.call(_hits, post_id) == before + 5
+        assert client.portal.call(get_redis().exists, orphan) == 0
+        assert client.portal.call(get_redis().exists, in_flight) == 1
+        # Only the live pod's key is still tracked
+        assert client.portal.call(get_redis().zrange, FLUSHING_KEY, 0, -1) == [in_flight]
+        client.portal.call(get_redis().delete, in_flight)
+        client.portal.call(get_redis().zrem, FLUSHING_KEY, in_flight)